@@ -5,29 +5,57 @@ implementing different code functionalities.
 The engine components include ChatGPTEngine and DummyEngine, which are
 used for providing chatbot engine functionalities.
 The module exports the following components: code, engineFortranCode,
-PyCode, ChatGPTEngine, DummyEngine.
+PyCode, ChatGPTEngine, DummyEngine. The classes are imported when they
+are first accessed.
 """
-from autodog.app import (
+from importlib import import_module
+
+# The packages `autodog.code` and `autodog.engine` are imported before the
+# functions of the same names are bound, so importing one of their modules
+# later does not replace the functions with the packages.
+import autodog.code
+import autodog.engine
+from autodog.core import (
     code,
+    code_from_string,
     engine,
     doc_model
 )
-from autodog.code.python import PyCode
-from autodog.code.fortran import FortranCode
-from autodog.engine.chatgpt import ChatGPTEngine
-from autodog.engine.dummy import DummyEngine
-from autodog.docmodel.docstring import Docstring
-from autodog.docmodel.google import GoogleStyleDocstring
-from autodog.docmodel.javadoc import Javadoc
-from autodog.docmodel.numpy import NumpyStyleDocstring
-from autodog.docmodel.restructuredtext import ReStructuredText
 from autodog.utils.progress import (
     progress_bar,
     progress_bar_nothing
 )
 
+# The classes are imported on first access, so that importing the package
+# does not load every backend and the `openai` package.
+_LAZY_CLASSES = {
+    "PyCode": "autodog.code.python",
+    "FortranCode": "autodog.code.fortran",
+    "ChatGPTEngine": "autodog.engine.chatgpt",
+    "DummyEngine": "autodog.engine.dummy",
+    "Docstring": "autodog.docmodel.docstring",
+    "GoogleStyleDocstring": "autodog.docmodel.google",
+    "Javadoc": "autodog.docmodel.javadoc",
+    "NumpyStyleDocstring": "autodog.docmodel.numpy",
+    "ReStructuredText": "autodog.docmodel.restructuredtext",
+}
+
+
+def __getattr__(name:str):
+    module = _LAZY_CLASSES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY_CLASSES))
+
 __all__ = [
     "code",
+    "code_from_string",
     "engine",
     "doc_model",
     "PyCode",
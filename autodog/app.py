@@ -4,7 +4,11 @@ generates documentation for a specific segment of code.
 
 Args:
 ----
-    path (str): The path to the code segment to be documented.
+    path (str): The path to the code segment to be documented. '-'
+        reads the code from the standard input and writes the documented
+        code to the standard output.
+    --lang (str, optional): The language of the code read from the
+        standard input, 'python' or 'fortran'. Required with '-'.
     -e, --engine (str, optional): The documentation generation engine
     name.
         Defaults to 'chatgpt'.
@@ -16,6 +20,74 @@ Args:
         False.
     -o, --overwrite (bool, optional): Flag to overwrite existing
         documentation. Defaults to False.
+    --journal (str, optional): The file every generated documentation is
+        journaled to. Defaults to '.autodog-journal.jsonl' with --resume,
+        and to a journal in memory otherwise.
+    --resume (bool, optional): Flag to apply the journaled documentation
+        of an interrupted run and request only the rest. Defaults to
+        False.
+    --new-journal (bool, optional): Flag to discard the entries of an
+        existing journal. Otherwise, the run appends to it. Defaults to
+        False.
+    --out-dir (str, optional): The directory the documented code is
+        written to, mirroring the input tree. Unmodified files are
+        hardlinked. Defaults to None, which overwrites the input files.
+    --trim-lines (int, optional): The number of lines above which a
+        Fortran module, program or procedure is trimmed to its statement,
+        declarations and a summary of its body in the prompt. Defaults to
+        None, which sends the whole code.
+    --rate-limit (float, optional): The minimum interval in seconds
+        between two requests, shared by all the jobs. Defaults to 20.
+    --rpm (float, optional): The budget of requests per minute, shared
+        by all the jobs. Defaults to 0, which disables it.
+    --tpm (float, optional): The budget of estimated tokens per minute,
+        shared by all the jobs. Defaults to 0, which disables it.
+    --schedule (str, optional): The order the requests of all the files
+        are sent in: 'fifo', 'largest' prompts first or 'public' API
+        first. Defaults to 'fifo'.
+    -j, --jobs (int, optional): The number of requests sent
+        concurrently. Defaults to a number derived from the CPU count and
+        the rate limit.
+    --max-trees (int, optional): The number of files parsed and held in
+        memory at once. Defaults to the number of jobs.
+    --exclude (str, optional): A gitignore-style pattern of the paths
+        to be skipped in the recursive mode. It can be given several
+        times.
+    --no-ignore (bool, optional): Flag to walk the paths in .gitignore
+        files, version control directories, build directories and
+        virtual environments too. Defaults to False.
+    --since (str, optional): The git ref the changes are compared
+        with. Only the files and the nodes changed since it are
+        documented, and a node whose code changed is documented
+        again unless its documentation changed too. Defaults to None,
+        which documents everything.
+    --watch (bool, optional): Flag to keep running and document the
+        files as they are modified. Defaults to False.
+    --report (str, optional): The file a machine-readable report of the
+        run is written to, with the timings, requests, tokens, journal
+        hits, retries and status of every file and its slowest nodes. A
+        path ending with '.ndjson' or '.jsonl' is streamed as JSON Lines
+        while running. Defaults to None.
+    --export-batch (str, optional): The JSON Lines file the planned
+        requests are written to for an offline batch job, instead of
+        being sent. Defaults to None.
+    --ingest-batch (str, optional): The JSON Lines file of the responses
+        of a batch job, whose documentation is inserted and written
+        instead of sending requests. Defaults to None.
+    --shard (str, optional): The shard 'i/N' of the run, from 1/N to
+        N/N, documented by this process. Defaults to None, which documents
+        everything.
+    --shard-by (str, optional): The work partitioned into shards: 'file'
+        by the hash of the relative file path, or 'node' by the hash of
+        the node id. Defaults to 'file'.
+    --debounce (float, optional): The time in seconds a modification
+        has to be stable before it is documented in the watch mode.
+        Defaults to 1.0.
+
+`autodog serve` runs a documentation server answering JSON-RPC requests
+on the standard input and output, or on the Unix socket given by
+`--socket` (see `autodog.server`). `autodog merge journal|report OUT
+IN...` combines the journals or the reports of the shards of a run.
 
 Returns:
 -------
@@ -23,21 +95,64 @@ Returns:
 
 """
 import argparse
-import glob
-from time import sleep
+import contextvars
+import json
+import os
+import sys
+import threading
+from contextlib import contextmanager, redirect_stdout
+from functools import partial
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from math import ceil
+from time import perf_counter, sleep
 
-import openai
+from autodog.batch import batch_id, export_file, ingest_file, read_responses
+from autodog.core import LANGUAGES, code, code_from_string, engine, doc_model, is_fortran
+from autodog.engine.journal import JournalEngine
+from autodog.engine.scheduler import SCHEDULE_POLICIES, Scheduler
+from autodog.utils.discover import DEFAULT_EXCLUDES, filter_files, iter_files
+from autodog.utils.fileio import link_or_copy, mirror_path
+from autodog.utils.gitdiff import changed_lines
+from autodog.utils.journal import Journal, merge_journals
+from autodog.utils.profiling import PROFILE, ThreadProfiler
+from autodog.utils.progress import ProgressReporter, progress_bar, progress_bar_nothing
+from autodog.utils.report import FileReport, Report, merge_reports
+from autodog.utils.shard import file_key, in_shard, parse_shard
+from autodog.utils.tracing import TRACE_FORMATS, TRACER, span
+from autodog.utils.usegraph import order_by_use, use_dependencies
+from autodog.utils.watch import PollingWatcher, changed_ranges
 
-from autodog.core import code, engine, doc_model
-from autodog.utils.progress import progress_bar
+# The file extensions `--extension` selects from.
+EXTENSIONS = ("py", "f90", "F90", "f", "f03")
+# The journal file of `--resume` if `--journal` is not given.
+DEFAULT_JOURNAL = ".autodog-journal.jsonl"
+# The typical time a documentation request takes, in seconds.
+_TYPICAL_LATENCY = 10.0
+# The interval in seconds between two polls of the watch mode.
+_WATCH_INTERVAL = 0.5
 
 
-def _insert_doc(code, engine, doc_model, overwrite, n_tries, interval=20):
+def _insert_doc(
+    code, engine, doc_model, overwrite, n_tries, interval=20, progress_bar=progress_bar,
+    lines=None, scheduler=None, file_report=None, nodes=None,
+) -> bool:
+    service_unavailable_error, api_error = _openai_errors()
     for n in range(n_tries):
+        if n > 0 and file_report is not None:
+            file_report.retries += 1
         try:
-            code.insert_docs(engine, doc_model, overwrite=overwrite, progress_bar=progress_bar)
-            return
-        except openai.error.ServiceUnavailableError as e:
+            with span("attempt", n=n + 1, retry=n > 0):
+                if scheduler is None:
+                    code.insert_docs(
+                        engine, doc_model, overwrite=overwrite, progress_bar=progress_bar,
+                        lines=lines,
+                    )
+                else:
+                    _schedule_docs(
+                        code, engine, scheduler, doc_model, overwrite, progress_bar, lines, nodes,
+                    )
+            return True
+        except service_unavailable_error as e:
             print()
             print(
                 f"[{n+1}/{n_tries} try]: An exception was thrown from `insert_docs` due to the following:",
@@ -46,17 +161,220 @@ def _insert_doc(code, engine, doc_model, overwrite, n_tries, interval=20):
             print("Continue.")
             sleep(interval)
             continue
-        except openai.error.APIError as e:
+        except api_error as e:
             print()
             print(
-                f"[{n}/{n_tries} try]: An exception was thrown from `insert_docs` due to the following:",
+                f"[{n+1}/{n_tries} try]: An exception was thrown from `insert_docs` due to the following:",
             )
             print(f"API Error: {e}")
             print("Continue.")
             sleep(interval)
             continue
     print("Give up!")
-    return
+    return False
+
+
+def _extensions(value:str) -> list[str]:
+    """Parses a comma-separated list of file extensions. A single value per
+    option keeps the extensions apart from the positional path.
+    """
+    extensions = [extension.strip().lstrip(".") for extension in value.split(",") if extension.strip()]
+    unknown = [extension for extension in extensions if extension not in EXTENSIONS]
+    if not extensions or unknown:
+        raise argparse.ArgumentTypeError(
+            f"invalid choice: {value!r} (choose from {', '.join(EXTENSIONS)})"
+        )
+    return extensions
+
+
+class _NeverRaised(Exception):
+    """Stands for the errors of a package that was not imported."""
+
+
+def _openai_errors() -> tuple:
+    # openai is imported by ChatGPTEngine only, so if it was not imported,
+    # none of its errors can be raised, and it is not imported for nothing.
+    openai = sys.modules.get("openai")
+    if openai is None:
+        return _NeverRaised, _NeverRaised
+    return openai.error.ServiceUnavailableError, openai.error.APIError
+
+
+def _schedule_docs(
+    code, engine, scheduler, doc_model, overwrite, progress_bar, lines, nodes=None,
+) -> None:
+    """Submits the requests of a file to the scheduler a stage at a time
+    and inserts the documents in the order of the file as they arrive. The
+    journaled documents are inserted without being scheduled. The prompts
+    are prepared before the requests are submitted, and the responses are
+    post-processed as the documents are inserted, so the workers only send
+    the requests. If a request fails, the requests of the file that are
+    still queued are cancelled. If `nodes` is given, the requests of the
+    other nodes are skipped. The file has a single progress bar, whose
+    total is known when all its nodes are documented. The documentation of
+    a node is traced from its lookup in the journal to its insertion.
+    """
+    ids = code.node_ids() if TRACER.enabled else {}
+
+    def documents():
+        for requests in code.plan_stages(doc_model, overwrite=overwrite, lines=lines):
+            if nodes is not None:
+                requests = [request for request in requests if request.node in nodes]
+            futures = []
+            for request in requests:
+                request.span = span(
+                    "node", node=ids.get(request.node), kind=request.statement_kind,
+                )
+                doc = engine.lookup(request)
+                if doc is None:
+                    request.prepare(engine)
+                    futures.append(scheduler.submit(request, engine, code.filepath))
+                else:
+                    request.span.set(journaled=True)
+                    futures.append(Future())
+                    futures[-1].set_result(doc)
+            try:
+                for request, future in zip(requests, futures):
+                    doc = future.result()
+                    # Only the scheduled requests have a prompt.
+                    if request.prompt is not None:
+                        doc = engine.postprocess(doc, request.lang)
+                    code.apply_doc(request, doc)
+                    request.span.end()
+                    yield request
+            finally:
+                for request, future in zip(requests, futures):
+                    future.cancel()
+                    request.span.end(cancelled=True)
+
+    total = code.count_documentable(overwrite) if lines is None and nodes is None else None
+    for _ in progress_bar(documents(), total=total):
+        pass
+    if is_fortran(code.filepath):
+        code.register_modules()
+
+
+def _out_path(filepath, root, out_dir):
+    if out_dir is None:
+        return None
+    return mirror_path(filepath, root, out_dir)
+
+
+def _default_jobs(rate_limit:float) -> int:
+    # Enough files to keep the quota busy while a request is in flight, plus
+    # one parsing or writing, bounded as ThreadPoolExecutor bounds its
+    # default number of I/O-bound workers.
+    max_jobs = min(32, (os.cpu_count() or 1) + 4)
+    if rate_limit <= 0:
+        return max_jobs
+    return max(1, min(max_jobs, ceil(_TYPICAL_LATENCY / rate_limit) + 1))
+
+
+def _document_file(
+    filepath, engine, doc_model, journal, args, root, module_context=None,
+    progress_bar=progress_bar, lines=None, scheduler=None, report=None,
+) -> None:
+    file_report = FileReport(filepath)
+    journal_engine = JournalEngine(engine, journal, filepath)
+    progress_bar = partial(progress_bar, desc=file_key(filepath, root), source=journal_engine)
+    file_span = span("file", path=file_key(filepath, root))
+    try:
+        with file_span:
+            if journal.is_done(filepath):
+                print(f"Skip documented {filepath}")
+                file_report.status = "skipped"
+                if module_context is not None:
+                    code(filepath, module_context=module_context).register_modules()
+                return
+            print(f"Insert documentation to {filepath}")
+            start = perf_counter()
+            with span("parse"):
+                c = code(filepath, trim_threshold=args.trim_lines, module_context=module_context)
+            file_report.parse_time = perf_counter() - start
+            nodes = _shard_nodes(c, args, root)
+            file_report.n_nodes = c.count_documentable() if nodes is None else len(nodes)
+            completed = _insert_doc(
+                c, journal_engine, doc_model, args.overwrite, args.tries,
+                progress_bar=progress_bar, lines=lines, scheduler=scheduler,
+                file_report=file_report, nodes=nodes,
+            )
+            start = perf_counter()
+            out_path = _out_path(filepath, root, args.out_dir)
+            with span("write"):
+                if out_path is not None and not c.modified:
+                    link_or_copy(filepath, out_path)
+                else:
+                    c.write(out_path)
+            file_report.write_time = perf_counter() - start
+            if not completed:
+                file_report.status = "failed"
+            elif nodes is None:
+                # A file documented in part by other shards is not marked
+                # done, though its shard of the nodes is.
+                journal.mark_done(filepath)
+    except Exception as e:
+        file_report.status = "error"
+        file_report.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        file_span.set(
+            status=file_report.status,
+            requests=journal_engine.n_requests,
+            hits=journal_engine.n_hits,
+        )
+        if report is not None:
+            _add_report(report, file_report, journal_engine)
+
+
+def _add_report(report, file_report, journal_engine) -> None:
+    file_report.n_requests = journal_engine.n_requests
+    file_report.n_hits = journal_engine.n_hits
+    file_report.estimated_tokens = journal_engine.n_tokens
+    file_report.add_timings(journal_engine.timings)
+    report.add(file_report)
+
+
+def _add_engine_arguments(parser) -> None:
+    """Adds the options of the engine, the documentation model and the
+    prompts, shared by the documentation and the server modes.
+    """
+    parser.add_argument("-k", "--key", help="API key.", default="")
+    parser.add_argument(
+        "--engine",
+        help="Documentation generation engin name.",
+        default="chatgpt",
+        choices=["chatgpt", "dummy"],
+    )
+    parser.add_argument(
+        "-ll", "--line-length", help="Maximum line length.", default=72, type=int,
+    )
+    parser.add_argument(
+        "--model", help="ChatGPT model name.", default="gpt-3.5-turbo-0613",
+    )
+    parser.add_argument(
+        "--doc-type",
+        help="Documentation type.",
+        default="google style docstring",
+        choices=[
+            "docstring",
+            "google style docstring",
+            "numpy style docstring",
+            "reStructuredText",
+            "javadoc"
+        ]
+    )
+    parser.add_argument(
+        "--trim-lines",
+        help="Trim Fortran modules, programs and procedures longer than this number of lines to their statement, declarations and a body summary in the prompt.",
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--rate-limit",
+        help="Minimum interval in seconds between two requests, shared by all the jobs.",
+        default=20.0,
+        type=float,
+    )
 
 
 def app():
@@ -66,7 +384,11 @@ def app():
 
     Args:
     ----
-        path (str): The path to the code segment to be documented.
+        path (str): The path to the code segment to be documented. '-'
+        reads the code from the standard input and writes the documented
+        code to the standard output.
+        --lang (str, optional): The language of the code read from the
+        standard input, 'python' or 'fortran'. Required with '-'.
         -e, --engine (str, optional): The documentation generation engine
         name.
         Defaults to 'chatgpt'.
@@ -77,19 +399,109 @@ def app():
         documentation in the entire directory structure. Defaults to False.
         -o, --overwrite (bool, optional): Flag to overwrite existing
         documentation. Defaults to False.
+        --journal (str, optional): The file every generated documentation
+        is journaled to. Defaults to '.autodog-journal.jsonl' with
+        --resume, and to a journal in memory otherwise.
+        --resume (bool, optional): Flag to apply the journaled
+        documentation of an interrupted run and request only the rest.
+        Defaults to False.
+        --new-journal (bool, optional): Flag to discard the entries of an
+        existing journal. Otherwise, the run appends to it. Defaults to
+        False.
+        --out-dir (str, optional): The directory the documented code is
+        written to, mirroring the input tree. Unmodified files are
+        hardlinked. Defaults to None, which overwrites the input files.
+        --trim-lines (int, optional): The number of lines above which a
+        Fortran module, program or procedure is trimmed to its statement,
+        declarations and a summary of its body in the prompt. Defaults to
+        None, which sends the whole code.
+        --rate-limit (float, optional): The minimum interval in seconds
+        between two requests, shared by all the jobs. Defaults to 20.
+        --rpm (float, optional): The budget of requests per minute, shared
+        by all the jobs. Defaults to 0, which disables it.
+        --tpm (float, optional): The budget of estimated tokens per minute,
+        shared by all the jobs. Defaults to 0, which disables it.
+        --schedule (str, optional): The order the requests of all the
+        files are sent in: 'fifo', 'largest' prompts first or 'public' API
+        first. Defaults to 'fifo'.
+        -j, --jobs (int, optional): The number of requests sent
+        concurrently. Defaults to a number derived from the CPU count and
+        the rate limit.
+        --max-trees (int, optional): The number of files parsed and held
+        in memory at once. Defaults to the number of jobs.
+        --exclude (str, optional): A gitignore-style pattern of the paths
+        to be skipped in the recursive mode. It can be given several
+        times.
+        --no-ignore (bool, optional): Flag to walk the paths in .gitignore
+        files, version control directories, build directories and virtual
+        environments too. Defaults to False.
+        --since (str, optional): The git ref the changes are compared
+        with. Only the files and the nodes changed since it are
+        documented, and a node whose code changed is documented
+        again unless its documentation changed too. Defaults to None,
+        which documents everything.
+        --watch (bool, optional): Flag to keep running and document the
+        files as they are modified. Defaults to False.
+        --report (str, optional): The file a machine-readable report of
+        the run is written to, with the timings, requests, tokens, journal
+        hits, retries and status of every file and its slowest nodes. A
+        path ending with '.ndjson' or '.jsonl' is streamed as JSON Lines
+        while running. Defaults to None.
+        --export-batch (str, optional): The JSON Lines file the planned
+        requests are written to for an offline batch job, instead of being
+        sent. Defaults to None.
+        --ingest-batch (str, optional): The JSON Lines file of the
+        responses of a batch job, whose documentation is inserted and
+        written instead of sending requests. Defaults to None.
+        --shard (str, optional): The shard 'i/N' of the run, from 1/N to
+        N/N, documented by this process. Defaults to None, which documents
+        everything.
+        --shard-by (str, optional): The work partitioned into shards:
+        'file' by the hash of the relative file path, or 'node' by the hash
+        of the node id. Defaults to 'file'.
+        --debounce (float, optional): The time in seconds a modification
+        has to be stable before it is documented in the watch mode.
+        Defaults to 1.0.
+        --profile (bool, optional): Flag to print the total time and the
+        count of every phase of the run (see `autodog.utils.profiling`) to
+        the standard error at the end. Defaults to False.
+        --cprofile (str, optional): The file the cProfile statistics of
+        all the threads of the run are written to. Defaults to None.
+        --tracemalloc (str, optional): The file a tracemalloc snapshot of
+        the end of the run is written to. Defaults to None.
+        --trace (str, optional): The file the trace spans of the run, its
+        files, nodes, requests, retries and writes, are written to (see
+        `autodog.utils.tracing`). Defaults to None.
+        --trace-format (str, optional): The format of the trace, 'chrome'
+        or 'otlp'. Defaults to 'chrome'.
+
+    `autodog serve` runs a documentation server instead (see `_serve`),
+    and `autodog merge` combines the outputs of shards (see `_merge`).
 
     Returns:
     -------
         None.
     """
+    if sys.argv[1:2] == ["serve"]:
+        _serve(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["merge"]:
+        _merge(sys.argv[2:])
+        return
     parser = argparse.ArgumentParser(
         prog="AutoDog",
         description="An automatic documentation generator to document a specific segment of code",
     )
     parser.add_argument(
-        "path", help="Code filepath you want to write a documentation automatically.",
+        "path", help="Code filepath you want to write a documentation automatically. '-' reads the code from the standard input and writes the documented code to the standard output.",
     )
-    parser.add_argument("-k", "--key", help="API key.", default="")
+    parser.add_argument(
+        "--lang",
+        help="Language of the code read from the standard input.",
+        default=None,
+        choices=LANGUAGES,
+    )
+    _add_engine_arguments(parser)
     parser.add_argument(
         "-r",
         "--recursively",
@@ -99,15 +511,21 @@ def app():
     parser.add_argument(
         "-e",
         "--extension",
-        help="File extension you want to select.",
-        default="py",
-        choices=["py", "f90", "f"],
+        help=f"File extensions you want to select, e.g. 'f90' or 'py,f90', among {', '.join(EXTENSIONS)}. It can be given several times. Defaults to py.",
+        action="extend",
+        default=None,
+        type=_extensions,
     )
     parser.add_argument(
-        "--engine",
-        help="Documentation generation engin name.",
-        default="chatgpt",
-        choices=["chatgpt", "dummy"],
+        "--exclude",
+        help="Gitignore-style pattern of the paths to be skipped in the recursive mode. It can be given several times.",
+        action="append",
+        default=[],
+    )
+    parser.add_argument(
+        "--no-ignore",
+        help="Do not skip the paths in .gitignore files, version control directories, build directories and virtual environments.",
+        action="store_true",
     )
     parser.add_argument(
         "--overwrite", help="Overwrite documentation.", action="store_true",
@@ -116,47 +534,620 @@ def app():
         "--tries", help="Number of reconnections on server errors.", default=3, type=int,
     )
     parser.add_argument(
-        "-ll", "--line-length", help="Maximum line length.", default=72, type=int,
+        "--journal",
+        help=f"File every generated documentation is journaled to as soon as it is received. Defaults to {DEFAULT_JOURNAL} with --resume, and to none otherwise.",
+        default=None,
     )
     parser.add_argument(
-        "--model", help="ChatGPT model name.", default="gpt-3.5-turbo-0613",
+        "--resume",
+        help="Apply the journaled documentation of an interrupted run and request only the rest.",
+        action="store_true",
     )
     parser.add_argument(
-        "--doc-type",
-        help="Documentation type.",
-        default="google style docstring",
-        choices=[
-            "docstring",
-            "google style docstring",
-            "numpy style docstring",
-            "reStructuredText",
-            "javadoc"
-        ]
+        "--new-journal",
+        help="Discard the entries of an existing journal instead of appending to it.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--out-dir",
+        help="Write the documented code to a mirrored tree in this directory instead of overwriting it. Unmodified files are hardlinked.",
+        default=None,
+    )
+    parser.add_argument(
+        "--rpm",
+        help="Budget of requests per minute shared by all the jobs. 0 disables it.",
+        default=0.0,
+        type=float,
+    )
+    parser.add_argument(
+        "--tpm",
+        help="Budget of estimated tokens per minute shared by all the jobs. 0 disables it.",
+        default=0.0,
+        type=float,
+    )
+    parser.add_argument(
+        "--schedule",
+        help="Order of the requests of all the files: fifo, largest prompts first or public API first.",
+        default="fifo",
+        choices=SCHEDULE_POLICIES,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of requests sent concurrently. Defaults to a number derived from the CPU count and the rate limit.",
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--max-trees",
+        help="Number of files parsed and held in memory at once. Defaults to the number of jobs.",
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--watch",
+        help="Keep running and document the files as they are modified.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--debounce",
+        help="Time in seconds a modification has to be stable before it is documented in the watch mode.",
+        default=1.0,
+        type=float,
+    )
+    parser.add_argument(
+        "--report",
+        help="Write a JSON report with per-file and per-node timings to this file. A path ending with .ndjson or .jsonl is streamed as JSON Lines while running.",
+        default=None,
+    )
+    batch = parser.add_mutually_exclusive_group()
+    batch.add_argument(
+        "--export-batch",
+        help="Write the planned requests to this JSON Lines file for an offline batch job instead of sending them.",
+        default=None,
+    )
+    batch.add_argument(
+        "--ingest-batch",
+        help="Insert the documentation of the responses of a batch job in this JSON Lines file and write the files.",
+        default=None,
+    )
+    parser.add_argument(
+        "--shard",
+        help="Document only the shard i/N of the work, from 1/N to N/N, e.g. on one of N CI runners.",
+        default=None,
+        type=parse_shard,
+    )
+    parser.add_argument(
+        "--shard-by",
+        help="Partition the work by the hash of the relative file path or of the node id.",
+        default="file",
+        choices=["file", "node"],
+    )
+    parser.add_argument(
+        "--since",
+        help="Document only the nodes changed since this git ref, e.g. origin/main. A node whose code changed is documented again unless its documentation changed too.",
+        default=None,
+    )
+    parser.add_argument(
+        "--profile",
+        help="Print the time spent in every phase of the run, e.g. parsing, network and writing, at the end.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cprofile",
+        help="Profile the run with cProfile in all the threads and write the statistics to this file, readable with python -m pstats.",
+        default=None,
+    )
+    parser.add_argument(
+        "--trace",
+        help="Write trace spans of every file, node, request, retry and write to this file, viewable in a trace viewer.",
+        default=None,
+    )
+    parser.add_argument(
+        "--trace-format",
+        help="Format of the trace: chrome for the Chrome trace format, e.g. for ui.perfetto.dev, or otlp for OTLP-JSON.",
+        default="chrome",
+        choices=TRACE_FORMATS,
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        help="Trace the memory allocations of the run and write a snapshot to this file, readable with tracemalloc.Snapshot.load.",
+        default=None,
     )
     args = parser.parse_args()
+    if args.extension is None:
+        args.extension = ["py"]
+    if args.path == "-" and args.lang is None:
+        parser.error("--lang is required to read the code from the standard input")
+    if args.shard is not None and args.shard_by == "node" and (
+        args.watch or args.export_batch is not None or args.ingest_batch is not None
+    ):
+        parser.error("--shard-by node cannot be used with --watch or the batch modes")
 
+    # A single engine, and so a single rate limiter, is shared by all the
+    # files.
     e = engine(
         name=args.engine,
         api_key=args.key,
         line_length=args.line_length,
-        model=args.model
+        model=args.model,
+        rate_limit=args.rate_limit
     )
     m = doc_model(
         model_name=args.doc_type
     )
+    with _profiled(args):
+        if args.path == "-":
+            sys.exit(_filter(args, e, m))
+
+        # A journal file is used only if it is asked for, since a run that
+        # does not resume never reads it. The batch modes add to the
+        # journal of the previous runs. An existing journal is kept unless
+        # it is discarded explicitly, so a run restarted without `--resume`
+        # does not lose its checkpoint.
+        batch = args.export_batch is not None or args.ingest_batch is not None
+        journal_path = args.journal
+        if journal_path is None and args.resume:
+            journal_path = DEFAULT_JOURNAL
+        journal = Journal(journal_path, resume=args.resume or batch, truncate=args.new_journal)
 
-    if args.recursively:
-        for dir in glob.glob(f"{args.path}/**/", recursive=True):
-            for file in glob.glob(f"{dir}/*.{args.extension}"):
-                c = code(file)
-                print("Insert documentation to", file)
-                _insert_doc(c, e, m, args.overwrite, args.tries)
-                c.write()
+        root = _root(args)
+        changes = None
+        if args.since is not None:
+            # Only the changed files are considered, so the run scales with the
+            # size of the change rather than the size of the tree.
+            changes = changed_lines(args.since, cwd=args.path if args.recursively else root or None)
+        report = None if args.report is None else Report(args.report)
+        try:
+            if args.export_batch is not None:
+                _export_batch(_select_files(args, changes), e, m, journal, args, root, changes)
+            elif args.ingest_batch is not None:
+                _ingest_batch(_select_files(args, changes), e, m, journal, args, root, changes)
+            elif args.watch:
+                # The polls reuse the listings of the unmodified directories.
+                listings = {}
+                _watch(lambda: _select_files(args, listings=listings), e, m, journal, args, root, report)
+            else:
+                jobs = args.jobs or _default_jobs(args.rate_limit)
+                _document_files(
+                    _select_files(args, changes), jobs, e, m, journal, args, root, changes, report,
+                )
+        finally:
+            if report is not None:
+                report.close()
+            journal.close()
+
+
+@contextmanager
+def _profiled(args):
+    """Profiles the block as requested by `--profile`, `--cprofile` and
+    `--tracemalloc`, and traces it in a 'run' span if `--trace` is given.
+    The results are reported to the standard error, which is free in the
+    filter mode, once it ends.
+    """
+    import tracemalloc
+
+    profiler = None
+    if args.profile:
+        PROFILE.enable()
+    if args.tracemalloc is not None:
+        tracemalloc.start()
+    if args.cprofile is not None:
+        profiler = ThreadProfiler()
+        profiler.enable()
+    if args.trace is not None:
+        TRACER.enable()
+    try:
+        with span("run", argv=" ".join(sys.argv[1:])):
+            yield
+    finally:
+        if args.trace is not None:
+            TRACER.disable()
+            n_spans = TRACER.export(args.trace, args.trace_format)
+            print(f"Wrote {n_spans} trace spans to {args.trace}", file=sys.stderr)
+        if profiler is not None:
+            profiler.disable()
+            profiler.stats().dump_stats(args.cprofile)
+            print(f"Wrote the cProfile statistics to {args.cprofile}", file=sys.stderr)
+        if args.tracemalloc is not None:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            snapshot.dump(args.tracemalloc)
+            print(
+                f"Peak traced memory {peak / 2**20:.1f} MiB."
+                f" Wrote the tracemalloc snapshot to {args.tracemalloc}",
+                file=sys.stderr,
+            )
+        if args.profile:
+            PROFILE.disable()
+            print(PROFILE.report(), file=sys.stderr)
+
+
+def _serve(argv) -> None:
+    """Runs `autodog serve`: a documentation server answering JSON-RPC
+    requests on the standard input and output, or on a Unix socket, until
+    it is shut down. See `autodog.server`.
+    """
+    parser = argparse.ArgumentParser(
+        prog="AutoDog serve",
+        description="Serve documentation requests over JSON-RPC, keeping the engine, the journal and the parsed code warm.",
+    )
+    parser.add_argument(
+        "--socket",
+        help="Unix socket path to serve concurrent clients on. Defaults to the standard input and output.",
+        default=None,
+    )
+    _add_engine_arguments(parser)
+    parser.add_argument(
+        "--journal",
+        help="File every generated documentation is journaled to. Defaults to a journal in memory.",
+        default=None,
+    )
+    parser.add_argument(
+        "--workers",
+        help="Number of requests handled concurrently.",
+        default=4,
+        type=int,
+    )
+    args = parser.parse_args(argv)
+
+    # The server module is imported only in this mode.
+    from autodog.server import DocServer, serve_stdio, serve_unix
+
+    e = engine(
+        name=args.engine,
+        api_key=args.key,
+        line_length=args.line_length,
+        model=args.model,
+        rate_limit=args.rate_limit
+    )
+    m = doc_model(
+        model_name=args.doc_type
+    )
+    journal = Journal(args.journal, resume=True)
+    server = DocServer(e, m, journal, trim_threshold=args.trim_lines, workers=args.workers)
+    try:
+        if args.socket is None:
+            # The messages of the engine must not mix with the responses.
+            stdout = sys.stdout
+            with redirect_stdout(sys.stderr):
+                serve_stdio(server, sys.stdin, stdout)
+        else:
+            print(f"Serving on {args.socket}. Press Ctrl+C to stop.")
+            serve_unix(server, args.socket)
+    finally:
+        journal.close()
+
+
+def _merge(argv) -> None:
+    """Runs `autodog merge`: combines the journals or the reports of the
+    shards of a run. A run with the combined journal and `--resume` then
+    inserts the documentation of all the shards without sending requests.
+    """
+    parser = argparse.ArgumentParser(
+        prog="AutoDog merge",
+        description="Combine the journals or the reports of the shards of a run.",
+    )
+    parser.add_argument("kind", help="Kind of the files.", choices=["journal", "report"])
+    parser.add_argument("out", help="Path of the combined file.")
+    parser.add_argument("inputs", help="Files of the shards.", nargs="+")
+    args = parser.parse_args(argv)
+    if args.kind == "journal":
+        n_docs = merge_journals(args.inputs, args.out)
+        print(f"Merged {n_docs} documents of {len(args.inputs)} journals into {args.out}")
     else:
-        c = code(args.path)
-        _insert_doc(c, e, m, args.overwrite, args.tries)
-        c.write()
+        merge_reports(args.inputs, args.out)
+        print(f"Merged {len(args.inputs)} reports into {args.out}")
+
+
+def _filter(args, engine, doc_model) -> int:
+    """Documents the code of the standard input and writes it to the
+    standard output, without touching the filesystem: the journal is not
+    used and the messages go to the standard error. Returns the exit
+    status, 1 if the retries were exhausted, in which case the code is
+    written with the documentation generated so far.
+    """
+    source = sys.stdin.read()
+    with redirect_stdout(sys.stderr):
+        c = code_from_string(source, args.lang, "<stdin>", trim_threshold=args.trim_lines)
+        completed = _insert_doc(
+            c, engine, doc_model, args.overwrite, args.tries, progress_bar=progress_bar_nothing,
+        )
+    sys.stdout.write(c.to_str())
+    sys.stdout.flush()
+    return 0 if completed else 1
+
+
+def _export_batch(files, engine, doc_model, journal, args, root, changes=None) -> None:
+    """Writes the requests of the files to the batch file instead of
+    sending them. The Fortran files are planned in the order of their `use`
+    graph, so they get the summaries of the modules they use as context.
+    """
+    n_requests = 0
+    module_context = {}
+    with open(args.export_batch, "w", encoding="utf-8") as f:
+        for file in _use_order(files):
+            print(f"Export requests of {file}")
+            c = code(file, trim_threshold=args.trim_lines, module_context=module_context)
+            entries = export_file(
+                c, engine, doc_model, journal, root, args.overwrite, _file_changes(changes, file),
+            )
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+            n_requests += len(entries)
+            if is_fortran(file):
+                c.register_modules()
+    print(f"Exported {n_requests} requests to {args.export_batch}")
+
+
+def _ingest_batch(files, engine, doc_model, journal, args, root, changes=None) -> None:
+    """Inserts the documentation of the responses of a batch job into the
+    files and writes them. The files and the options must be those of the
+    export, so the same nodes are planned. A file whose nodes all got their
+    documentation is marked done in the journal.
+    """
+    responses = read_responses(args.ingest_batch)
+    module_context = {}
+    for file in _use_order(files):
+        c = code(file, trim_threshold=args.trim_lines, module_context=module_context)
+        applied, missing = ingest_file(
+            c, responses, engine, doc_model, journal, root, args.overwrite,
+            _file_changes(changes, file),
+        )
+        if is_fortran(file):
+            c.register_modules()
+        out_path = _out_path(file, root, args.out_dir)
+        if out_path is not None and not c.modified:
+            link_or_copy(file, out_path)
+        else:
+            c.write(out_path)
+        if missing:
+            print(f"Insert {applied} documents to {file}, {missing} are missing")
+        else:
+            print(f"Insert {applied} documents to {file}")
+            journal.mark_done(file)
+    if responses:
+        print(f"Warning: {len(responses)} responses match no node, e.g. {next(iter(responses))}")
+
+
+def _use_order(files):
+    files = list(files)
+    fortran_files = [file for file in files if is_fortran(file)]
+    return [file for file in files if not is_fortran(file)] + order_by_use(
+        fortran_files, use_dependencies(fortran_files)
+    )
+
+
+def _file_changes(changes, file):
+    return None if changes is None else changes.get(os.path.abspath(file), [])
+
+
+def _root(args):
+    return args.path if args.recursively else os.path.dirname(args.path)
+
+
+def _select_files(args, changes=None, listings=None):
+    files = _walk_files(args, changes, listings)
+    if args.shard is None or args.shard_by != "file":
+        return files
+    root = _root(args)
+    return (file for file in files if in_shard(file_key(file, root), args.shard))
+
+
+def _shard_nodes(code, args, root):
+    """Returns the documentable nodes of the file in the shard of the run,
+    or None if the nodes are not sharded.
+    """
+    if args.shard is None or args.shard_by != "node":
+        return None
+    return {
+        node for node, node_id in code.node_ids().items()
+        if in_shard(batch_id(code.filepath, root, node_id), args.shard)
+    }
+
+
+def _walk_files(args, changes=None, listings=None):
+    if not args.recursively:
+        if changes is not None and os.path.abspath(args.path) not in changes:
+            return []
+        return [args.path]
+    excludes = list(args.exclude)
+    if args.out_dir is not None:
+        # The output directory is not walked if it is inside the tree.
+        out_relpath = os.path.relpath(args.out_dir, args.path)
+        if not out_relpath.startswith(os.pardir):
+            excludes.append("/" + out_relpath.replace(os.sep, "/") + "/")
+    default_excludes = () if args.no_ignore else DEFAULT_EXCLUDES
+    if changes is not None:
+        return filter_files(sorted(changes), args.path, args.extension, excludes, default_excludes)
+    return iter_files(
+        args.path,
+        args.extension,
+        excludes,
+        use_ignore_files=not args.no_ignore,
+        default_excludes=default_excludes,
+        listings=listings,
+    )
+
+
+def _watch(list_files, engine, doc_model, journal, args, root, report=None) -> None:
+    """Documents the files of the tree as they are modified, until it is
+    interrupted. The engine, the journal and the module summaries stay in
+    memory between the changes. Only the modified files are parsed again,
+    and only the nodes touched by the lines changed since the previous
+    version of a file are documented. A file that fails, e.g. because it
+    does not parse, is reported and documented again at its next change.
+    Every poll stats the watched files and the directories of the tree,
+    and lists only the directories modified since they were listed (see
+    `iter_files`). A modified file is parsed again as a whole, and the
+    texts of the files are kept to be compared with their next version.
+    """
+    watcher = PollingWatcher(list_files, debounce=args.debounce)
+    texts = {}
+    for file in watcher.seen:
+        texts[file] = _read(file)
+    module_context = {}
+    print(f"Watching {len(watcher.seen)} files. Press Ctrl+C to stop.")
+    try:
+        while True:
+            sleep(_WATCH_INTERVAL)
+            for file in watcher.poll():
+                text = _read(file)
+                if text is None:
+                    texts.pop(file, None)
+                    continue
+                previous = texts.get(file)
+                lines = None if previous is None else changed_ranges(previous, text)
+                if lines == []:
+                    texts[file] = text
+                    continue
+                try:
+                    _redocument_file(
+                        file, engine, doc_model, journal, args, root,
+                        module_context if is_fortran(file) else None, lines, report,
+                    )
+                except Exception as e:
+                    # A save that cannot be documented, e.g. one that does not
+                    # parse yet, does not stop the watch. The previous text
+                    # is kept, so the next change is compared with the last
+                    # documented version and touches the lines of this one.
+                    print(f"Failed to document {file}: {type(e).__name__}: {e}", file=sys.stderr)
+                    continue
+                texts[file] = text
+                if args.out_dir is None:
+                    texts[file] = _read(file)
+                    watcher.acknowledge(file)
+    except KeyboardInterrupt:
+        print()
+        print("Stop watching.")
+
+
+def _redocument_file(
+    filepath, engine, doc_model, journal, args, root, module_context, lines, report=None,
+) -> None:
+    print(f"Insert documentation to {filepath}")
+    file_report = FileReport(filepath)
+    journal_engine = JournalEngine(engine, journal, filepath)
+    file_span = span("file", path=file_key(filepath, root))
+    try:
+        with file_span:
+            stat = os.stat(filepath)
+            start = perf_counter()
+            with span("parse"):
+                c = code(filepath, trim_threshold=args.trim_lines, module_context=module_context)
+            file_report.parse_time = perf_counter() - start
+            file_report.n_nodes = c.count_documentable()
+            if not _insert_doc(
+                c, journal_engine, doc_model, args.overwrite, args.tries,
+                lines=lines, file_report=file_report,
+            ):
+                file_report.status = "failed"
+            out_path = _out_path(filepath, root, args.out_dir)
+            if out_path is None and os.stat(filepath).st_mtime_ns != stat.st_mtime_ns:
+                # The file was saved again while it was documented. It is not
+                # overwritten, and it will be documented once the change settles.
+                print(f"Skip modified {filepath}")
+                file_report.status = "skipped"
+                return
+            start = perf_counter()
+            with span("write"):
+                c.write(out_path)
+            file_report.write_time = perf_counter() - start
+    except Exception as e:
+        file_report.status = "error"
+        file_report.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        file_span.set(
+            status=file_report.status,
+            requests=journal_engine.n_requests,
+            hits=journal_engine.n_hits,
+        )
+        if report is not None:
+            _add_report(report, file_report, journal_engine)
+
+
+def _read(filepath):
+    try:
+        with open(filepath, encoding="utf-8") as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _document_files(
+    files, jobs, engine, doc_model, journal, args, root, changes=None, report=None,
+) -> None:
+    """Documents the files in a pipeline with bounded memory. The files are
+    discovered lazily and submitted to a pool of `--max-trees` threads,
+    each parsing a file, planning its requests, inserting the documents
+    and writing it, so that at most that many parsed trees are resident
+    and a file is released as soon as it is written. The discovery waits
+    for a free thread before it submits a file, so it does not run ahead
+    of the pool. The requests of all the files go through a single
+    scheduler of `jobs` workers, which orders them by the schedule policy,
+    shares the workers fairly between the files and keeps them within the
+    RPM and TPM budgets, and then through the rate limiter of the engine.
+    The files are submitted as soon as they are found, except the Fortran
+    files: they are submitted after all files are found, in the order of
+    their `use` graph, and a Fortran file is started only after the files
+    defining the modules it uses are done, so it gets their summaries as
+    context. This cannot deadlock because the dependencies are submitted
+    first.
+    If `changes` is given, only the nodes touched by the changed lines of
+    a file are documented.
+    The progress of the files being documented is reported by a
+    `ProgressReporter`, with the time spent in the rate limiters.
+    """
+    max_trees = args.max_trees or jobs
+    module_context = {}
+    slots = threading.BoundedSemaphore(max_trees)
+    errors = []
+
+    def task(file, after, module_context):
+        try:
+            wait(after)
+            lines = None if changes is None else changes.get(os.path.abspath(file), [])
+            _document_file(
+                file, engine, doc_model, journal, args, root, module_context,
+                progress_bar=reporter, lines=lines, scheduler=scheduler, report=report,
+            )
+        except BaseException as e:
+            errors.append(e)
+            raise
+        finally:
+            slots.release()
+
+    def submit(file, after, module_context):
+        slots.acquire()
+        # The task runs in the context of the run, so its file is traced
+        # in the span of the run.
+        return pool.submit(contextvars.copy_context().run, task, file, after, module_context)
 
+    scheduler = Scheduler(args.schedule, workers=jobs, rpm=args.rpm, tpm=args.tpm)
+    limiters = [scheduler.requests_per_minute, scheduler.tokens_per_minute]
+    if getattr(engine, "rate_limiter", None) is not None:
+        limiters.append(engine.rate_limiter)
+    # Only the futures of the Fortran files are kept, for their dependants.
+    futures = {}
+    fortran_files = []
+    try:
+        with ProgressReporter(limiters=limiters) as reporter, ThreadPoolExecutor(max_workers=max_trees) as pool:
+            for file in files:
+                if is_fortran(file):
+                    fortran_files.append(file)
+                else:
+                    submit(file, [], None)
+            dependencies = use_dependencies(fortran_files)
+            for file in order_by_use(fortran_files, dependencies):
+                after = [futures[dep] for dep in dependencies[file] if dep in futures]
+                futures[file] = submit(file, after, module_context)
+    finally:
+        # The workers are stopped even if the discovery of the files fails.
+        scheduler.close()
+    if errors:
+        raise errors[0]
 
 if __name__ == "__main__":
     app()
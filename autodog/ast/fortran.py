@@ -17,19 +17,25 @@ undefined.
 Functions:
 - _remove_comment: Removes comments from a line of code.
 - _is_continue_line: Checks if a line of code is a continuation line.
-- _has_doc_block: Checks if a block of code has a documentation block.
-- _search_end_statement: Searches for the end statement of a block of
-code.
-- _reconstruct_code_block: Reconstructs a block of code from a list of
-lines.
-- _make_blocks: Splits a list of lines into three blocks based on a
-statement.
-- _match_whole: Checks if a word matches a whole string.
-- _make_nodes: Creates nodes from a block of code.
+- _is_doc_line: Checks if a line of code can be a documentation line.
+- _serialize: Serializes a node with a single join over its spans and
+the written documentation.
+- _start_kind: Returns the kind of the block a statement starts.
+- _candidate_lines: Yields the lines that can start or end a block.
+- _parse: Parses lines of code in a single pass with a stack of open
+blocks.
 - _is_type_statement: Checks if a line of code is a type statement.
+- public_children: Returns the types and procedures a module makes public.
+- module_summary: Summarizes the documentation and the public interface
+of a module.
+- trim_node: Trims the code of a long node to its statement, declarations
+and a summary of its body for a prompt.
 """
 import os
 import re
+from array import array
+from itertools import accumulate
+from typing import Iterator, Optional
 
 
 class EndStatementNotFound(Exception):
@@ -62,47 +68,90 @@ class UndefinedFortranNodeName(Exception):
 
 
 
-class BaseNode:
-    """Represents a base node in a code tree.
+class LineBuffer:
+    """The code of a file shared by all nodes of its tree.
+    The code is kept as a single string with the offsets of its lines, so a
+    span of lines is sliced out of it without keeping a string per line.
 
     Attributes
     ----------
-        children (list): A list of child nodes.
-    Initializes a new instance of the class.
+        code (str): The code.
+        offsets (array): The offset of each line in `code`, followed by the
+        length of `code`.
+    """
 
-    Parameters
-    ----------
-    - code (str): The code to be processed.
+    __slots__ = ("code", "offsets")
 
-    Returns
-    -------
-    - None
-    Side Effects:
-    - Initializes the 'children' attribute with the result of '_make_nodes'
-    function.
-    Converts the current object and its children to a string representation.
+    def __init__(self, lines: list) -> None:
+        """Initializes the buffer.
 
-    Returns
-    -------
-        str: The string representation of the current object and its
-        children.
+        Parameters
+        ----------
+        - lines (list): The lines of the code with their line breaks.
+        """
+        self.code = "".join(lines)
+        self.offsets = array("q", accumulate(map(len, lines), initial=0))
+
+    def __len__(self) -> int:
+        """Returns the number of lines."""
+        return len(self.offsets) - 1
+
+    def raw(self, start: int, end: int) -> str:
+        """Returns the code of the lines `[start, end)`."""
+        return self.code[self.offsets[start]:self.offsets[end]]
+
+    def text(self, start: int, end: int) -> str:
+        """Returns the code of the lines `[start, end)` without the last line
+        break.
+        """
+        return _chomp(self.raw(start, end))
+
+
+class BaseNode:
+    """Represents a base node in a code tree.
+    A node does not hold its code. It holds the span `[start, end)` of its
+    lines in the line buffer shared by all nodes of the tree, and its text
+    is materialized only when it is requested. The text of a node is not
+    cached, so the tree does not hold copies of its subtrees: a node
+    without written documentation is a single slice of the buffer, and
+    only the edited subtrees of the others are visited. The text of the
+    whole tree is cached by its `RootNode`.
+
+    Attributes
+    ----------
+        buffer (LineBuffer): The shared line buffer.
+        start (int): The index of the first line of the node.
+        end (int): The index following the last line of the node.
+        children (list): A list of child nodes.
+        parent (BaseNode): The parent node, or None for the root.
     """
 
-    def __init__(self, code: str) -> None:
+    __slots__ = ("buffer", "start", "end", "children", "parent", "_dirty")
+
+    def __init__(self, buffer: "LineBuffer", start: int, end: int, children: list) -> None:
         """Initializes a new instance of the class.
 
         Parameters
         ----------
-        - code (str): The code to be processed.
+        - buffer (LineBuffer): The shared line buffer.
+        - start (int): The index of the first line of the node.
+        - end (int): The index following the last line of the node.
+        - children (list): The child nodes.
 
         Returns
         -------
         - None
-        Side Effects:
-        - Initializes the 'children' attribute with the result of the
-        '_make_nodes' function.
         """
-        self.children = _make_nodes(code)
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+        self.children = children
+        self.parent = None
+        # True if the documentation of the node or one of its descendants
+        # has been written, so the node is not a plain span of the buffer.
+        self._dirty = False
+        for child in children:
+            child.parent = self
 
     def to_str(self) -> str:
         """Converts the current object and its children to a string representation.
@@ -112,15 +161,49 @@ class BaseNode:
             str: The string representation of the current object and its
             children.
         """
-        return _reconstruct_code_block([child.to_str() for child in self.children])
+        return _chomp(_serialize(self))
+
+    def _invalidate(self) -> None:
+        """Marks the node and its ancestors as edited and drops the cached
+        text of the root.
+        """
+        node = self
+        while node.parent is not None:
+            node._dirty = True
+            node = node.parent
+        node._dirty = True
+        if isinstance(node, RootNode):
+            node._text = None
+
+
+class RootNode(BaseNode):
+    """Represents the root of a tree, whose text is cached until the
+    documentation of one of its descendants is written.
+    """
+
+    __slots__ = ("_text",)
+
+    def __init__(self, buffer: "LineBuffer", start: int, end: int, children: list) -> None:
+        """Initializes the root with the nodes of the top level."""
+        super().__init__(buffer, start, end, children)
+        self._text = None
+
+    def serialize(self) -> str:
+        """Returns the code of the tree, with its final line break if it has
+        one.
+        """
+        if self._text is None:
+            self._text = _serialize(self)
+        return self._text
 
 
 class BodyNode(BaseNode):
-    """Represents a body node in a tree structure.
+    """Represents a body node in a tree structure, which is a run of lines
+    without any block.
 
     Attributes
     ----------
-        children (list): A list of child nodes.
+        children (tuple): An empty tuple.
         code (str): The code associated with the node.
 
     Methods
@@ -128,19 +211,27 @@ class BodyNode(BaseNode):
         to_str: Returns the code associated with the node as a string.
     """
 
-    def __init__(self, code: str) -> None:
+    __slots__ = ()
+
+    def __init__(self, buffer: "LineBuffer", start: int, end: int) -> None:
         """Initializes a new instance of the class.
 
         Parameters
         ----------
-        - code (str): The code associated with the instance.
+        - buffer (LineBuffer): The shared line buffer.
+        - start (int): The index of the first line of the node.
+        - end (int): The index following the last line of the node.
 
         Returns
         -------
         - None.
         """
-        self.children = []
-        self.code = code
+        super().__init__(buffer, start, end, ())
+
+    @property
+    def code(self) -> str:
+        """The code associated with the node."""
+        return self.buffer.text(self.start, self.end)
 
     def to_str(self) -> str:
         """Converts the code attribute of the object to a string.
@@ -155,10 +246,10 @@ class BodyNode(BaseNode):
 class StatementNode(BaseNode):
     """Represents a node in the abstract syntax tree that represents a
     statement.
-
-    Args:
-    ----
-        code (str): The code representing the statement.
+    The lines of the node are split into the statement
+    `[start, statement_end)`, the documentation
+    `[statement_end, body_start)`, the body `[body_start, end - 1)` and the
+    end statement `end - 1`.
 
     Attributes:
     ----------
@@ -166,51 +257,85 @@ class StatementNode(BaseNode):
         doc (str): The reconstructed code block of the documentation.
         end_statement (str): The last line of the statement.
         indent_level (int): The level of indentation of the statement.
+        children (list): The nodes of the body.
     """
 
-    def __init__(self, code: str) -> None:
-        """Initializes an instance of the class.
+    __slots__ = ("statement_end", "body_start", "indent_level", "_doc_lines")
+
+    def __init__(
+        self,
+        buffer: "LineBuffer",
+        start: int,
+        statement_end: int,
+        body_start: int,
+        end: int,
+        indent_level: int,
+        children: list,
+    ) -> None:
+        """Initializes an instance of the class. The instance is created by
+        the parser, which has already found the spans of the parts.
 
         Parameters
         ----------
-        - code (str): The code to be processed.
+        - buffer (LineBuffer): The shared line buffer.
+        - start (int): The index of the first line of the statement.
+        - statement_end (int): The index following the statement, including
+        its continuation lines.
+        - body_start (int): The index following the documentation comment.
+        - end (int): The index following the end statement.
+        - indent_level (int): The indentation level of the body.
+        - children (list): The nodes of the body.
 
         Returns
         -------
         - None.
         """
-        lines = code.splitlines()
-        end_of_statement = 0
-        for i, line in enumerate(lines):
-            if not _is_continue_line(line):
-                end_of_statement = i
-                self.statement = _reconstruct_code_block(
-                    lines[0 : end_of_statement + 1],
-                )
-                break
-        doc_lines = []
-        if _has_doc_block(lines, end_of_statement):
-            for line in lines[end_of_statement + 1 : -1]:
-                if line == "":
-                    break
-                if line.lstrip()[0] != "!":
-                    break
-                doc_lines += [line]
-        self.doc = _reconstruct_code_block(doc_lines)
-        num_doc_lines = len(doc_lines)
-        self.end_statement = lines[-1]
-        body_lines = lines[end_of_statement + num_doc_lines + 1 : -1]
-        indent_level = 0
-        for line in body_lines:
-            if line == "":
-                continue
-            for c in line:
-                if c != " ":
-                    break
-                indent_level += 1
-            break
+        super().__init__(buffer, start, end, children)
+        self.statement_end = statement_end
+        self.body_start = body_start
         self.indent_level = indent_level
-        super().__init__(_reconstruct_code_block(body_lines))
+        self._doc_lines = None
+
+    @property
+    def statement(self) -> str:
+        """The statement, including its continuation lines."""
+        return self.buffer.text(self.start, self.statement_end)
+
+    @property
+    def doc(self) -> str:
+        """The documentation comment, which is the written one if
+        `write_doc` has been called.
+        """
+        if self._doc_lines is not None:
+            return self._line_ending().join(self._doc_lines)
+        return self.buffer.text(self.statement_end, self.body_start)
+
+    @property
+    def has_doc(self) -> bool:
+        """True if the node has documentation. It is checked without
+        materializing the documentation.
+        """
+        if self._doc_lines is not None:
+            return bool(self._doc_lines)
+        return self.body_start > self.statement_end
+
+    @property
+    def name(self) -> str:
+        """The lower-cased name of the block, or an empty string if the
+        statement does not name it.
+        """
+        statement = _logical_statement(self.buffer, self.start, self.statement_end)[1]
+        match = _NAME_PATTERN.search(statement)
+        return match.group(1) if match is not None else ""
+
+    @property
+    def end_statement(self) -> str:
+        """The end statement."""
+        return self.buffer.text(self.end - 1, self.end)
+
+    def _line_ending(self) -> str:
+        """Returns the line break used by the statement."""
+        return _line_ending(self.buffer.raw(self.statement_end - 1, self.statement_end))
 
     def to_str(self) -> str:
         """Converts the current object to a string representation.
@@ -219,18 +344,13 @@ class StatementNode(BaseNode):
         -------
             str: The string representation of the object.
         """
-        code = self.statement + os.linesep
-        if self.doc:
-            code += self.doc + os.linesep
-        code += (
-            _reconstruct_code_block([child.to_str() for child in self.children])
-            + os.linesep
-        )
-        code += self.end_statement
-        return code
+        return super().to_str()
 
     def write_doc(self, doc: str) -> None:
         """Writes the given documentation string to the object's 'doc' attribute.
+        The line buffer is not modified. The lines of the documentation are
+        kept in the node and replace the original documentation when the
+        node is serialized.
 
         Parameters
         ----------
@@ -242,94 +362,51 @@ class StatementNode(BaseNode):
         Example:
         write_doc('This is a sample documentation string.').
         """
-        doc_lines = doc.splitlines()
-        self.doc = (
-            "".join(
-                [
-                    " " * self.indent_level + f"! {doc}".rstrip() + os.linesep
-                    for doc in doc_lines
-                ],
-            )
-        ).rstrip(os.linesep)
+        self._doc_lines = [
+            " " * self.indent_level + f"! {line}".rstrip()
+            for line in doc.splitlines()
+        ]
+        self._invalidate()
 
 
 class ProgramNode(StatementNode):
-    """Initializes a new ProgramNode object.
-
-    Args:
-    ----
-        code (str): The code associated with the program node.
-
-    Returns:
-    -------
-        None.
+    """Represents a node in the abstract syntax tree (AST) that represents a
+    program.
     """
 
-    def __init__(self, code: str) -> None:
-        super().__init__(code)
+    __slots__ = ()
 
 
 class FunctionNode(StatementNode):
     """Represents a node in an abstract syntax tree (AST) that represents a
     function.
-
-    Args:
-    ----
-        code (str): The code representing the function.
-
-    Attributes:
-    ----------
-        code (str): The code representing the function.
     """
 
-    def __init__(self, code: str) -> None:
-        super().__init__(code)
+    __slots__ = ()
 
 
 class SubroutineNode(StatementNode):
-    """Initializes a new instance of the SubroutineNode class.
-
-    Args:
-    ----
-        code (str): The code representing the subroutine.
+    """Represents a node in the abstract syntax tree (AST) that represents a
+    subroutine.
     """
 
-    def __init__(self, code: str) -> None:
-        super().__init__(code)
+    __slots__ = ()
 
 
 class TypeNode(StatementNode):
     """Represents a node in the abstract syntax tree (AST) that represents a
     type declaration statement.
-
-    Args:
-    ----
-        code (str): The code representing the type declaration statement.
-
-    Attributes:
-    ----------
-        code (str): The code representing the type declaration statement.
     """
 
-    def __init__(self, code: str) -> None:
-        super().__init__(code)
+    __slots__ = ()
 
 
 class ModuleNode(StatementNode):
     """Represents a node in the abstract syntax tree (AST) that represents a
     module.
-
-    Args:
-    ----
-        code (str): The code associated with the module.
-
-    Attributes:
-    ----------
-        code (str): The code associated with the module.
     """
 
-    def __init__(self, code: str) -> None:
-        super().__init__(code)
+    __slots__ = ()
 
 
 class FortranAST:
@@ -339,16 +416,23 @@ class FortranAST:
     ----
         code (str): The code to be used for creating the BaseNode.
 
+    Attributes:
+    ----------
+        buffer (LineBuffer): The line buffer shared by all nodes of the
+        tree.
+        tree (RootNode): The root node.
+
     Returns:
     -------
         None
     Methods:
         - to_str(): Returns a string representation of the tree.
-        - walk(): Returns a list of all the elements in the tree, obtained
-        by performing a depth-first traversal.
-        - _walk(node: StatementNode): Recursively walks through the tree of
-        StatementNodes starting from the given node and returns a list of
-        all nodes encountered.
+        - walk(): Yields all the nodes in the tree in the order of a
+        depth-first traversal.
+        - walk_documentable(overwrite): Yields the nodes that can be
+        documented.
+        - count_documentable(overwrite): Returns the number of the nodes
+        `walk_documentable` yields.
     """
 
     def __init__(self, code: str) -> None:
@@ -362,37 +446,263 @@ class FortranAST:
         -------
             None.
         """
-        self.tree = BaseNode(code)
+        lines = code.splitlines(keepends=True)
+        self.buffer = LineBuffer(lines)
+        self.tree = RootNode(self.buffer, 0, len(lines), _parse(lines, self.buffer))
 
     def to_str(self):
-        """Returns a string representation of the tree."""
-        return self.tree.to_str()
+        """Returns a string representation of the tree. The code is
+        reproduced exactly, except for the written documentation.
+        """
+        return self.tree.serialize()
 
-    def walk(self) -> list:
-        """Returns a list of all the elements in the tree, obtained by performing a
+    def walk(self) -> Iterator[BaseNode]:
+        """Yields all the nodes in the tree, except the root, in the order of a
         depth-first traversal.
+        The traversal is iterative, so it neither builds a list of the nodes
+        nor recurses.
         """
-        return self._walk(self.tree)
+        stack = list(reversed(self.tree.children))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
 
-    def _walk(self, node: StatementNode) -> list:
-        """Recursively walks through the tree of StatementNodes starting from the
-        given node and returns a list of all nodes encountered.
+    def walk_documentable(self, overwrite: bool = True) -> Iterator[StatementNode]:
+        """Yields the nodes that can be documented, in the order of `walk`.
 
         Args:
         ----
-            node (StatementNode): The starting node of the tree.
+            overwrite (bool, optional): If False, the nodes that already
+            have documentation are skipped. Defaults to True.
 
-        Returns:
-        -------
-            list: A list of StatementNodes encountered during the traversal.
+        Yields:
+        ------
+            StatementNode: A node that can be documented.
+        """
+        for node in self.walk():
+            if isinstance(node, StatementNode) and (overwrite or not node.has_doc):
+                yield node
+
+    def count_documentable(self, overwrite: bool = True) -> int:
+        """Returns the number of the nodes `walk_documentable` yields, without
+        building a list of them.
         """
-        if not node.children:
-            return [node]
-        nodes = []
-        for child in node.children:
-            nodes += [child]
-            nodes += self._walk(child)
-        return nodes
+        return sum(1 for _ in self.walk_documentable(overwrite))
+
+
+def trim_node(node: StatementNode, max_lines: int) -> str:
+    """Returns the code of the node trimmed for a prompt if the node is longer
+    than `max_lines` lines, or the whole code of the node otherwise.
+    The trimmed code consists of the statement, the documentation, the
+    declaration section (`use`, `implicit`, the type declarations,
+    interfaces and derived types) and a comment that summarizes the omitted
+    lines with the called subroutines, the allocated arrays, the I/O
+    statements and the contained procedures, followed by the end
+    statement.
+
+    Args:
+    ----
+        node (StatementNode): The node to be trimmed.
+        max_lines (int): The number of lines above which the node is
+        trimmed. The declaration section is truncated to this number of
+        lines too.
+
+    Returns:
+    -------
+        str: The code of the node, without a trailing line break.
+    """
+    if node.end - node.start <= max_lines:
+        return node.to_str()
+    buffer = node.buffer
+    ending = node._line_ending()
+    blocks = {
+        child.start: child for child in node.children if isinstance(child, StatementNode)
+    }
+    last = node.end - 1
+
+    # The declaration section ends at the first executable statement, at
+    # `contains` or at a contained procedure.
+    pos = decl_end = node.body_start
+    in_interface = False
+    while pos < last:
+        child = blocks.get(pos)
+        if child is not None:
+            if not (in_interface or isinstance(child, TypeNode)):
+                break
+            pos = decl_end = child.end
+            continue
+        next_pos, statement = _logical_statement(buffer, pos, last)
+        statement = statement.strip()
+        if statement == "contains":
+            break
+        if statement:
+            if _INTERFACE_PATTERN.match(statement):
+                in_interface = True
+            elif _END_INTERFACE_PATTERN.match(statement):
+                in_interface = False
+            elif not (in_interface or _DECLARATION_PATTERN.match(statement)):
+                break
+            decl_end = next_pos
+        pos = next_pos
+
+    calls, allocated, io, contained = {}, {}, {}, {}
+    while pos < last:
+        child = blocks.get(pos)
+        if child is not None:
+            if isinstance(child, (FunctionNode, SubroutineNode)):
+                contained[" ".join(child.statement.replace("&", " ").split())] = None
+            pos = child.end
+            continue
+        pos, statement = _logical_statement(buffer, pos, last)
+        for match in _CALL_PATTERN.finditer(statement):
+            calls[match.group(1)] = None
+        for match in _ALLOCATE_PATTERN.finditer(statement):
+            for name in _allocated_names(statement, match.end()):
+                allocated[name] = None
+        match = _IO_PATTERN.match(statement)
+        if match is not None:
+            control = _parenthesized(statement, match.end()) if match.group(1) != "print" else ""
+            io[match.group(1) + control.replace(" ", "")] = None
+
+    indent = " " * node.indent_level
+    if decl_end - node.body_start > max_lines:
+        decl_end = node.body_start + max_lines
+    omitted = last - decl_end
+    summary = [f"! ... {omitted} lines are omitted. They include:"]
+    for title, items in (
+        ("calls", calls),
+        ("allocates", allocated),
+        ("I/O", io),
+        ("contains", contained),
+    ):
+        if items:
+            summary.append(f"!   {title}: {_join_summary(list(items))}")
+    pieces = [node.statement]
+    if node.has_doc:
+        pieces.append(node.doc)
+    if decl_end > node.body_start:
+        pieces.append(_chomp(buffer.raw(node.body_start, decl_end)))
+    pieces += [indent + line for line in summary]
+    pieces.append(node.end_statement)
+    return ending.join(pieces)
+
+
+def public_children(node: "ModuleNode") -> list["StatementNode"]:
+    """Returns the derived types and procedures of a module that are
+    visible outside of it, according to the `public` and `private`
+    statements of the module and the attributes of the types.
+
+    Args:
+    ----
+        node (ModuleNode): The module node.
+
+    Returns:
+    -------
+        list[StatementNode]: The public type, function and subroutine
+        children of the module, in the order of the code.
+    """
+    buffer = node.buffer
+    default_public = True
+    public, private = set(), set()
+    blocks = {
+        child.start: child for child in node.children if isinstance(child, StatementNode)
+    }
+    pos = node.body_start
+    while pos < node.end - 1:
+        child = blocks.get(pos)
+        if child is not None:
+            pos = child.end
+            continue
+        pos, statement = _logical_statement(buffer, pos, node.end - 1)
+        match = _ACCESS_PATTERN.match(statement.strip())
+        if match is None:
+            continue
+        names = [name.strip() for name in match.group(2).split(",") if name.strip()]
+        if not names:
+            default_public = match.group(1) == "public"
+        elif match.group(1) == "public":
+            public.update(names)
+        else:
+            private.update(names)
+
+    children = []
+    for child in blocks.values():
+        if not isinstance(child, (TypeNode, FunctionNode, SubroutineNode)):
+            continue
+        name = child.name
+        statement = _logical_statement(buffer, child.start, child.statement_end)[1]
+        attributes = statement.partition("::")[0] if isinstance(child, TypeNode) else ""
+        if _PRIVATE_ATTRIBUTE_PATTERN.search(attributes):
+            continue
+        if _PUBLIC_ATTRIBUTE_PATTERN.search(attributes) or name in public or (
+            default_public and name not in private
+        ):
+            children.append(child)
+    return children
+
+
+def module_summary(node: "ModuleNode") -> str:
+    """Returns a compact summary of a module to be used as the context of
+    the prompts of the code using it. The summary consists of the module
+    statement, its documentation and the statements of its public derived
+    types and procedures (see `public_children`), without their bodies.
+
+    Args:
+    ----
+        node (ModuleNode): The module node.
+
+    Returns:
+    -------
+        str: The summary, without a trailing line break.
+    """
+    indent = " " * node.indent_level
+    pieces = [node.statement]
+    if node.has_doc:
+        pieces.append(node.doc)
+    for child in public_children(node):
+        pieces.append(indent + " ".join(child.statement.replace("&", " ").split()))
+    pieces.append(node.end_statement)
+    return node._line_ending().join(pieces)
+
+
+_STRING_PATTERN = re.compile(r"['\"][^'\"]*['\"]")
+_END_PATTERN = re.compile(r"\s*end\s*(program|module|function|subroutine|type)\b")
+_BARE_END_PATTERN = re.compile(r"\s*end\s*$")
+_PROGRAM_PATTERN = re.compile(r"\s*program\b")
+_MODULE_PATTERN = re.compile(r"\s*module\s+(?!procedure\b|function\b|subroutine\b)\w")
+_PROCEDURE_PATTERN = re.compile(r"\b(function|subroutine)\s+[a-z_]\w*")
+_TYPE_PATTERN = re.compile(r"\s*type(?:\s*,|\s*::|\s+(?!is\b)[a-z_]\w*\s*$)")
+_DECLARATION_PATTERN = re.compile(
+    r"(?:use|import|implicit|integer|real|double\s*precision|double\s*complex|complex"
+    r"|logical|character|procedure|parameter|dimension|allocatable|pointer|target"
+    r"|intent|optional|external|intrinsic|save|common|equivalence|data|namelist"
+    r"|include|public|private|protected|value|volatile|contiguous|enum|enumerator"
+    r"|generic|end\s*enum)\b|(?:type|class)\s*\("
+)
+_INTERFACE_PATTERN = re.compile(r"(abstract\s+)?interface\b")
+_END_INTERFACE_PATTERN = re.compile(r"end\s*interface\b")
+_CALL_PATTERN = re.compile(r"\bcall\s+([a-z_][\w%]*)")
+_ALLOCATE_PATTERN = re.compile(r"\ballocate\s*(?=\()")
+_IO_PATTERN = re.compile(
+    r"(?:\d+\s+)?(?:if\s*\(.*\)\s*)?"
+    r"(open|close|read|write|print|inquire|rewind|backspace|flush)\b\s*"
+)
+_ALLOCATE_NAME_PATTERN = re.compile(r"\s*([a-z_][\w%]*)\s*(?:\(|$)")
+_MAX_SUMMARY_ITEMS = 30
+_NAME_PATTERN = re.compile(
+    r"(?:\b(?:program|module|function|subroutine)\s+|::\s*|^\s*type\s+)([a-z_]\w*)"
+)
+_ACCESS_PATTERN = re.compile(r"(public|private)\b\s*(?:::)?\s*(.*)$")
+_PUBLIC_ATTRIBUTE_PATTERN = re.compile(r",\s*public\b")
+_PRIVATE_ATTRIBUTE_PATTERN = re.compile(r",\s*private\b")
+_NODE_CLASSES = {
+    "program": ProgramNode,
+    "module": ModuleNode,
+    "function": FunctionNode,
+    "subroutine": SubroutineNode,
+    "type": TypeNode,
+}
 
 
 def _remove_comment(line: str) -> str:
@@ -406,7 +716,7 @@ def _remove_comment(line: str) -> str:
     -------
     - str: The line with the comment removed.
     """
-    return line.split("!")[0]
+    return line.partition("!")[0]
 
 
 def _is_continue_line(line: str) -> bool:
@@ -420,186 +730,329 @@ def _is_continue_line(line: str) -> bool:
     -------
         bool: True if the line is a continuation line, False otherwise.
     """
-    segments = _remove_comment(line).split()
-    return "&" in segments[-1][-1]
+    return _remove_comment(line).rstrip().endswith("&")
 
 
-def _has_doc_block(lines: list, end_of_statement: int) -> bool:
-    """Checks if there is a doc block after the given statement.
+def _is_doc_line(line: str) -> bool:
+    """Checks if the given line can be a line of a doc block, which is a
+    non-blank comment line.
+    """
+    stripped = line.lstrip()
+    return stripped[:1] == "!"
 
-    Args:
-    ----
-        lines (list): The list of lines containing the code.
-        end_of_statement (int): The index of the end of the statement.
 
-    Returns:
-    -------
-        bool: True if there is a doc block after the statement, False
-        otherwise.
-    """
-    if lines[end_of_statement + 1]:
-        return lines[end_of_statement + 1].lstrip()[0] == "!"
-    return None
+def _chomp(text: str) -> str:
+    """Removes a trailing line break from the text."""
+    if text.endswith("\r\n"):
+        return text[:-2]
+    if text.endswith(("\n", "\r")):
+        return text[:-1]
+    return text
+
 
+def _line_ending(line: str) -> str:
+    """Returns the line break of the line, or `os.linesep` if it has none."""
+    if line.endswith("\r\n"):
+        return "\r\n"
+    if line.endswith(("\n", "\r")):
+        return line[-1]
+    return os.linesep
 
-def _search_end_statement(lines: list, statement: str, start_num: int) -> int:
-    """Searches for the end statement of a given statement in a list of lines.
+
+def _serialize(node: BaseNode) -> str:
+    """Serializes the node with a single join over the unchanged spans of the
+    line buffer and the written documentation.
+    Only the edited subtrees are visited, so serializing a node that has no
+    written documentation is a single slice of the buffer.
 
     Args:
     ----
-        lines (list): A list of lines to search through.
-        statement (str): The statement to find the end statement for.
-        start_num (int): The line number to start searching from.
+        node (BaseNode): The node to be serialized.
 
     Returns:
     -------
-        int: The line number of the end statement.
+        str: The code of the node, ending with the line break of its last
+        line if it has one.
+    """
+    buffer = node.buffer
+    if not node._dirty:
+        return buffer.raw(node.start, node.end)
+    pieces = []
+    pos = node.start
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, StatementNode) and current._doc_lines is not None:
+            pieces.append(buffer.raw(pos, current.statement_end))
+            ending = current._line_ending()
+            pieces += [line + ending for line in current._doc_lines]
+            pos = current.body_start
+        stack.extend(child for child in reversed(current.children) if child._dirty)
+    pieces.append(buffer.raw(pos, node.end))
+    return "".join(pieces)
+
+
+def _indent_level(lines: list, start: int, end: int) -> int:
+    """Returns the number of leading spaces of the first non-empty line in
+    `lines[start:end]`, or 0 if there is no such line.
+    """
+    for line in lines[start:end]:
+        line = _chomp(line)
+        if line:
+            return len(line) - len(line.lstrip(" "))
+    return 0
 
-    Raises:
-    ------
-        EndStatementNotFound: If the end statement is not found.
+
+def _statement_text(line: str) -> str:
+    """Returns the lower-cased statement of a line, in which the comment and
+    the string literals are removed.
     """
-    for line_num, line in enumerate(lines[start_num:]):
-        if _match_whole(line.lower(), "end " + statement.lower()):
-            return start_num + line_num
-    raise EndStatementNotFound(f'`end {statement}` of `{lines[start_num]}` is not found.')
+    code = _remove_comment(line)
+    if "'" in code or '"' in code:
+        code = _remove_str(code)
+    return code.lower()
 
 
-def _reconstruct_code_block(lines: list, start_num=0, end_num=-1) -> str:
-    """Reconstructs a code block from a list of lines.
+def _start_kind(statement: str) -> Optional[str]:
+    """Returns the kind of the block the statement starts, or None.
 
     Args:
     ----
-        lines (list): A list of lines representing the code block.
-        start_num (int, optional): The starting line number to include in
-        the reconstruction. Defaults to 0.
-        end_num (int, optional): The ending line number to include in the
-        reconstruction. Defaults to -1.
+        statement (str): The statement returned by `_statement_text`.
 
     Returns:
     -------
-        str: The reconstructed code block as a string.
+        str, optional: One of 'program', 'module', 'function', 'subroutine'
+        and 'type', or None if the statement does not start a block.
     """
-    if not lines:
-        return ""
-    return (
-        "".join([line + os.linesep for line in lines[start_num:end_num]])
-        + lines[end_num]
-    )
+    if "function" in statement or "subroutine" in statement:
+        match = _PROCEDURE_PATTERN.search(statement)
+        if match:
+            return match.group(1)
+    if "module" in statement and _MODULE_PATTERN.match(statement):
+        return "module"
+    if "program" in statement and _PROGRAM_PATTERN.match(statement):
+        return "program"
+    if "type" in statement and _is_type_statement(statement):
+        return "type"
+    return None
 
 
-def _make_blocks(lines: list, statement: str, line_num: int) -> list:
-    """Splits the given list of lines into three blocks: before_block, block,
-    and after_block.
+class _Block:
+    """A block being parsed, which has not found its end statement yet."""
 
-    Args:
-    ----
-        lines (list): A list of lines.
-        statement (str): The statement to search for.
-        line_num (int): The line number to start the search from.
+    __slots__ = ("kind", "start", "statement_end", "body_start", "children", "run_start")
+
+    def __init__(self, kind, start, statement_end, body_start) -> None:
+        self.kind = kind
+        self.start = start
+        self.statement_end = statement_end
+        self.body_start = body_start
+        self.children = []
+        self.run_start = body_start
 
-    Returns:
-    -------
-        tuple: A tuple containing three lists: before_block, block, and
-        after_block.
-    """
-    end_num = _search_end_statement(lines, statement, line_num)
-    before_block = []
-    if line_num > 0:
-        before_block = lines[:line_num]
-    block = lines[line_num : end_num + 1]
-    after_block = []
-    if end_num < len(lines):
-        after_block = lines[end_num + 1 :]
-    return (before_block, block, after_block)
 
+def _close_run(buffer: LineBuffer, block: _Block, end: int) -> None:
+    """Appends the lines between the last child of the block and `end` to the
+    block as a body node. A block without any child gets a body node even
+    if the lines are empty.
+    """
+    if block.run_start < end or not block.children:
+        block.children.append(BodyNode(buffer, block.run_start, end))
 
-def _match_whole(word: str, find: str) -> bool:
-    return len(re.findall(f'\\b{find}\\b', word)) != 0
 
-def _make_nodes(code: str) -> list:
-    """Parses the given code and returns a list of nodes representing the
-    program structure.
+def _candidate_lines(code: str):
+    """Yields the numbers and the lower-cased texts of the lines that
+    contain a keyword which can start or end a block.
+    The lines are lower-cased at once, and the other lines are filtered out
+    with plain substring tests, which are much cheaper than regular
+    expressions.
+    """
+    lower_lines = code.lower().splitlines()
+    for line_num, line in enumerate(lower_lines):
+        if (
+            "end" in line
+            or "type" in line
+            or "function" in line
+            or "subroutine" in line
+            or "module" in line
+            or "program" in line
+        ):
+            yield line_num, line
+
+
+def _parse(lines: list, buffer: LineBuffer) -> list:
+    """Parses the lines in a single pass and returns the nodes of the top
+    level.
+    Open blocks are kept on a stack, so the parsing is linear in the number
+    of lines and does not recurse. A line that only continues the previous
+    statement is never taken as the start or the end of a block.
 
     Args:
     ----
-        code (str): The code to be parsed.
+        lines (list): The lines of the code with their line breaks.
+        buffer (LineBuffer): The line buffer of the nodes.
 
     Returns:
     -------
-        list: A list of nodes representing the program structure.
+        list: The nodes of the top level.
+
+    Raises:
+    ------
+        EndStatementNotFound: If a block is not closed.
     """
-    lines = code.splitlines()
-    for line_num, line in enumerate(lines):
-        statement = _remove_str(
-            _remove_comment(line)
-        )
-        if _match_whole(statement.lower(), "program"):
-            (before_block, block, after_block) = _make_blocks(
-                lines, "program", line_num,
-            )
-            nodes = []
-            if before_block:
-                nodes += [BaseNode(_reconstruct_code_block(before_block))]
-            nodes += [ProgramNode(_reconstruct_code_block(block))]
-            if after_block:
-                nodes += _make_nodes(_reconstruct_code_block(after_block))
-            return nodes
-        elif _match_whole(statement.lower(), "module"):
-            (before_block, block, after_block) = _make_blocks(lines, "module", line_num)
-            nodes = []
-            if before_block:
-                nodes += [BaseNode(_reconstruct_code_block(before_block))]
-            nodes += [ModuleNode(_reconstruct_code_block(block))]
-            if after_block:
-                nodes += _make_nodes(_reconstruct_code_block(after_block))
-            return nodes
-        elif _match_whole(statement.lower(), "function"):
-            (before_block, block, after_block) = _make_blocks(
-                lines, "function", line_num,
-            )
-            nodes = []
-            if before_block:
-                nodes += [BaseNode(_reconstruct_code_block(before_block))]
-            nodes += [FunctionNode(_reconstruct_code_block(block))]
-            if after_block:
-                nodes += _make_nodes(_reconstruct_code_block(after_block))
-            return nodes
-        elif _match_whole(statement.lower(), "subroutine"):
-            (before_block, block, after_block) = _make_blocks(
-                lines, "subroutine", line_num,
+    stack = [_Block(None, 0, 0, 0)]
+    n_lines = len(lines)
+    position = 0
+    for line_num, lower_line in _candidate_lines(buffer.code):
+        if line_num < position:
+            continue
+        if line_num > 0 and "&" in lines[line_num - 1] and _is_continue_line(lines[line_num - 1]):
+            continue
+        statement = _statement_text(lower_line)
+        block = stack[-1]
+        if statement.lstrip().startswith("end"):
+            end_match = _END_PATTERN.match(statement)
+            if end_match or _BARE_END_PATTERN.match(statement):
+                kind = end_match.group(1) if end_match else None
+                if block.kind is not None and kind in (block.kind, None):
+                    _close_run(buffer, block, line_num)
+                    stack.pop()
+                    parent = stack[-1]
+                    parent.children.append(
+                        _NODE_CLASSES[block.kind](
+                            buffer,
+                            block.start,
+                            block.statement_end,
+                            block.body_start,
+                            line_num + 1,
+                            _indent_level(lines, block.body_start, line_num),
+                            block.children,
+                        )
+                    )
+                    position = line_num + 1
+                    parent.run_start = position
+                continue
+        kind = _start_kind(statement)
+        if kind is None:
+            continue
+        if block.run_start < line_num:
+            block.children.append(
+                BaseNode(
+                    buffer,
+                    block.run_start,
+                    line_num,
+                    [BodyNode(buffer, block.run_start, line_num)],
+                )
             )
-            nodes = []
-            if before_block:
-                nodes += [BaseNode(_reconstruct_code_block(before_block))]
-            nodes += [SubroutineNode(_reconstruct_code_block(block))]
-            if after_block:
-                nodes += _make_nodes(_reconstruct_code_block(after_block))
-            return nodes
-        elif _is_type_statement(statement):
-            (before_block, block, after_block) = _make_blocks(lines, "type", line_num)
-            nodes = []
-            if before_block:
-                nodes += [BaseNode(_reconstruct_code_block(before_block))]
-            nodes += [TypeNode(_reconstruct_code_block(block))]
-            if after_block:
-                nodes += _make_nodes(_reconstruct_code_block(after_block))
-            return nodes
-    return [BodyNode(code)]
+        statement_end = line_num + 1
+        while statement_end < n_lines and _is_continue_line(lines[statement_end - 1]):
+            statement_end += 1
+        body_start = statement_end
+        while body_start < n_lines and _is_doc_line(lines[body_start]):
+            body_start += 1
+        stack.append(_Block(kind, line_num, statement_end, body_start))
+        position = body_start
+    if len(stack) > 1:
+        block = stack[-1]
+        raise EndStatementNotFound(
+            f'`end {block.kind}` of `{_chomp(lines[block.start])}` is not found.'
+        )
+    root = stack[0]
+    _close_run(buffer, root, n_lines)
+    return root.children
+
 
 def _remove_str(line: str) -> str:
-    return re.sub(r"['\"][^'\"]*['\"]" , '', line)
+    return _STRING_PATTERN.sub("", line)
+
 
 def _is_type_statement(line: str) -> bool:
     """Checks if a given line is a type statement.
 
     Args:
     ----
-        line (str): The line to be checked.
+        line (str): The lower-cased line to be checked.
 
     Returns:
     -------
         bool: True if the line is a type statement, False otherwise.
     """
-    declaration = re.split("[,]|[:]+", line)[0]
-    return _match_whole(declaration.lower(), "type") and ("(" not in declaration)
+    return _TYPE_PATTERN.match(line) is not None
+
+
+def _logical_statement(buffer: LineBuffer, start: int, end: int) -> tuple:
+    """Joins a line and its continuation lines into a statement.
+
+    Args:
+    ----
+        buffer (LineBuffer): The line buffer.
+        start (int): The index of the first line of the statement.
+        end (int): The index the statement cannot reach.
+
+    Returns:
+    -------
+        tuple: The index following the statement, and the lower-cased
+        statement in which the comments are removed and the string literals
+        are emptied.
+    """
+    parts = []
+    pos = start
+    while pos < end:
+        line = _remove_comment(_STRING_PATTERN.sub("''", buffer.text(pos, pos + 1)))
+        pos += 1
+        line = line.strip()
+        if line.startswith("&"):
+            line = line[1:]
+        if not line.endswith("&"):
+            parts.append(line)
+            break
+        parts.append(line[:-1])
+    return pos, " ".join(parts).lower()
+
+
+def _parenthesized(statement: str, start: int) -> str:
+    """Returns the parenthesized group starting at `statement[start]`, or an
+    empty string if there is none.
+    """
+    if not statement.startswith("(", start):
+        return ""
+    depth = 0
+    for i in range(start, len(statement)):
+        if statement[i] == "(":
+            depth += 1
+        elif statement[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return statement[start:i + 1]
+    return statement[start:]
+
+
+def _allocated_names(statement: str, start: int) -> Iterator[str]:
+    """Yields the names of the arrays allocated by the `allocate` statement
+    whose argument list starts at `statement[start]`.
+    """
+    arguments = _parenthesized(statement, start)[1:-1]
+    if "::" in arguments:
+        arguments = arguments.split("::", 1)[1]
+    depth = 0
+    item_start = 0
+    for i, char in enumerate(arguments + ","):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            item = arguments[item_start:i]
+            item_start = i + 1
+            match = _ALLOCATE_NAME_PATTERN.match(item)
+            if match is not None:
+                yield match.group(1)
+
+
+def _join_summary(items: list) -> str:
+    """Joins the items of a summary line, truncating a long list."""
+    if len(items) > _MAX_SUMMARY_ITEMS:
+        return ", ".join(items[:_MAX_SUMMARY_ITEMS]) + f", ... ({len(items)} in total)"
+    return ", ".join(items)
+
@@ -0,0 +1,165 @@
+"""Offline batch jobs of documentation requests.
+
+A backfill of a whole repository can be sent through the asynchronous
+batch endpoint of a provider, which is cheaper than synchronous calls, in
+two halves working on local files only:
+
+- `export_file` serializes the planned requests of a file as JSON Lines
+  entries, each identified by the stable id of its node (see `batch_id`)
+  as `custom_id` and shaped by `Engine.batch_request`.
+- `read_responses` loads the responses of the batch job, and
+  `ingest_file` inserts their documentation into the nodes of a file
+  and journals it.
+
+The requests whose documentation is journaled are not exported, and they
+are applied from the journal when the responses are ingested. The Fortran
+nodes exported after a module of their file, which a live run sends once
+the module is documented, get the context of the module as it is when
+exported.
+"""
+import json
+from typing import Optional
+
+from autodog.docmodel.base import DocModel
+from autodog.engine.base import Engine
+from autodog.utils.journal import Journal
+from autodog.utils.shard import file_key
+
+
+def batch_id(filepath:str, root:Optional[str], node_id:str) -> str:
+    """Returns the id of a node in a batch job: the path of its file
+    relative to the root, with '/' separators, and the id of the node in
+    the file (see `node_ids` of the code classes), e.g.
+    'pkg/mod.py::Class.method'.
+    """
+    return f"{file_key(filepath, root)}::{node_id}"
+
+
+def export_file(
+    code:any,
+    engine:Engine,
+    doc_model:DocModel,
+    journal:Journal,
+    root:Optional[str],
+    overwrite:bool=False,
+    lines:Optional[list[tuple[int, int]]]=None,
+) -> list[dict]:
+    """Returns the batch entries of the requests of a file. The journaled
+    documentation is inserted into the code instead, so the following
+    stages are planned as a live run would plan them.
+
+    Args:
+    ----
+        code (PyCode or FortranCode): The code of the file.
+        engine (Engine): The engine shaping the entries.
+        doc_model (DocModel): The documentation model.
+        journal (Journal): The journal of the generated documentation.
+        root (str, optional): The root the file paths are relative to.
+        overwrite (bool, optional): Flag to document again the nodes that
+        have documentation. Defaults to False.
+        lines (list, optional): The changed line ranges selecting the
+        nodes. Defaults to None, which selects all the nodes.
+
+    Returns:
+    -------
+        list[dict]: The entries, in the order of the stages.
+    """
+    ids = code.node_ids()
+    entries = []
+    for requests in code.plan_stages(doc_model, overwrite=overwrite, lines=lines):
+        for request in requests:
+            doc = journal.get(request.key())
+            if doc is not None:
+                code.apply_doc(request, doc)
+                continue
+            entry = {"custom_id": batch_id(code.filepath, root, ids[request.node])}
+            entry.update(engine.batch_request(
+                request.code,
+                lang=request.lang,
+                statement_kind=request.statement_kind,
+                doc_format=request.doc_format,
+                context=request.context,
+            ))
+            entries.append(entry)
+    return entries
+
+
+def read_responses(path:str) -> dict[str, dict]:
+    """Loads the responses of a batch job.
+
+    Args:
+    ----
+        path (str): The JSON Lines file of the responses. Every entry has
+        the `custom_id` of its request.
+
+    Returns:
+    -------
+        dict: The responses keyed by their `custom_id`.
+
+    Raises:
+    ------
+        ValueError: If an entry has no `custom_id`.
+    """
+    responses = {}
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "custom_id" not in entry:
+                raise ValueError(f"{path}:{n}: The response has no custom_id.")
+            responses[entry["custom_id"]] = entry
+    return responses
+
+
+def ingest_file(
+    code:any,
+    responses:dict[str, dict],
+    engine:Engine,
+    doc_model:DocModel,
+    journal:Journal,
+    root:Optional[str],
+    overwrite:bool=False,
+    lines:Optional[list[tuple[int, int]]]=None,
+) -> tuple[int, int]:
+    """Inserts the documentation of the responses of a batch job into a
+    file, and journals it. The requests without a successful response
+    are applied from the journal if possible. The responses used are
+    removed from `responses`.
+
+    Args:
+    ----
+        code (PyCode or FortranCode): The code of the file.
+        responses (dict): The responses keyed by their `custom_id`.
+        engine (Engine): The engine reading the responses.
+        doc_model (DocModel): The documentation model.
+        journal (Journal): The journal of the generated documentation.
+        root (str, optional): The root the file paths are relative to.
+        overwrite (bool, optional): Flag to document again the nodes that
+        have documentation. It must be the flag of the export. Defaults to
+        False.
+        lines (list, optional): The changed line ranges selecting the
+        nodes. It must be the selection of the export. Defaults to None.
+
+    Returns:
+    -------
+        tuple[int, int]: The numbers of the inserted documents and of the
+        requests left undocumented.
+    """
+    ids = code.node_ids()
+    applied = 0
+    missing = 0
+    for requests in code.plan_stages(doc_model, overwrite=overwrite, lines=lines):
+        for request in requests:
+            response = responses.pop(batch_id(code.filepath, root, ids[request.node]), None)
+            doc = None if response is None else engine.batch_doc(response, request.lang)
+            if doc is None:
+                doc = journal.get(request.key())
+            else:
+                journal.record(request.key(), doc, code.filepath)
+            if doc is None:
+                missing += 1
+                continue
+            code.apply_doc(request, doc)
+            applied += 1
+    return applied, missing
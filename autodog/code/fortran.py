@@ -9,25 +9,46 @@ and program node in the tree. The documentation is generated by calling
 methods on the `DocEngine` object based on the type of node. If the
 `overwrite` parameter is `True`, existing documentation will be
 replaced.
-The `_insert_docs` method is a private method that is used by
-`insert_docs` to dispatch to the appropriate method based on the type of
+The `insert_docs` method is built on `plan_stages`, which makes the
+documentation requests of the nodes in stages without sending them, and
+`apply_doc`, which inserts a received document, so the requests of a
+file can also be sent by a scheduler in any order.
+The `_request` method is a private method that is used by
+`plan_stages` to dispatch to the appropriate method based on the type of
 node. It uses the `singledispatchmethod` decorator to register methods
 for each type of node.
+A module, program, function or subroutine longer than the trim threshold
+is sent to the engine trimmed to its statement, its declarations and a
+summary of its body (see `trim_node`), so a long procedure does not
+exceed the context window of the engine.
+When a module context shared by the files of a run is given, the
+summaries of the modules defined in the file (see `module_summary`) are
+registered to it, and the summaries of the modules a node uses are
+passed to the engine as the context of the node.
 """
+import os
 from functools import singledispatchmethod
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 
 from autodog.ast.fortran import (
     FortranAST,
     FunctionNode,
     ModuleNode,
     ProgramNode,
+    StatementNode,
     SubroutineNode,
     TypeNode,
+    module_summary,
+    public_children,
+    trim_node,
 )
-from autodog.engine.base import Engine
+from autodog.engine.request import DocRequest, pipeline
 from autodog.docmodel.base import DocModel
+from autodog.utils.fileio import write_if_changed
+from autodog.utils.gitdiff import drop_blank_lines, overlaps, touched_spans
+from autodog.utils.profiling import phase
 from autodog.utils.progress import progress_bar_nothing
+from autodog.utils.usegraph import scan_modules
 
 
 class FortranCode:
@@ -38,6 +59,11 @@ class FortranCode:
     ----------
         filepath (str): The filepath of the Fortran code file.
         tree (FortranAST): The abstract syntax tree (AST) of the code.
+        trim_threshold (int, optional): The number of lines above which
+        the code of a node is trimmed in the prompt. None disables the
+        trimming.
+        module_context (dict, optional): The summaries of the modules
+        documented so far, keyed by their lower-cased names.
 
     Methods
     -------
@@ -55,35 +81,81 @@ class FortranCode:
         insert_docs(self, engine: any, overwrite=False,
         progress_bar=progress_bar_nothing, **kwargs) -> None:
             Inserts documentation into the code using a `DocEngine` object.
-        _insert_docs(self, node: any, engine: DocEngine, overwrite: bool) ->
-        None:
-            Inserts documentation for a given node using the specified
-            documentation engine.
+        plan_stages(self, doc_model, overwrite=False, lines=None):
+            Yields the documentation requests of the nodes in stages
+            without sending them.
+        apply_doc(self, request, doc) -> None:
+            Inserts the documentation received for a request.
+        _request(self, node: any, doc_model: DocModel) -> DocRequest:
+            Makes the documentation request of a given node.
     """
 
-    def __init__(self, filepath:str) -> None:
+    def __init__(
+        self,
+        filepath:str,
+        trim_threshold:Optional[int]=None,
+        module_context:Optional[dict[str, str]]=None,
+        source:Optional[str]=None,
+    ) -> None:
         """The `__init__` method initializes an instance of a class with a
         `filepath` parameter, which is a string representing the path to a
         Fortran file. The method reads the contents of the file using the `open`
         function and creates a `FortranAST` object from the file contents. The
         `FortranAST` object is stored as an attribute of the instance with the
-        name `tree`.
+        name `tree`. The nodes longer than `trim_threshold` lines are trimmed
+        in the prompts; None, the default, disables the trimming.
+        `module_context` is the dictionary of the module summaries shared by
+        the files of a run, or None to document the file on its own.
+        If `source` is given, it is parsed instead of the file.
         """
         self.filepath = filepath
-        with open(filepath) as f:
-            self.tree = FortranAST(f.read())
+        self.trim_threshold = trim_threshold
+        self.module_context = module_context
+        if source is None:
+            with phase("read"), open(filepath, encoding="utf-8") as f:
+                source = f.read()
+        self.source = source
+        with phase("parse"):
+            self.tree = FortranAST(self.source)
+        self.modified = False
+
+    @classmethod
+    def from_string(cls, source:str, filepath:str="<string>", **kwargs) -> "FortranCode":
+        """Creates an instance from code in memory, without reading a file.
+        The documented code is taken with `to_str`.
+
+        Args:
+        ----
+            source (str): The Fortran code.
+            filepath (str, optional): The path the code is written to by
+            `write` and reported as. Defaults to '<string>'.
+            **kwargs: The other arguments of the constructor, e.g.
+            `trim_threshold`.
+
+        Returns:
+        -------
+            FortranCode: The parsed code.
+        """
+        return cls(filepath, source=source, **kwargs)
 
     def to_str(self) -> str:
-        """Converts the tree structure to a string representation.
+        """Converts the tree structure to a string representation. If no
+        documentation has been inserted, the original source is returned as
+        it is.
 
         Returns
         -------
             A string representation of the tree structure.
         """
-        return self.tree.to_str()
+        if not self.modified:
+            return self.source
+        with phase("to_str"):
+            return self.tree.to_str()
 
-    def write(self, filepath:Optional[str]=None) -> None:
-        """Writes the contents of the current object to a file.
+    def write(self, filepath:Optional[str]=None) -> bool:
+        """Writes the contents of the current object to a file. The file is
+        replaced atomically, and it is not written at all if its content is
+        already identical.
 
         Args:
         ----
@@ -92,7 +164,7 @@ class FortranCode:
 
         Returns:
         -------
-            None: This method does not return any value.
+            bool: True if the file was written, False if it was unchanged.
 
         Raises:
         ------
@@ -110,213 +182,363 @@ class FortranCode:
         """
         if filepath is None:
             filepath = self.filepath
-        with open(filepath, "w") as f:
-            f.write(self.to_str())
-            return None
+        text = self.to_str()
+        with phase("write"):
+            return write_if_changed(filepath, text)
 
-    def insert_docs(
-        self, engine:any, doc_model:DocModel, overwrite=False, progress_bar=progress_bar_nothing, **kwargs,
-    ) -> None:
-        """Inserts documents into a database engine.
+    def count_documentable(self, overwrite:bool=True) -> int:
+        """Returns the number of the nodes of the file that can be
+        documented, or, if `overwrite` is False, that have no documentation.
+        """
+        return self.tree.count_documentable(overwrite)
+
+    def touched_nodes(self, lines:list[tuple[int, int]]) -> set[StatementNode]:
+        """Returns the documentable nodes touched by the changed lines. A line
+        touches the innermost documentable node containing it, so a change
+        in a contained procedure touches the procedure only. Blank lines
+        touch no node.
 
         Args:
         ----
-            engine (any): The database engine to insert the documents into.
-            overwrite (bool, optional): If True, existing documents will be
-            overwritten. Defaults to False.
+            lines (list): The changed line ranges `(first, last)`, 1-based
+            and inclusive.
 
         Returns:
         -------
-            None
-        Raises:
-            None
-        This method iterates over all nodes in a tree and inserts their
-        documents into the specified database engine.
-        If the `overwrite` parameter is set to True, any existing documents with
-        the same ID will be overwritten.
-        Otherwise, the documents will be skipped.
+            set: The touched nodes.
         """
-        for node in progress_bar(self.tree.walk(), **kwargs):
-            self._insert_docs(node, engine, doc_model, overwrite)
+        nodes = list(self.tree.walk_documentable())
+        lines = drop_blank_lines(lines, self.source.splitlines())
+        spans = [(node.start + 1, node.end) for node in nodes]
+        return {nodes[i] for i in touched_spans(spans, lines)}
 
-    @singledispatchmethod
-    def _insert_docs(self, node:any, engine:Engine, doc_model:DocModel, overwrite:bool) -> None:
-        """Inserts documentation for a given node using the specified documentation
-        engine.
-
-        Args:
-        ----
-            node (any): The node for which documentation needs to be inserted.
-            engine (DocEngine): The documentation engine to be used for
-            inserting documentation.
-            overwrite (bool): A flag indicating whether to overwrite existing
-            documentation.
+    def private_nodes(self) -> set[StatementNode]:
+        """Returns the documentable nodes that are not part of the interface
+        of the file: the types and procedures of a module that are not
+        public (see `public_children`), the procedures contained in a
+        procedure and the nodes nested in them.
 
         Returns:
         -------
-            None.
+            set: The private nodes.
         """
-        pass
-
-    @_insert_docs.register
-    def _(self, node:ModuleNode, engine:Engine, doc_model:DocModel, overwrite:bool) -> None:
-        """This function is a decorator that registers a function to insert
-        documentation into a ModuleNode object.
-
-        Args:
-        ----
-            node (ModuleNode): A ModuleNode object representing the module to be
-            documented.
-            engine (DocEngine): A DocEngine object that generates the
-            documentation.
-            overwrite (bool): A boolean value indicating whether to overwrite
-            existing documentation or not.
+        private = set()
+        for node in self.tree.walk_documentable():
+            if node in private:
+                continue
+            if isinstance(node, ModuleNode):
+                hidden = [
+                    child for child in node.children
+                    if isinstance(child, (TypeNode, FunctionNode, SubroutineNode))
+                ]
+                public = set(public_children(node))
+                hidden = [child for child in hidden if child not in public]
+            elif isinstance(node, (FunctionNode, SubroutineNode)):
+                hidden = [child for child in node.children if isinstance(child, StatementNode)]
+            else:
+                continue
+            stack = hidden
+            while stack:
+                child = stack.pop()
+                if isinstance(child, StatementNode):
+                    private.add(child)
+                stack.extend(child.children)
+        return private
+
+    def node_ids(self) -> dict[StatementNode, str]:
+        """Returns ids of the documentable nodes that are stable as long as
+        the names of the nodes do not change: the names qualified by the
+        names of the enclosing nodes, e.g. 'module.procedure'. An unnamed
+        node is named after its kind, e.g. 'program', and a name defined
+        several times in the same scope is numbered in the order of the
+        file, e.g. 'f#2'.
 
         Returns:
         -------
-            None
-        Raises:
-            None
-        Notes:
-            If the module node does not have any documentation or if the
-            overwrite parameter is set to True, the function generates
-            documentation for the module using the DocEngine object and writes
-            it to the module node's doc attribute.
+            dict: The ids keyed by the nodes.
         """
-        if not node.doc or overwrite:
-            node.write_doc(
-                engine.generate_doc(
-                    node.to_str(),
-                    lang="Fortran",
-                    statement_kind="module",
-                    doc_format=doc_model.module_format()
-                ),
-            )
+        ids:dict[StatementNode, str] = {}
+        counts:dict[str, int] = {}
+        for node in self.tree.walk_documentable():
+            parent = node.parent
+            while parent is not None and parent not in ids:
+                parent = parent.parent
+            name = node.name or type(node).__name__[:-len("Node")].lower()
+            if parent is not None:
+                name = ids[parent] + "." + name
+            counts[name] = counts.get(name, 0) + 1
+            if counts[name] > 1:
+                name += f"#{counts[name]}"
+            ids[node] = name
+        return ids
+
+    def plan_stages(
+        self, doc_model:DocModel, overwrite=False, lines:Optional[list[tuple[int, int]]]=None,
+    ) -> Iterator[list[DocRequest]]:
+        """Yields the documentation requests of the nodes to be documented in
+        stages, without sending them. The documents of a stage are inserted
+        with `apply_doc`, in any order, before the next stage is requested.
+        A node using a module of the file that is documented in the same run
+        is requested in a later stage than the module, so the summary of the
+        documented module is given as its context. The code of a request
+        does not include the documentation inserted after it is made.
 
-    @_insert_docs.register
-    def _(self, node:FunctionNode, engine:Engine, doc_model:DocModel, overwrite:bool) -> None:
-        """This function is a decorator that registers a function to insert
-        documentation for a given FunctionNode object.
-
-        Parameters
-        ----------
-        - node: A FunctionNode object that represents the function for which
-        documentation is to be generated.
-        - engine: A DocEngine object that is used to generate the documentation
-        for the function.
-        - overwrite: A boolean value that determines whether to overwrite the
-        existing documentation for the function or not.
-        Description:
-        If the function node does not have any documentation or if the overwrite
-        parameter is set to True, the function generates the documentation for
-        the function using the DocEngine object and writes it to the
-        FunctionNode object's doc attribute.
+        Args:
+        ----
+            doc_model (DocModel): The model of the documentation format.
+            overwrite (bool, optional): If True, the nodes that already have
+            documentation are documented again. Defaults to False.
+            lines (list, optional): If given, only the nodes touched by
+            these changed line ranges are documented (see `touched_nodes`),
+            the documented ones too unless their documentation was changed
+            as well. Defaults to None, which documents all the nodes.
+
+        Yields:
+        ------
+            list[DocRequest]: The requests of a stage, in the order of the
+            tree.
         """
-        if not node.doc or overwrite:
-            node.write_doc(
-                engine.generate_doc(
-                    node.to_str(),
-                    lang="Fortran",
-                    statement_kind="function",
-                    doc_format=doc_model.function_format()
-                ),
-            )
-
-    @_insert_docs.register
-    def _(self, node:SubroutineNode, engine:Engine, doc_model:DocModel, overwrite:bool) -> None:
-        """This function is a decorator that registers a function to insert
-        documentation for a SubroutineNode object.
+        with phase("select"):
+            nodes = list(self._select_nodes(overwrite, lines)[0])
+        pending = set()
+        if self.module_context is not None:
+            pending = {node.name for node in nodes if isinstance(node, ModuleNode) and node.name}
+        while nodes:
+            with phase("select"):
+                ready = [
+                    node for node in nodes if not pending.intersection(self._used_modules(node))
+                ]
+            # Modules using each other are requested together.
+            ready = ready or nodes
+            yield list(self._requests(ready, doc_model))
+            pending.difference_update(node.name for node in ready if isinstance(node, ModuleNode))
+            ready = set(ready)
+            nodes = [node for node in nodes if node not in ready]
+
+    def apply_doc(self, request:DocRequest, doc:str) -> None:
+        """Inserts the documentation received for a request of `plan_stages`.
+        The summary of a documented module is registered to the module
+        context.
 
         Args:
         ----
-            node (SubroutineNode): A SubroutineNode object.
-            engine (DocEngine): A DocEngine object.
-            overwrite (bool): A boolean value indicating whether to overwrite
-            existing documentation or not.
-
-        Returns:
-        -------
-            None
-        Description:
-            If the node object does not have any documentation or if the
-            overwrite parameter is set to True, the function generates
-            documentation for the node using the DocEngine object and writes it
-            to the node's doc attribute.
+            request (DocRequest): The request.
+            doc (str): The documentation generated for it.
         """
-        if not node.doc or overwrite:
-            node.write_doc(
-                engine.generate_doc(
-                    node.to_str(),
-                    lang="Fortran",
-                    statement_kind="subroutine",
-                    doc_format=doc_model.function_format()
-                ),
-            )
+        with phase("apply"):
+            request.node.write_doc(doc)
+        self.modified = True
+        if isinstance(request.node, ModuleNode):
+            self._register_module(request.node)
 
-    @_insert_docs.register
-    def _(self, node:TypeNode, engine:Engine, doc_model:DocModel, overwrite:bool) -> None:
-        """This function is a decorator that registers a function to insert
-        documentation for a TypeNode object.
+    def insert_docs(
+        self, engine:any, doc_model:DocModel, overwrite=False, progress_bar=progress_bar_nothing,
+        lines:Optional[list[tuple[int, int]]]=None, **kwargs,
+    ) -> None:
+        """Inserts documents into a database engine.
 
         Args:
         ----
-            node (TypeNode): A TypeNode object for which documentation needs to
-            be inserted.
-            engine (DocEngine): A DocEngine object that generates documentation
-            for the TypeNode object.
-            overwrite (bool): A boolean value that determines whether to
-            overwrite existing documentation or not.
+            engine (any): The database engine to insert the documents into.
+            overwrite (bool, optional): If True, existing documents will be
+            overwritten. Defaults to False.
+            lines (list, optional): If given, only the nodes touched by
+            these changed line ranges are documented (see `touched_nodes`),
+            the documented ones too unless their documentation was changed
+            as well. Defaults to None, which documents all the nodes.
 
         Returns:
         -------
             None
         Raises:
             None
-        Notes:
-            If the TypeNode object does not have any documentation or if the
-            overwrite parameter is set to True, the function generates
-            documentation for the TypeNode object using the DocEngine object and
-            inserts it into the TypeNode object.
+        This method sends the requests of `plan_stages` to the engine one
+        by one through a `pipeline` per stage, which prepares the prompts
+        ahead while a request is in flight, and inserts each document with
+        `apply_doc`. A stage is planned once the documents of the previous
+        one are inserted. The number of the nodes is passed to the progress
+        bar as `total`.
+        If the `overwrite` parameter is set to True, any existing documents with
+        the same ID will be overwritten.
+        Otherwise, the documents will be skipped.
         """
-        if not node.doc or overwrite:
-            node.write_doc(
-                engine.generate_doc(
-                    node.to_str(),
-                    lang="Fortran",
-                    statement_kind="type",
-                    doc_format=doc_model.class_format()
-                ),
+        with phase("select"):
+            total = self._select_nodes(overwrite, lines)[1]
+        documents = (
+            document for stage in self.plan_stages(doc_model, overwrite, lines)
+            for document in pipeline(stage, engine)
+        )
+        for request, doc in progress_bar(documents, total=total, **kwargs):
+            self.apply_doc(request, doc)
+        self.register_modules()
+
+    def _select_nodes(
+        self, overwrite:bool, lines:Optional[list[tuple[int, int]]]
+    ) -> tuple[Iterable[StatementNode], int]:
+        """Returns the nodes to be documented and their number. If `lines`
+        is given, a touched node that has a documentation comment is
+        documented again, since its comment may be stale, unless the comment
+        was changed too, i.e. it was written along with the code.
+        """
+        if lines is None:
+            return self.tree.walk_documentable(overwrite), self.tree.count_documentable(overwrite)
+        touched = self.touched_nodes(lines)
+        nodes = [
+            node for node in self.tree.walk_documentable()
+            if node in touched and (
+                overwrite or not node.has_doc
+                or not overlaps((node.statement_end + 1, node.body_start), lines)
             )
+        ]
+        return nodes, len(nodes)
+
+    def _requests(self, nodes:Iterable[StatementNode], doc_model:DocModel) -> Iterator[DocRequest]:
+        with phase("select"):
+            private = self.private_nodes()
+        for node in nodes:
+            with phase("request"):
+                request = self._request(node, doc_model)
+            if request is not None:
+                request.public = node not in private
+                yield request
+
+    def register_modules(self) -> None:
+        """Registers the summaries of the modules defined in the file to the
+        module context. It is done by `insert_docs`, and has to be done
+        explicitly for a file that is not documented in the run.
+        """
+        for node in self.tree.walk():
+            if isinstance(node, ModuleNode):
+                self._register_module(node)
+
+    def _register_module(self, node:ModuleNode) -> None:
+        if self.module_context is not None and node.name:
+            self.module_context[node.name] = module_summary(node)
+
+    def _context(self, node:StatementNode) -> Optional[str]:
+        """Returns the summaries of the modules the node uses (see
+        `_used_modules`), or None if there are none.
+        """
+        if not self.module_context:
+            return None
+        summaries = [
+            self.module_context[name] for name in self._used_modules(node)
+            if name in self.module_context
+        ]
+        if not summaries:
+            return None
+        return (os.linesep * 2).join(summaries)
+
+    def _used_modules(self, node:StatementNode) -> list[str]:
+        """Returns the lower-cased names of the modules the node uses,
+        directly or through its enclosing blocks. The `use` statements are
+        searched in the specification part of the node and of its
+        ancestors, which ends at their first block.
+        """
+        used = []
+        current = node
+        while current is not None:
+            if isinstance(current, StatementNode):
+                spec_end = next(
+                    (c.start for c in current.children if isinstance(c, StatementNode)),
+                    current.end - 1,
+                )
+                for name in sorted(scan_modules(current.buffer.text(current.body_start, spec_end))[1]):
+                    if name not in used and name != node.name:
+                        used.append(name)
+            current = current.parent
+        return used
+
+    def _prompt(self, node:StatementNode) -> str:
+        """Returns the code of the node sent to the engine, which is trimmed
+        by `trim_node` if the node is longer than `trim_threshold` lines.
+        """
+        if self.trim_threshold is None:
+            return node.to_str()
+        return trim_node(node, self.trim_threshold)
 
-    @_insert_docs.register
-    def _(self, node:ProgramNode, engine:Engine, doc_model:DocModel, overwrite:bool) -> None:
-        """The following is a suggested docstring for the given Python code:
-        ```python
-        Registers a function to insert documentation for a ProgramNode object
-        into a DocEngine object. If the ProgramNode object does not have
-        documentation or the overwrite flag is set to True, the function
-        generates documentation using the DocEngine object's generate_code_doc
-        method and writes it to the ProgramNode object's doc attribute.
+    @singledispatchmethod
+    def _request(self, node:any, doc_model:DocModel) -> Optional[DocRequest]:
+        """Makes the documentation request of a given node.
 
         Args:
         ----
-            node (ProgramNode): The ProgramNode object to insert documentation
-            for.
-            engine (DocEngine): The DocEngine object to use for generating
-            documentation.
-            overwrite (bool): A flag indicating whether to overwrite existing
-            documentation for the ProgramNode object.
+            node (any): The node for which documentation is requested.
+            doc_model (DocModel): The model of the documentation format.
 
         Returns:
         -------
-            None.
+            DocRequest, optional: The request, or None if the node cannot
+            be documented.
         """
-        if not node.doc or overwrite:
-            node.write_doc(
-                engine.generate_doc(
-                    node.to_str(),
-                    lang="Fortran",
-                    statement_kind="code",
-                    doc_format=doc_model.application_format()
-                ),
-            )
+        return None
+
+    @_request.register
+    def _(self, node:ModuleNode, doc_model:DocModel) -> DocRequest:
+        """Makes the documentation request of a ModuleNode object, with the
+        summaries of the modules it uses as context.
+        """
+        return DocRequest(
+            node,
+            self._prompt(node),
+            lang="Fortran",
+            statement_kind="module",
+            doc_format=doc_model.module_format(),
+            context=self._context(node)
+        )
+
+    @_request.register
+    def _(self, node:FunctionNode, doc_model:DocModel) -> DocRequest:
+        """Makes the documentation request of a FunctionNode object, which
+        uses the function format of the documentation model.
+        """
+        return DocRequest(
+            node,
+            self._prompt(node),
+            lang="Fortran",
+            statement_kind="function",
+            doc_format=doc_model.function_format(),
+            context=self._context(node)
+        )
+
+    @_request.register
+    def _(self, node:SubroutineNode, doc_model:DocModel) -> DocRequest:
+        """Makes the documentation request of a SubroutineNode object, which
+        uses the function format of the documentation model.
+        """
+        return DocRequest(
+            node,
+            self._prompt(node),
+            lang="Fortran",
+            statement_kind="subroutine",
+            doc_format=doc_model.function_format(),
+            context=self._context(node)
+        )
+
+    @_request.register
+    def _(self, node:TypeNode, doc_model:DocModel) -> DocRequest:
+        """Makes the documentation request of a TypeNode object. The code of
+        a derived type is never trimmed.
+        """
+        return DocRequest(
+            node,
+            node.to_str(),
+            lang="Fortran",
+            statement_kind="type",
+            doc_format=doc_model.class_format(),
+            context=self._context(node)
+        )
+
+    @_request.register
+    def _(self, node:ProgramNode, doc_model:DocModel) -> DocRequest:
+        """Makes the documentation request of a ProgramNode object, which
+        uses the application format of the documentation model.
+        """
+        return DocRequest(
+            node,
+            self._prompt(node),
+            lang="Fortran",
+            statement_kind="code",
+            doc_format=doc_model.application_format(),
+            context=self._context(node)
+        )
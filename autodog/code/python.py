@@ -2,9 +2,12 @@
 a file. It can parse the code into an abstract syntax tree, convert the
 tree back to a string, write the code to a file, and insert
 documentation strings generated by a `DocEngine` object into the code.
-The module also includes helper functions `offset_lines` and
-`insert_docstring`. The `offset_lines` function takes in a string `doc`
-and an integer `level` as input and returns a modified string with each
+The module also includes helper functions `walk_documentable`,
+`count_documentable`, `offset_lines` and `insert_docstring`. The
+`walk_documentable` function yields the nodes that can be documented
+and `count_documentable` counts them. The `offset_lines` function takes
+in a string `doc` and an integer `level` as input and returns a
+modified string with each
 line of the input string indented by `level` spaces, except for the
 first and last lines. The `insert_docstring` function adds a docstring
 to the given AST node. The node can be of type `ast.AsyncFunctionDef`,
@@ -18,11 +21,16 @@ of the node's body.
 """
 import ast
 import os
+import re
+import textwrap
 from functools import singledispatchmethod
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 
-from autodog.engine.base import Engine
+from autodog.engine.request import DocRequest, pipeline
 from autodog.docmodel.base import DocModel
+from autodog.utils.fileio import write_if_changed
+from autodog.utils.gitdiff import drop_blank_lines, overlaps, touched_spans
+from autodog.utils.profiling import phase
 from autodog.utils.progress import progress_bar_nothing
 
 
@@ -54,21 +62,20 @@ class PyCode:
     the documentation strings into, and `overwrite` (optional), which is a
     boolean value that determines whether to overwrite existing
     documentation strings in the database. The function returns `None`.
+    - `plan_stages(self, doc_model, overwrite=False, lines=None)`: Yields the
+    documentation requests of the nodes in stages without sending them.
+    - `apply_doc(self, request, doc) -> None`: Inserts the documentation
+    received for a request.
     Private Methods:
     - `_write_to_original(self) -> None`: The `_write_to_original` method
     writes the string representation of the object to the file specified by
     `self.filepath`. It takes no arguments and returns nothing (`None`).
-    - `_insert_docs(self, node: any, engine: DocEngine, overwrite: bool) ->
-    None`: The `_insert_docs` function is a decorated method that inserts
-    documentation for a given node using the specified documentation engine.
-    It takes three arguments: `node`, which is the node for which
-    documentation needs to be inserted, `engine`, which is the documentation
-    engine to be used for inserting documentation, and `overwrite`, which is
-    a flag indicating whether to overwrite existing documentation. The
-    function returns `None`.
+    - `_request(self, node: any, doc_model: DocModel) -> DocRequest`: The
+    `_request` function is a decorated method that makes the documentation
+    request of a given node.
     """
 
-    def __init__(self, filepath: str) -> None:
+    def __init__(self, filepath: str, source: Optional[str] = None) -> None:
         """Initialize a new instance of the class with the given file path. The
         file is opened in read mode and its contents are parsed using the ast
         module. The resulting abstract syntax tree is stored in the 'tree'
@@ -76,6 +83,8 @@ class PyCode:
         :param filepath: A string representing the path to the file to be
         parsed.
         :type filepath: str
+        :param source: The code. If it is given, the file is not read.
+        :type source: str, optional
         :return: None
         :rtype: None
         The docstring provides a brief description of the function, its
@@ -83,11 +92,36 @@ class PyCode:
         does and how it works.
         """
         self.filepath = filepath
-        with open(filepath) as f:
-            self.tree = ast.parse(f.read())
+        if source is None:
+            with phase("read"), open(filepath, encoding="utf-8") as f:
+                source = f.read()
+        self.source = source
+        with phase("parse"):
+            self.tree = ast.parse(self.source)
+        self.modified = False
+        self._line_starts:Optional[list[int]] = None
+
+    @classmethod
+    def from_string(cls, source:str, filepath:str="<string>") -> "PyCode":
+        """Creates an instance from code in memory, without reading a file.
+        The documented code is taken with `to_str`.
+
+        Args:
+        ----
+            source (str): The Python code.
+            filepath (str, optional): The path the code is written to by
+            `write` and reported as. Defaults to '<string>'.
+
+        Returns:
+        -------
+            PyCode: The parsed code.
+        """
+        return cls(filepath, source=source)
 
     def to_str(self) -> str:
         """Converts an abstract syntax tree (AST) to a string representation.
+        If no documentation has been inserted, the original source is
+        returned as it is.
 
         Args:
         ----
@@ -101,10 +135,55 @@ class PyCode:
         ------
             None.
         """
-        return ast.unparse(self.tree)
+        if not self.modified:
+            return self.source
+        with phase("to_str"):
+            return ast.unparse(self.tree)
+
+    def source_segment(self, node:ast.AST) -> str:
+        """Returns the source code of the node, taken from the original
+        source. The decorators of a function or a class are included and the
+        code is dedented.
+        Unlike `ast.get_source_segment`, which splits the whole source at
+        every call, the offsets of the lines are computed once per file, so
+        the cost of a call is the length of the segment only.
+
+        Args:
+        ----
+            node (ast.AST): A node of `self.tree` with a location.
+
+        Returns:
+        -------
+            str: The source code of the node.
+        """
+        if isinstance(node, ast.Module):
+            return self.source
+        if self._line_starts is None:
+            self._line_starts = [0] + [
+                m.end() for m in _NEWLINE_PATTERN.finditer(self.source)
+            ]
+        lineno = min(
+            [node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])]
+        )
+        start = self._line_starts[lineno - 1]
+        end = self._char_offset(node.end_lineno, node.end_col_offset)
+        return textwrap.dedent(self.source[start:end])
 
-    def write(self, filepath:Optional[str]=None) -> None:
-        """Writes the contents of the current object to a file.
+    def _char_offset(self, lineno:int, col_offset:int) -> int:
+        """Converts a line number and a column offset, which `ast` counts in
+        UTF-8 bytes, to an offset in `self.source`.
+        """
+        line_start = self._line_starts[lineno - 1]
+        line = self.source[line_start:line_start + col_offset]
+        if line.isascii():
+            return line_start + col_offset
+        prefix = line.encode("utf-8")[:col_offset].decode("utf-8", errors="ignore")
+        return line_start + len(prefix)
+
+    def write(self, filepath:Optional[str]=None) -> bool:
+        """Writes the contents of the current object to a file. The file is
+        replaced atomically, and it is not written at all if its content is
+        already identical.
 
         Args:
         ----
@@ -113,7 +192,7 @@ class PyCode:
 
         Returns:
         -------
-            None: This method does not return any value.
+            bool: True if the file was written, False if it was unchanged.
 
         Raises:
         ------
@@ -128,12 +207,124 @@ class PyCode:
         """
         if filepath is None:
             filepath = self.filepath
-        with open(filepath, "w") as f:
-            f.write(self.to_str())
-            return None
+        text = self.to_str()
+        with phase("write"):
+            return write_if_changed(filepath, text)
+
+    def count_documentable(self, overwrite:bool=True) -> int:
+        """Returns the number of the nodes of the file that can be
+        documented, or, if `overwrite` is False, that have no documentation.
+        """
+        return count_documentable(self.tree, overwrite)
+
+    def touched_nodes(self, lines:list[tuple[int, int]]) -> set[ast.AST]:
+        """Returns the documentable nodes touched by the changed lines. A line
+        touches the innermost documentable node containing it, so a change
+        in a method touches the method only. Blank lines touch no node.
+
+        Args:
+        ----
+            lines (list): The changed line ranges `(first, last)`, 1-based
+            and inclusive.
+
+        Returns:
+        -------
+            set: The touched nodes.
+        """
+        nodes = list(walk_documentable(self.tree))
+        source_lines = self.source.splitlines()
+        lines = drop_blank_lines(lines, source_lines)
+        n_lines = max(1, len(source_lines))
+        spans = [
+            (1, n_lines) if isinstance(node, ast.Module) else (
+                min([node.lineno] + [d.lineno for d in node.decorator_list]),
+                node.end_lineno,
+            )
+            for node in nodes
+        ]
+        return {nodes[i] for i in touched_spans(spans, lines)}
+
+    def private_nodes(self) -> set[ast.AST]:
+        """Returns the documentable nodes that are not part of the interface
+        of the module: the classes and functions whose name starts with an
+        underscore, except the special methods, the nodes nested in them and
+        the nodes nested in functions.
+
+        Returns:
+        -------
+            set: The private nodes.
+        """
+        private = set()
+        for node in walk_documentable(self.tree):
+            if node in private or isinstance(node, ast.Module):
+                continue
+            if _is_private_name(node.name):
+                private.update(
+                    n for n in ast.walk(node) if isinstance(n, _DOCUMENTABLE_NODES)
+                )
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                private.update(
+                    n for n in ast.walk(node)
+                    if n is not node and isinstance(n, _DOCUMENTABLE_NODES)
+                )
+        return private
+
+    def node_ids(self) -> dict[ast.AST, str]:
+        """Returns ids of the documentable nodes that are stable as long as
+        the names of the nodes do not change: the qualified names, e.g.
+        'Class.method', and '<module>' for the module. A name defined
+        several times in the same scope is numbered in the order of the
+        file, e.g. 'f#2'.
+
+        Returns:
+        -------
+            dict: The ids keyed by the nodes.
+        """
+        return qualified_names(self.tree)
+
+    def plan_stages(
+        self, doc_model:DocModel, overwrite=False, lines:Optional[list[tuple[int, int]]]=None,
+    ) -> Iterator[list[DocRequest]]:
+        """Yields the documentation requests of the nodes to be documented in
+        stages, without sending them. The documents of a stage are inserted
+        with `apply_doc`, in any order, before the next stage is requested.
+        The requests of Python code do not depend on each other, so there is
+        a single stage.
+
+        Args:
+        ----
+            doc_model (DocModel): The model of the documentation format.
+            overwrite (bool, optional): If True, the nodes that already have
+            a docstring are documented again. Defaults to False.
+            lines (list, optional): If given, only the nodes touched by
+            these changed line ranges are documented (see `touched_nodes`),
+            the documented ones too unless their documentation was changed
+            as well. Defaults to None, which documents all the nodes.
+
+        Yields:
+        ------
+            list[DocRequest]: The requests of a stage, in the order of
+            `walk_documentable`.
+        """
+        with phase("select"):
+            nodes = list(self._select_nodes(overwrite, lines)[0])
+        yield list(self._requests(nodes, doc_model))
+
+    def apply_doc(self, request:DocRequest, doc:str) -> None:
+        """Inserts the documentation received for a request of `plan_stages`.
+
+        Args:
+        ----
+            request (DocRequest): The request.
+            doc (str): The documentation generated for it.
+        """
+        with phase("apply"):
+            insert_docstring(request.node, doc)
+        self.modified = True
 
     def insert_docs(
-        self, engine:any, doc_model:DocModel, overwrite=False, progress_bar=progress_bar_nothing, **kwargs,
+        self, engine:any, doc_model:DocModel, overwrite=False, progress_bar=progress_bar_nothing,
+        lines:Optional[list[tuple[int, int]]]=None, **kwargs,
     ) -> None:
         """Inserts documentation strings for all nodes in the abstract syntax tree
         of the current object into the specified database engine.
@@ -146,6 +337,10 @@ class PyCode:
             documentation strings in the database. Defaults to False.
             progress_bar (callable, optional): Progress bar function. Defaults
             to progress_bar_nothing.
+            lines (list, optional): If given, only the nodes touched by
+            these changed line ranges are documented (see `touched_nodes`),
+            the documented ones too unless their documentation was changed
+            as well. Defaults to None, which documents all the nodes.
             **kwargs: Additional keyword arguments to be passed to the progress
             bar function.
 
@@ -153,146 +348,179 @@ class PyCode:
         -------
             None
         Description:
-            The `insert_docs` function iterates over all nodes in the abstract
-            syntax tree using the `ast.walk` method and calls the `_insert_docs`
-            method for each node, passing in the node, the database engine, and
-            the `overwrite` flag.
+            The `insert_docs` function sends the requests of the nodes to
+            the engine one by one through a `pipeline`, which builds the
+            next requests and their prompts while a request is in flight,
+            and inserts each document with `apply_doc`. The number of the
+            nodes is passed to the progress bar as `total`.
         """
-        for node in progress_bar(ast.walk(self.tree), **kwargs):
-            self._insert_docs(node, engine, doc_model, overwrite)
+        with phase("select"):
+            nodes, total = self._select_nodes(overwrite, lines)
+            # The nodes are listed before the tree is modified.
+            nodes = list(nodes)
+        requests = self._requests(nodes, doc_model)
+        for request, doc in progress_bar(pipeline(requests, engine), total=total, **kwargs):
+            self.apply_doc(request, doc)
+
+    def _select_nodes(
+        self, overwrite:bool, lines:Optional[list[tuple[int, int]]]
+    ) -> tuple[Iterable[ast.AST], int]:
+        """Returns the nodes to be documented and their number. If `lines`
+        is given, a touched node that has a docstring is documented again,
+        since its docstring may be stale, unless the docstring was changed
+        too, i.e. it was written along with the code.
+        """
+        if lines is None:
+            return walk_documentable(self.tree, overwrite), count_documentable(self.tree, overwrite)
+        touched = self.touched_nodes(lines)
+        nodes = [
+            node for node in walk_documentable(self.tree)
+            if node in touched and (
+                overwrite or ast.get_docstring(node) is None
+                or not overlaps((node.body[0].lineno, node.body[0].end_lineno), lines)
+            )
+        ]
+        return nodes, len(nodes)
+
+    def _requests(self, nodes:Iterable[ast.AST], doc_model:DocModel) -> Iterator[DocRequest]:
+        with phase("select"):
+            private = self.private_nodes()
+        for node in nodes:
+            with phase("request"):
+                request = self._request(node, doc_model)
+            if request is not None:
+                request.public = node not in private
+                yield request
 
     @singledispatchmethod
-    def _insert_docs(self, node:any, engine:Engine, doc_model:DocModel, overwrite:bool) -> None:
-        """The `_insert_docs` function is a decorated method that inserts
-        documentation for a given node using the specified documentation engine.
+    def _request(self, node:any, doc_model:DocModel) -> Optional[DocRequest]:
+        """The `_request` function is a decorated method that makes the
+        documentation request of a given node.
 
         Args:
         ----
-            node (any): The node for which documentation needs to be inserted.
-            engine (DocEngine): The documentation engine to be used for
-            inserting documentation.
-            overwrite (bool): A flag indicating whether to overwrite existing
-            documentation.
+            node (any): The node for which documentation is requested.
+            doc_model (DocModel): The model of the documentation format.
 
         Returns:
         -------
-            None.
+            DocRequest, optional: The request, or None if the node cannot
+            be documented.
         """
-        pass
+        return None
 
-    @_insert_docs.register
-    def _(self, node:ast.Module, engine:Engine, doc_model:DocModel, overwrite:bool) -> None:
-        """Registers a function `_` to insert documentation into a given
-        `ast.Module` node using a specified `DocEngine`.
-        If the `node` already has a docstring or `overwrite` is set to `True`,
-        the function generates a new documentation using the `DocEngine` and
-        inserts it into the `node`.
+    @_request.register
+    def _(self, node:ast.Module, doc_model:DocModel) -> DocRequest:
+        """Makes the documentation request of an `ast.Module` node, whose
+        code is the whole source of the module.
+        """
+        return DocRequest(
+            node,
+            self.source_segment(node),
+            lang="Python",
+            statement_kind="module",
+            doc_format=doc_model.module_format()
+        )
 
-        Args:
-        ----
-            node (ast.Module): The `ast.Module` node to insert documentation
-            into.
-            engine (DocEngine): The `DocEngine` to use for generating
-            documentation.
-            overwrite (bool): A flag indicating whether to overwrite an existing
-            docstring in the `node`.
+    @_request.register
+    def _(self, node:ast.FunctionDef, doc_model:DocModel) -> DocRequest:
+        """Makes the documentation request of a function definition. The
+        code of the request is the original source code of the `node` and
+        the language is set to Python.
+        """
+        return DocRequest(
+            node,
+            self.source_segment(node),
+            lang="Python",
+            statement_kind="function",
+            doc_format=doc_model.function_format()
+        )
 
-        Returns:
-        -------
-            None.
+    @_request.register
+    def _(self, node:ast.AsyncFunctionDef, doc_model:DocModel) -> DocRequest:
+        """Makes the documentation request of an async function definition,
+        which uses the function format of the documentation model.
         """
-        if ast.get_docstring(node) is None or overwrite:
-            doc = engine.generate_doc(
-                ast.unparse(node),
-                lang="Python",
-                statement_kind="module",
-                doc_format=doc_model.module_format()
-            )
-            insert_docstring(node, doc)
+        return DocRequest(
+            node,
+            self.source_segment(node),
+            lang="Python",
+            statement_kind="async function",
+            doc_format=doc_model.function_format()
+        )
 
-    @_insert_docs.register
-    def _(self, node:ast.FunctionDef, engine:Engine, doc_model:DocModel, overwrite:bool) -> None:
-        """This function is a decorator that registers a function to insert
-        docstrings into Python code.
+    @_request.register
+    def _(self, node:ast.ClassDef, doc_model:DocModel) -> DocRequest:
+        """Makes the documentation request of a class definition, which uses
+        the class format of the documentation model.
+        """
+        return DocRequest(
+            node,
+            self.source_segment(node),
+            lang="Python",
+            statement_kind="class",
+            doc_format=doc_model.class_format()
+        )
 
-        Args:
-        ----
-            node (ast.FunctionDef): An AST node representing a function
-            definition.
-            engine (DocEngine): A `DocEngine` object used to generate the
-            docstring.
-            overwrite (bool): A boolean indicating whether to overwrite an
-            existing docstring.
 
-        Returns:
-        -------
-            None
-        Description:
-            If the `node` does not have a docstring or `overwrite` is `True`,
-            the function generates a docstring using the `DocEngine` object and
-            inserts it into the `node` using the `insert_docstring` function.
-            The generated docstring is based on the unparsed source code of the
-            `node` and the language is set to Python.
-        """
-        if ast.get_docstring(node) is None or overwrite:
-            doc = engine.generate_doc(
-                ast.unparse(node),
-                lang="Python",
-                statement_kind="function",
-                doc_format=doc_model.function_format()
-            )
-            insert_docstring(node, doc)
-
-    @_insert_docs.register
-    def _(self, node:ast.AsyncFunctionDef, engine:Engine, doc_model:DocModel, overwrite:bool) -> None:
-        """Registers a function `_insert_docs` that takes in a node of type
-        `ast.AsyncFunctionDef`, a `DocEngine` object, and a boolean `overwrite`.
-        If the node already has a docstring or `overwrite` is True, the function
-        generates a new docstring using the `generate_func_doc` method of the
-        `DocEngine` object and inserts it into the node using the
-        `insert_docstring` function. The function does not return anything.
-        """
-        if ast.get_docstring(node) is None or overwrite:
-            doc = engine.generate_doc(
-                ast.unparse(node),
-                lang="Python",
-                statement_kind="async function",
-                doc_format=doc_model.function_format()
-            )
-            insert_docstring(node, doc)
+_NEWLINE_PATTERN = re.compile(r"\r\n|\r|\n")
+_DOCUMENTABLE_NODES = (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)
 
-    @_insert_docs.register
-    def _(self, node:ast.ClassDef, engine:Engine, doc_model:DocModel, overwrite:bool) -> None:
-        """This function is a decorator that registers a function to insert a
-        docstring for a Python class definition.
 
-        Args:
-        ----
-            node (ast.ClassDef): An AST (Abstract Syntax Tree) `ClassDef` node
-            representing the class definition.
-            engine (DocEngine): A `DocEngine` object used to generate the class
-            documentation.
-            overwrite (bool): A boolean value indicating whether to overwrite an
-            existing docstring or not.
+def walk_documentable(tree:ast.AST, overwrite:bool=True) -> Iterator[ast.AST]:
+    """Yields the nodes of the tree that can be documented, in the order of
+    `ast.walk`.
 
-        Returns:
-        -------
-            None
-        Description:
-            If the class definition already has a docstring or the `overwrite`
-            parameter is `True`, the function generates a new docstring using
-            the `DocEngine` object and inserts it into the class definition
-            using the `insert_docstring` function. The function does not return
-            anything.
-        """
-        if ast.get_docstring(node) is None or overwrite:
-            doc = engine.generate_doc(
-                ast.unparse(node),
-                lang="Python",
-                statement_kind="class",
-                doc_format=doc_model.class_format()
-            )
-            insert_docstring(node, doc)
+    Args:
+    ----
+        tree (ast.AST): The abstract syntax tree.
+        overwrite (bool, optional): If False, the nodes that already have a
+        docstring are skipped. Defaults to True.
+
+    Yields:
+    ------
+        ast.AST: A module, class, function or async function node.
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, _DOCUMENTABLE_NODES) and (
+            overwrite or ast.get_docstring(node) is None
+        ):
+            yield node
+
+
+def qualified_names(tree:ast.Module) -> dict[ast.AST, str]:
+    """Returns the qualified names of the documentable nodes of a module
+    tree (see `PyCode.node_ids`).
+    """
+    names = {tree: "<module>"}
+    counts:dict[str, int] = {}
+    stack = [(tree, "")]
+    while stack:
+        node, prefix = stack.pop()
+        children = []
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, _DOCUMENTABLE_NODES):
+                name = prefix + child.name
+                counts[name] = counts.get(name, 0) + 1
+                if counts[name] > 1:
+                    name += f"#{counts[name]}"
+                names[child] = name
+                children.append((child, name + "."))
+            else:
+                children.append((child, prefix))
+        stack.extend(reversed(children))
+    return names
+
+
+def _is_private_name(name:str) -> bool:
+    return name.startswith("_") and not (name.startswith("__") and name.endswith("__"))
+
+
+def count_documentable(tree:ast.AST, overwrite:bool=True) -> int:
+    """Returns the number of the nodes `walk_documentable` yields, without
+    building a list of them.
+    """
+    return sum(1 for _ in walk_documentable(tree, overwrite))
 
 
 def offset_lines(doc:str, level:int) -> str:
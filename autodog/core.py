@@ -11,23 +11,18 @@ raises an `UnknownFileExtension` exception if the file extension is not
 recognized.
 Note that the `FortranCode` and `PyCode` classes are imported from other
 modules, and the `ChatGPTEngine` and `DummyEngine` classes are imported
-from submodules of the `engine` module.
-The module also defines two custom exceptions: `UnknownEngineName` and
-`UnknownFileExtension`. These exceptions can be raised when encountering
-unknown engine names or file extensions, respectively.
+from submodules of the `engine` module. They are imported when they are
+first needed, so that importing this module stays cheap: in particular,
+the `openai` package is loaded only when a `ChatGPTEngine` is created.
+The `code_from_string` function does the same for code held in memory,
+given its language.
+The module also defines the custom exceptions `UnknownEngineName`,
+`UnknownFileExtension` and `UnknownLanguage`. These exceptions can be
+raised when encountering unknown engine names, file extensions or
+languages, respectively.
 """
 import os
 
-from autodog.code.fortran import FortranCode
-from autodog.code.python import PyCode
-from autodog.engine.chatgpt import ChatGPTEngine
-from autodog.engine.dummy import DummyEngine
-from autodog.docmodel.docstring import Docstring
-from autodog.docmodel.google import GoogleStyleDocstring
-from autodog.docmodel.javadoc import Javadoc
-from autodog.docmodel.numpy import NumpyStyleDocstring
-from autodog.docmodel.restructuredtext import ReStructuredText
-
 class UnknownEngineName(Exception):
     pass
 
@@ -37,6 +32,12 @@ class UnknownFileExtension(Exception):
 class UnknownDocType(Exception):
     pass
 
+class UnknownLanguage(Exception):
+    pass
+
+# The languages of `code_from_string`.
+LANGUAGES = ("python", "fortran")
+
 def engine(name:str="chatgpt", **kwargs):
     """The `engine` function is a factory function that returns an instance of
     a chatbot engine based on the `name` parameter passed to it.
@@ -59,8 +60,10 @@ def engine(name:str="chatgpt", **kwargs):
     engine('chatgpt', model='gpt2', temperature=0.7).
     """
     if name == "chatgpt":
+        from autodog.engine.chatgpt import ChatGPTEngine
         return ChatGPTEngine(**kwargs)
     elif name == "dummy":
+        from autodog.engine.dummy import DummyEngine
         return DummyEngine(**kwargs)
     raise UnknownEngineName(f"{name} is not supported.")
 
@@ -70,25 +73,63 @@ def code(filepath:str, **kwargs):
     instance of the corresponding class.
     :param filepath: A string representing the path to the code file.
     :type filepath: str
+    :param kwargs: Options of FortranCode, e.g. `trim_threshold`. They are
+        ignored for Python code.
     :return: An instance of either FortranCode or PyCode class.
     :raises UnknownFileExtension: If the file extension is not recognized.
     """
     extension = os.path.splitext(filepath)[1][1:]
-    if any(s in extension.lower() for s in ["f", "f90"]):
-        return FortranCode(filepath)
+    if is_fortran(filepath):
+        from autodog.code.fortran import FortranCode
+        return FortranCode(filepath, **kwargs)
     elif "py" in extension.lower():
+        from autodog.code.python import PyCode
         return PyCode(filepath)
     raise UnknownFileExtension(f"{extension} is not supported.")
 
+def code_from_string(source:str, lang:str, filepath:str="<string>", **kwargs):
+    """Parse code held in memory and return an instance of the class of its
+    language, without reading a file.
+    :param source: The code.
+    :type source: str
+    :param lang: The language of the code, 'python' or 'fortran'. It is
+        case-insensitive.
+    :type lang: str
+    :param filepath: The path the code is reported as. Defaults to
+        '<string>'.
+    :type filepath: str
+    :param kwargs: Options of FortranCode, e.g. `trim_threshold`. They are
+        ignored for Python code.
+    :return: An instance of either FortranCode or PyCode class.
+    :raises UnknownLanguage: If the language is not supported.
+    """
+    if lang.lower() == "fortran":
+        from autodog.code.fortran import FortranCode
+        return FortranCode.from_string(source, filepath, **kwargs)
+    elif lang.lower() == "python":
+        from autodog.code.python import PyCode
+        return PyCode.from_string(source, filepath)
+    raise UnknownLanguage(f"{lang} is not supported.")
+
+def is_fortran(filepath:str) -> bool:
+    """Returns True if the file extension is one of a Fortran file."""
+    extension = os.path.splitext(filepath)[1][1:]
+    return any(s in extension.lower() for s in ["f", "f90"])
+
 def doc_model(model_name:str="google style docstring", **kwarg):
     if model_name == "docstring":
+        from autodog.docmodel.docstring import Docstring
         return Docstring(**kwarg)
     elif model_name == "google style docstring":
+        from autodog.docmodel.google import GoogleStyleDocstring
         return GoogleStyleDocstring(**kwarg)
     elif model_name == "numpy style docstring":
+        from autodog.docmodel.numpy import NumpyStyleDocstring
         return NumpyStyleDocstring(**kwarg)
     elif model_name == "reStructuredText":
+        from autodog.docmodel.restructuredtext import ReStructuredText
         return ReStructuredText(**kwarg)
     elif model_name == "javadoc":
+        from autodog.docmodel.javadoc import Javadoc
         return Javadoc(**kwarg)
     raise UnknownDocType(f"{model_name} is not supported.")
\ No newline at end of file
@@ -80,3 +80,58 @@ class Engine(metaclass=ABCMeta):
         class and this method must be implemented by its subclasses.
         """
         raise NotImplementedError("DocEngine is an abstract class.")
+
+    def prompt(
+        self, code:str, lang:str, statement_kind:str, doc_format:str, context:Optional[str]=None
+    ) -> any:
+        """Prepares the prompt of a request of `generate_doc` without
+        sending it. A request goes through `prompt`, `send` and
+        `postprocess`, which can run in different threads, so the prompts
+        can be built and the responses formatted while other requests are
+        in flight. By default, the prompt is the arguments of
+        `generate_doc`.
+        """
+        return (code, lang, statement_kind, doc_format, context)
+
+    def send(self, prompt:any) -> any:
+        """Sends a prompt prepared by `prompt` and returns the response. By
+        default, it calls `generate_doc`.
+        """
+        return self.generate_doc(*prompt)
+
+    def postprocess(self, response:any, lang:str) -> str:
+        """Returns the documentation of a response of `send`. By default,
+        the response is the documentation.
+        """
+        return response
+
+    def batch_request(
+        self, code:str, lang:str, statement_kind:str, doc_format:str, context:Optional[str]=None
+    ) -> dict:
+        """Returns a request of `generate_doc` as an entry of a batch job,
+        which is sent offline, e.g. to the batch endpoint of a provider. By
+        default, it is the arguments of `generate_doc`.
+        """
+        return {
+            "code": code,
+            "lang": lang,
+            "statement_kind": statement_kind,
+            "doc_format": doc_format,
+            "context": context,
+        }
+
+    def batch_doc(self, response:dict, lang:str) -> Optional[str]:
+        """Returns the documentation of a response of a batch job, or None if
+        the request failed. By default, the response holds the documentation
+        as `doc`.
+
+        Args:
+        ----
+            response (dict): The response entry.
+            lang (str): The language of the documented code.
+
+        Returns:
+        -------
+            str, optional: The documentation.
+        """
+        return response.get("doc")
@@ -32,7 +32,18 @@ suggest a document for the given code.
 an API.
 - `generate_doc(self, code: str, lang: str, statement_kind: str,
 context='') -> str`: Generates documentation for the given code using
-the OpenAI chatbot.
+the OpenAI chatbot. It is made of the three phases below.
+- `prompt(self, code: str, lang: str, statement_kind: str, context='')
+-> list[dict]`: Returns the messages of the request.
+- `send(self, prompt: list[dict]) -> str`: Sends the messages after
+waiting for the rate limit and returns the content of the response.
+- `postprocess(self, response: str, lang: str) -> str`: Formats the
+content of a response.
+- `batch_request(self, code: str, lang: str, statement_kind: str,
+context='') -> dict`: Returns the request as a line of an input file of
+the OpenAI Batch API.
+- `batch_doc(self, response: dict, lang: str) -> str`: Returns the
+formatted documentation of a line of an output file of the Batch API.
 - `_get_doc(response: str, lang: str, line_length: int) -> str`: Formats
 the given documentation string based on the specified language and line
 length.
@@ -53,12 +64,13 @@ spaces in a given string.
 import os
 import re
 import textwrap
-import time
 from typing import Optional
 
 import openai
 
 from autodog.engine.base import Engine
+from autodog.utils.profiling import phase
+from autodog.utils.ratelimit import RateLimiter
 from autodog.utils.string import multiline
 
 class ChatGPTEngine(Engine):
@@ -98,7 +110,8 @@ class ChatGPTEngine(Engine):
         api_type:str = openai.api_type,
         http_proxy:Optional[str] = None,
         https_proxy:Optional[str] = None,
-        rate_limit:float = 20.0
+        rate_limit:float = 20.0,
+        rate_limiter:Optional[RateLimiter] = None
     ) -> None:
         """Initializes an instance of the class with the following parameters:
         Args:
@@ -115,6 +128,10 @@ class ChatGPTEngine(Engine):
             line_length (int, optional): An integer representing the maximum
             line length for the generated documentation. Default value is
             72.
+            rate_limit (float, optional): The minimum interval between two
+            requests in seconds. Default value is 20.0.
+            rate_limiter (RateLimiter, optional): The limiter shared with
+            other engines. Default value is a new limiter of `rate_limit`.
 
         Returns
         -------
@@ -126,6 +143,7 @@ class ChatGPTEngine(Engine):
         self.notes = notes
         self.line_length = line_length
         self.rate_limit = rate_limit
+        self.rate_limiter = rate_limiter or RateLimiter(rate_limit)
 
         openai.api_key = api_key
         openai.api_key_path = api_key_path
@@ -139,8 +157,6 @@ class ChatGPTEngine(Engine):
             if isinstance(openai.proxy, dict):
                 openai.proxy["https"] = https_proxy
 
-        self.last_request_time:Optional[float] = None
-
     def _make_prompt(
         self, code:str, lang:str, statement_kind:str, doc_format:str, context:Optional[str]=None
     ) -> str:
@@ -197,22 +213,14 @@ class ChatGPTEngine(Engine):
 
     def _sleep_rate_limit(self) -> None:
         """Limits the rate of requests made to an API.
-        This function takes no arguments and returns nothing. It first checks if
-        the `last_request_time` attribute is set to 0, which indicates that no
-        requests have been made yet. If this is the case, the function simply
-        returns.
-        Otherwise, the function calculates the time difference between the
-        current time and the `last_request_time` attribute. It then sleeps for
-        the maximum of 0 and 20 minus the time difference. This ensures that at
-        least 20 seconds have passed since the last request was made before
-        making another request.
+        This function takes no arguments and returns nothing. It waits on the
+        rate limiter, which ensures that at least `rate_limit` seconds have
+        passed since the previous request was sent, by this engine or by any
+        other thread sharing the limiter, before making another request.
         This function is intended to be used as a helper function within a
         larger API client class.
         """
-        if self.last_request_time is None:
-            return
-        t_diff = time.time() - self.last_request_time
-        time.sleep(max([0, self.rate_limit - t_diff]))
+        self.rate_limiter.wait()
 
     def generate_doc(
         self, code:str, lang:str, statement_kind:str, doc_format:str, context:Optional[str]=None
@@ -228,8 +236,25 @@ class ChatGPTEngine(Engine):
         function sends the messages to the OpenAI chatbot using the
         `openai.ChatCompletion.create` method.
         Finally, it formats and returns the response received from the chatbot.
+        The three steps are `prompt`, `send` and `postprocess`.
+        """
+        return self.postprocess(
+            self.send(self.prompt(code, lang, statement_kind, doc_format, context)), lang
+        )
+
+    def prompt(
+        self, code:str, lang:str, statement_kind:str, doc_format:str, context:Optional[str]=None
+    ) -> list[dict]:
+        """Returns the messages of a request, with the prompt made by
+        `_make_prompt`.
         """
-        prompt = [
+        with phase("prompt"):
+            return self._messages(code, lang, statement_kind, doc_format, context)
+
+    def _messages(
+        self, code:str, lang:str, statement_kind:str, doc_format:str, context:Optional[str]=None
+    ) -> list[dict]:
+        return [
             {
                 "role": "system",
                 "content": "You are an experienced programmer."
@@ -246,18 +271,54 @@ class ChatGPTEngine(Engine):
             },
         ]
 
-        self._sleep_rate_limit()
-        response = openai.ChatCompletion.create(
-            model=self.model,
-            messages=prompt,
-            temperature=0.0,
-            deployment_id=self.deployment_id
-        )
-        self.last_request_time = time.time()
+    def send(self, prompt:list[dict]) -> str:
+        """Sends the messages to the OpenAI chatbot after waiting for the
+        rate limit, and returns the content of the response.
+        """
+        with phase("limiter"):
+            self._sleep_rate_limit()
+        with phase("network"):
+            response = openai.ChatCompletion.create(
+                model=self.model,
+                messages=prompt,
+                temperature=0.0,
+                deployment_id=self.deployment_id
+            )
+        return response["choices"][0]["message"]["content"]
 
-        message = response["choices"][0]["message"]["content"]
-        return _get_doc(message, lang, self.line_length)
+    def postprocess(self, response:str, lang:str) -> str:
+        """Formats the content of a response (see `_get_doc`)."""
+        with phase("postprocess"):
+            return _get_doc(response, lang, self.line_length)
 
+    def batch_request(
+        self, code:str, lang:str, statement_kind:str, doc_format:str, context:Optional[str]=None
+    ) -> dict:
+        """Returns the request as a line of an input file of the OpenAI Batch
+        API, without its `custom_id`.
+        """
+        return {
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": self.model,
+                "messages": self.prompt(code, lang, statement_kind, doc_format, context),
+                "temperature": 0.0,
+            },
+        }
+
+    def batch_doc(self, response:dict, lang:str) -> Optional[str]:
+        """Returns the documentation of a line of an output file of the
+        OpenAI Batch API, formatted as `generate_doc` does, or None if the
+        request failed. A line holding the documentation as `doc` is
+        accepted too.
+        """
+        if "doc" in response:
+            return response["doc"]
+        result = response.get("response") or {}
+        if response.get("error") or result.get("status_code", 200) != 200:
+            return None
+        return self.postprocess(result["body"]["choices"][0]["message"]["content"], lang)
 
 def _get_doc(response: str, lang: str, line_length: int) -> str:
     """Formats the given documentation string based on the specified language
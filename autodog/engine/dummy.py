@@ -19,6 +19,8 @@ Methods
         Returns the dummy document.
 
 """
+from typing import Optional
+
 from autodog.engine.base import Engine
 
 
@@ -43,13 +45,14 @@ class DummyEngine(Engine):
             Generate documentation for a given code snippet.
     """
 
-    def __init__(self, dummy_doc="This is a dummy document.") -> None:
+    def __init__(self, dummy_doc="This is a dummy document.", **kwargs) -> None:
         """Initialize the class with a dummy document.
 
         Args:
         ----
             dummy_doc (str): A string representing the dummy document. Default
             is 'This is a dummy document.'.
+            **kwargs: Options of the other engines, which are ignored.
 
         Attributes:
         ----------
@@ -62,7 +65,7 @@ class DummyEngine(Engine):
         self.dummy_doc = dummy_doc
 
     def generate_doc(
-        self, code: str, lang: str, statement_kind: str, context="",
+        self, code: str, lang: str, statement_kind: str, doc_format: str = "", context: Optional[str] = None,
     ) -> str:
         """Generate documentation for a given code snippet.
 
@@ -74,8 +77,10 @@ class DummyEngine(Engine):
             lang (str): The programming language of the code snippet. Default is
             an empty string.
             statement_kind (str): The kind of statement in the code snippet.
-            context (str): Additional context information. Default is an empty
-            string.
+            doc_format (str): The desired documentation format. Default is an
+            empty string.
+            context (str, optional): Additional context information. Default
+            is None.
 
         Returns:
         -------
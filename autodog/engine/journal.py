@@ -0,0 +1,138 @@
+"""This module defines `JournalEngine`, an engine that wraps another
+engine and journals every generated document to a `Journal`.
+
+When a request whose document is already in the journal is made, the
+journaled document is returned and no request is sent to the wrapped
+engine. This lets an interrupted run be resumed at the cost of the
+remaining requests only. The engine also counts the requests it sends
+and times them for the report of a run.
+"""
+import threading
+import time
+from typing import Optional
+
+from autodog.engine.base import Engine
+from autodog.engine.request import DocRequest
+from autodog.engine.scheduler import estimate_tokens
+from autodog.utils.journal import Journal, request_key
+
+
+class JournalEngine(Engine):
+    """An engine that journals the documents generated by another engine.
+
+    Attributes:
+    ----------
+        engine (Engine): The wrapped engine.
+        journal (Journal): The journal the documents are recorded to.
+        filepath (str, optional): The file currently being documented.
+        n_hits (int): The number of requests answered from the journal.
+        n_requests (int): The number of requests sent to the wrapped
+        engine.
+        n_tokens (int): The estimated tokens of the sent requests.
+        timings (list): The time in seconds, the statement kind and the
+        first line of the code of every sent request.
+    """
+
+    def __init__(self, engine:Engine, journal:Journal, filepath:Optional[str]=None) -> None:
+        """Initializes the engine. The wrapped engine and the journal can be
+        shared by several instances, e.g. one per file processed in a
+        thread.
+
+        Args:
+        ----
+            engine (Engine): The engine to be wrapped.
+            journal (Journal): The journal the documents are recorded to.
+            filepath (str, optional): The file being documented.
+        """
+        self.engine = engine
+        self.journal = journal
+        self.filepath = filepath
+        self.n_hits = 0
+        self.n_requests = 0
+        self.n_tokens = 0
+        self.timings:list[tuple[float, str, str]] = []
+        self._lock = threading.Lock()
+
+    def lookup(self, request:DocRequest) -> Optional[str]:
+        """Returns the journaled document of a request, or None if it has
+        not been generated yet. A request found in the journal does not
+        have to be scheduled.
+        """
+        doc = self.journal.get(request.key())
+        if doc is not None:
+            with self._lock:
+                self.n_hits += 1
+        return doc
+
+    def generate_doc(
+        self, code:str, lang:str, statement_kind:str, doc_format:str, context:Optional[str]=None
+    ) -> str:
+        """Returns the journaled document of the request if there is one.
+        Otherwise, generates the document with the wrapped engine and
+        journals it before returning it.
+        """
+        return self.postprocess(
+            self.send(self.prompt(code, lang, statement_kind, doc_format, context)), lang
+        )
+
+    def prompt(
+        self, code:str, lang:str, statement_kind:str, doc_format:str, context:Optional[str]=None
+    ) -> "_JournalPrompt":
+        """Prepares the prompt of the wrapped engine, unless the document of
+        the request is journaled.
+        """
+        key = request_key(code, lang, statement_kind, doc_format, context)
+        doc = self.journal.get(key)
+        if doc is not None:
+            with self._lock:
+                self.n_hits += 1
+            return _JournalPrompt(key, None, None, doc)
+        request = DocRequest(None, code, lang, statement_kind, doc_format, context)
+        return _JournalPrompt(
+            key, request, self.engine.prompt(code, lang, statement_kind, doc_format, context)
+        )
+
+    def send(self, prompt:"_JournalPrompt") -> "_JournalPrompt":
+        """Sends the prompt with the wrapped engine, unless the document is
+        journaled, and times it.
+        """
+        if prompt.doc is None:
+            start = time.perf_counter()
+            prompt.response = self.engine.send(prompt.prompt)
+            prompt.elapsed = time.perf_counter() - start
+        return prompt
+
+    def postprocess(self, response:"_JournalPrompt", lang:str) -> str:
+        """Post-processes the response with the wrapped engine and journals
+        the document.
+        """
+        if response.doc is not None:
+            return response.doc
+        doc = self.engine.postprocess(response.response, lang)
+        self.journal.record(response.key, doc, self.filepath)
+        request = response.request
+        head = request.code.lstrip().partition("\n")[0].strip()
+        with self._lock:
+            self.n_requests += 1
+            self.n_tokens += estimate_tokens(request)
+            self.timings.append((response.elapsed, request.statement_kind, head))
+        return doc
+
+
+class _JournalPrompt:
+    """The prompt of a `JournalEngine`, which carries the request through
+    its phases: the journaled document, or the prompt of the wrapped
+    engine, then its response and the time it took.
+    """
+
+    __slots__ = ("key", "request", "prompt", "doc", "response", "elapsed")
+
+    def __init__(
+        self, key:str, request:Optional[DocRequest], prompt:any, doc:Optional[str]=None
+    ) -> None:
+        self.key = key
+        self.request = request
+        self.prompt = prompt
+        self.doc = doc
+        self.response = None
+        self.elapsed = 0.0
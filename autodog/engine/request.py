@@ -0,0 +1,232 @@
+"""This module defines `DocRequest`, a documentation request of a node.
+
+A `DocRequest` holds the arguments of a call to `Engine.generate_doc`
+together with the node it documents. The code classes plan the requests
+of a file a stage at a time with `plan_stages` and insert the received
+documents with `apply_doc`, so the requests of a stage can be sent in any
+order, e.g. by a `Scheduler` interleaving the requests of several files.
+
+A request goes through the three phases of the engine: its prompt is
+prepared, sent, and the response is post-processed into the document.
+`pipeline` overlaps them for the requests of a file sent one at a time,
+so building the prompts and formatting the documents is done while the
+other requests are in flight rather than between them.
+"""
+import contextvars
+import queue
+import threading
+from typing import Iterable, Iterator, Optional
+
+from autodog.engine.base import Engine
+from autodog.utils.journal import request_key
+from autodog.utils.tracing import span
+
+
+class DocRequest:
+    """A request for the documentation of a node.
+
+    Attributes:
+    ----------
+        node (any): The node to be documented.
+        code (str): The code sent to the engine.
+        lang (str): The language of the code.
+        statement_kind (str): The kind of the statement, e.g. 'function'.
+        doc_format (str): The desired documentation format.
+        context (str, optional): The context of the statement.
+        public (bool): True if the node is part of the interface of the
+        file, e.g. a module, a public class or a public procedure.
+        prompt (any): The prompt prepared by `prepare`, or None.
+        span (Span, optional): The trace span of the documentation of the
+        node, the parent of the span of its request.
+    """
+
+    __slots__ = (
+        "node", "code", "lang", "statement_kind", "doc_format", "context", "public", "prompt",
+        "span",
+    )
+
+    def __init__(
+        self,
+        node:any,
+        code:str,
+        lang:str,
+        statement_kind:str,
+        doc_format:str,
+        context:Optional[str]=None,
+        public:bool=True,
+    ) -> None:
+        """Initializes the request with the arguments of
+        `Engine.generate_doc` and the node they document.
+        """
+        self.node = node
+        self.code = code
+        self.lang = lang
+        self.statement_kind = statement_kind
+        self.doc_format = doc_format
+        self.context = context
+        self.public = public
+        self.prompt = None
+        self.span = None
+
+    @property
+    def size(self) -> int:
+        """The number of characters of the prompt specific to the request,
+        i.e. the code and the context.
+        """
+        return len(self.code) + len(self.context or "")
+
+    def key(self) -> str:
+        """Returns the journal key of the request (see `request_key`)."""
+        return request_key(self.code, self.lang, self.statement_kind, self.doc_format, self.context)
+
+    def prepare(self, engine:Engine) -> None:
+        """Prepares the prompt of the request for an engine (see
+        `Engine.prompt`), so it is not built when the request is sent.
+        """
+        self.prompt = engine.prompt(
+            self.code,
+            lang=self.lang,
+            statement_kind=self.statement_kind,
+            doc_format=self.doc_format,
+            context=self.context
+        )
+
+    def transmit(self, engine:Engine) -> any:
+        """Sends the prompt of the request to an engine, preparing it first
+        if it was not. The response is turned into the documentation by
+        `Engine.postprocess`.
+        """
+        if self.prompt is None:
+            self.prepare(engine)
+        return engine.send(self.prompt)
+
+    def send(self, engine:Engine) -> str:
+        """Generates the documentation of the request with an engine.
+
+        Args:
+        ----
+            engine (Engine): The engine.
+
+        Returns:
+        -------
+            str: The generated documentation.
+        """
+        return engine.generate_doc(
+            self.code,
+            lang=self.lang,
+            statement_kind=self.statement_kind,
+            doc_format=self.doc_format,
+            context=self.context
+        )
+
+
+# The number of requests prepared ahead, and of responses waiting for
+# their post-processing, in a pipeline.
+PIPELINE_DEPTH = 4
+
+
+class _Failure:
+    __slots__ = ("error",)
+
+    def __init__(self, error:BaseException) -> None:
+        self.error = error
+
+
+_END = object()
+
+
+def pipeline(
+    requests:Iterable[DocRequest], engine:Engine, depth:int=PIPELINE_DEPTH
+) -> Iterator[tuple[DocRequest, str]]:
+    """Sends requests to an engine one at a time, in order, overlapping the
+    phases of consecutive requests: a thread takes the requests from the
+    iterable and prepares their prompts ahead, a thread sends them, and
+    the responses are post-processed in the calling thread as the
+    documents are yielded. An exception of a phase is raised in the
+    calling thread, and the threads are stopped and joined when the
+    iteration stops, so they are done once it returns or raises.
+
+    The iterable is consumed by another thread, so it must not depend on
+    the documents yielded before, and it must read only the nodes it
+    requests while the documents of other nodes are inserted.
+
+    Args:
+    ----
+        requests (Iterable[DocRequest]): The requests.
+        engine (Engine): The engine.
+        depth (int, optional): The number of requests prepared ahead, and
+        of responses waiting. Defaults to `PIPELINE_DEPTH`.
+
+    Yields:
+    ------
+        tuple[DocRequest, str]: A request and its documentation.
+    """
+    prepared = queue.Queue(depth)
+    responses = queue.Queue(depth)
+    stopped = threading.Event()
+
+    def put(q:queue.Queue, item:any) -> bool:
+        while not stopped.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q:queue.Queue) -> any:
+        while not stopped.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def prepare() -> None:
+        try:
+            for request in requests:
+                request.prepare(engine)
+                if not put(prepared, request):
+                    return
+        except BaseException as e:
+            put(prepared, _Failure(e))
+            return
+        put(prepared, _END)
+
+    def send() -> None:
+        while True:
+            request = get(prepared)
+            if request is _END or isinstance(request, _Failure):
+                put(responses, request)
+                return
+            try:
+                with span("request", request.span, kind=request.statement_kind, size=request.size):
+                    response = engine.send(request.prompt)
+            except BaseException as e:
+                put(responses, _Failure(e))
+                return
+            if not put(responses, (request, response)):
+                return
+
+    # The threads run in the context of the caller, e.g. its trace span.
+    threads = [
+        threading.Thread(target=contextvars.copy_context().run, args=(target,), daemon=True)
+        for target in (prepare, send)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            item = responses.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            request, response = item
+            yield request, engine.postprocess(response, request.lang)
+    finally:
+        stopped.set()
+        # The threads see the stop within the timeout of the queues, or once
+        # the request in flight returns, so none is left running.
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,224 @@
+"""This module defines `Scheduler`, which sends the documentation
+requests of all the files of a run through a single queue.
+
+The files submit all their requests (see `DocRequest`) at once and wait
+for the futures of the documents. A fixed number of workers take the
+requests from the queue in the order of a policy:
+
+- 'fifo': in the order they were submitted.
+- 'largest': the largest prompts first, so a huge module does not end
+  the run alone while the workers are idle.
+- 'public': the modules, public classes and public procedures first, so
+  an interrupted run has documented the most valuable nodes.
+
+The requests of a file are ranked by the policy against the requests of
+the other files, but a file cannot take more than its share of the
+workers while other files are waiting, so a large file does not starve
+the small ones. Before a request is sent, it acquires a slot of the
+requests-per-minute budget and its estimated tokens of the
+tokens-per-minute budget.
+
+The workers only send the prompts: the files prepare the prompts of
+their requests before submitting them, and post-process the responses
+when they insert the documents, so the workers are not held by the
+work done before and after a request.
+"""
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future
+from math import ceil
+from typing import Optional
+
+from autodog.engine.base import Engine
+from autodog.engine.request import DocRequest
+from autodog.utils.profiling import phase
+from autodog.utils.ratelimit import TokenBucket
+from autodog.utils.tracing import span
+
+
+SCHEDULE_POLICIES = ("fifo", "largest", "public")
+
+# A rough number of characters per token of the prompts.
+_CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(request:DocRequest, completion_tokens:int=256) -> int:
+    """Estimates the tokens a request consumes, including its prompt and
+    its completion.
+
+    Args:
+    ----
+        request (DocRequest): The request.
+        completion_tokens (int, optional): The tokens expected in the
+        completion. Defaults to 256.
+
+    Returns:
+    -------
+        int: The estimated number of tokens.
+    """
+    prompt = request.size + len(request.doc_format)
+    return ceil(prompt / _CHARS_PER_TOKEN) + completion_tokens
+
+
+class Scheduler:
+    """A priority queue of documentation requests shared by several files,
+    served by a pool of worker threads.
+
+    Attributes:
+    ----------
+        policy (str): The order of the requests, one of
+        `SCHEDULE_POLICIES`.
+        workers (int): The number of requests sent concurrently.
+        max_per_file (int): The number of requests of a file sent
+        concurrently while other files are waiting.
+        requests_per_minute (TokenBucket): The RPM budget.
+        tokens_per_minute (TokenBucket): The TPM budget.
+        completion_tokens (int): The tokens expected in a completion.
+    """
+
+    def __init__(
+        self,
+        policy:str="fifo",
+        workers:int=1,
+        rpm:float=0.0,
+        tpm:float=0.0,
+        max_per_file:Optional[int]=None,
+        completion_tokens:int=256,
+    ) -> None:
+        """Starts the workers.
+
+        Args:
+        ----
+            policy (str, optional): The order of the requests, one of
+            `SCHEDULE_POLICIES`. Defaults to 'fifo'.
+            workers (int, optional): The number of requests sent
+            concurrently. Defaults to 1.
+            rpm (float, optional): The budget of requests per minute. 0, the
+            default, disables the limit.
+            tpm (float, optional): The budget of tokens per minute. 0, the
+            default, disables the limit.
+            max_per_file (int, optional): The number of requests of a file
+            sent concurrently while other files are waiting. Defaults to
+            half of the workers.
+            completion_tokens (int, optional): The tokens expected in a
+            completion, counted against the TPM budget. Defaults to 256.
+
+        Raises:
+        ------
+            ValueError: If the policy is unknown.
+        """
+        if policy not in SCHEDULE_POLICIES:
+            raise ValueError(f"Unknown schedule policy: {policy}")
+        self.policy = policy
+        self.workers = max(1, workers)
+        self.max_per_file = max_per_file or max(1, self.workers // 2)
+        self.requests_per_minute = TokenBucket(rpm)
+        self.tokens_per_minute = TokenBucket(tpm)
+        self.completion_tokens = completion_tokens
+        self._queues:dict[str, list] = {}
+        self._running:dict[str, int] = {}
+        self._counter = itertools.count()
+        self._closed = False
+        self._condition = threading.Condition()
+        self._threads = [
+            threading.Thread(target=self._work, daemon=True) for _ in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _priority(self, request:DocRequest, seq:int) -> tuple:
+        if self.policy == "largest":
+            return (-request.size, seq)
+        if self.policy == "public":
+            return (not request.public, seq)
+        return (seq,)
+
+    def submit(self, request:DocRequest, engine:Engine, filepath:str="") -> Future:
+        """Queues a request.
+
+        Args:
+        ----
+            request (DocRequest): The request.
+            engine (Engine): The engine the request is sent to.
+            filepath (str, optional): The file of the request, which its
+            share of the workers is counted against.
+
+        Returns:
+        -------
+            Future: The future of the response of the engine, which
+            `Engine.postprocess` turns into the documentation. Cancelling
+            it removes the request from the queue if it has not been sent
+            yet.
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The scheduler is closed.")
+            seq = next(self._counter)
+            heapq.heappush(
+                self._queues.setdefault(filepath, []),
+                (self._priority(request, seq), seq, request, engine, future),
+            )
+            self._condition.notify()
+        return future
+
+    def _next(self) -> Optional[tuple]:
+        """Pops the best queued request of the files under their share, or
+        of all the files if none is under its share. Returns None once the
+        scheduler is closed and the queue is empty.
+        """
+        with self._condition:
+            while True:
+                while not self._queues and not self._closed:
+                    self._condition.wait()
+                if not self._queues:
+                    return None
+                candidates = [
+                    filepath for filepath in self._queues
+                    if self._running.get(filepath, 0) < self.max_per_file
+                ] or list(self._queues)
+                filepath = min(candidates, key=lambda f: self._queues[f][0][:2])
+                queue = self._queues[filepath]
+                _, _, request, engine, future = heapq.heappop(queue)
+                if not queue:
+                    del self._queues[filepath]
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._running[filepath] = self._running.get(filepath, 0) + 1
+                return filepath, request, engine, future
+
+    def _work(self) -> None:
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            filepath, request, engine, future = item
+            try:
+                with span(
+                    "request", request.span, file=filepath, kind=request.statement_kind,
+                    size=request.size,
+                ):
+                    with phase("limiter"), span("limiter"):
+                        self.requests_per_minute.acquire()
+                        self.tokens_per_minute.acquire(
+                            estimate_tokens(request, self.completion_tokens)
+                        )
+                    response = request.transmit(engine)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(response)
+            finally:
+                with self._condition:
+                    self._running[filepath] -= 1
+                    if not self._running[filepath]:
+                        del self._running[filepath]
+
+    def close(self) -> None:
+        """Stops the workers once the queued requests are sent."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
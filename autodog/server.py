@@ -0,0 +1,402 @@
+"""A long-lived documentation server speaking JSON-RPC 2.0.
+
+`DocServer` keeps an engine, its rate limiter, a journal of the
+generated documents, the summaries of the Fortran modules and the parsed
+trees of the files as they were last read or written in memory between
+requests, so an editor action costs the requests to the engine only. It
+exposes the methods:
+
+- `document_file(path, source=None, lang=None, overwrite=False, write=True)`
+- `document_range(path, first, last, ...)`: the nodes touched by the
+  lines `first` to `last`, 1-based and inclusive.
+- `document_node(path, line, ...)`: the innermost node containing the
+  line.
+- `shutdown()`: stops the server once the running requests are done.
+
+If `source` is given, e.g. the unsaved buffer of an editor, it is
+documented instead of the file, and the documented code is returned as
+`text` without writing the file. Otherwise the file is written, unless
+`write` is False. The requests on the same path are serialized, and
+the requests on different paths run concurrently.
+
+`serve_stdio` serves a single client on the standard input and output,
+and `serve_unix` serves concurrent clients on a Unix socket. Both use one
+JSON-RPC message per line.
+"""
+import inspect
+import json
+import os
+import socketserver
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Optional, TextIO
+
+from autodog.core import code, code_from_string, is_fortran
+from autodog.docmodel.base import DocModel
+from autodog.engine.base import Engine
+from autodog.engine.journal import JournalEngine
+from autodog.utils.journal import Journal
+
+
+# The error codes of JSON-RPC 2.0.
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+
+
+class RpcError(Exception):
+    """An error returned to the client as a JSON-RPC error object."""
+
+    def __init__(self, code:int, message:str) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class DocServer:
+    """Documents code on behalf of clients, keeping its state warm.
+
+    Attributes:
+    ----------
+        engine (Engine): The engine shared by all the requests.
+        doc_model (DocModel): The documentation model.
+        journal (Journal): The journal answering the repeated requests.
+        trim_threshold (int, optional): The trim threshold of Fortran
+        code.
+        module_context (dict): The summaries of the Fortran modules
+        documented or parsed so far.
+        stopped (threading.Event): Set when `shutdown` is called.
+    """
+
+    def __init__(
+        self,
+        engine:Engine,
+        doc_model:DocModel,
+        journal:Optional[Journal]=None,
+        trim_threshold:Optional[int]=None,
+        workers:int=4,
+    ) -> None:
+        """Initializes the server.
+
+        Args:
+        ----
+            engine (Engine): The engine shared by all the requests.
+            doc_model (DocModel): The documentation model.
+            journal (Journal, optional): The journal of the documents.
+            Defaults to a journal in memory.
+            trim_threshold (int, optional): The trim threshold of Fortran
+            code. Defaults to None.
+            workers (int, optional): The number of requests handled
+            concurrently. Defaults to 4.
+        """
+        self.engine = engine
+        self.doc_model = doc_model
+        self.journal = journal if journal is not None else Journal(None)
+        self.trim_threshold = trim_threshold
+        self.module_context:dict[str, str] = {}
+        self.stopped = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self._methods:dict[str, Callable] = {
+            "document_file": self.document_file,
+            "document_range": self.document_range,
+            "document_node": self.document_node,
+            "shutdown": self.shutdown,
+        }
+        # The parsed trees of the files as they were read or written, with
+        # the modification time and the size of the file then.
+        self._trees:dict[str, tuple[tuple[int, int], object]] = {}
+        self._locks:dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    # The options of the methods are spelled out, so the parameters of a
+    # request are checked against their signatures before the call.
+
+    def document_file(
+        self, path:str, source:Optional[str]=None, lang:Optional[str]=None,
+        overwrite:bool=False, write:bool=True,
+    ) -> dict:
+        """Documents all the nodes of a file. See `_document` for the
+        options and the result.
+        """
+        return self._document(path, None, source, lang, overwrite, write)
+
+    def document_range(
+        self, path:str, first:int, last:int, source:Optional[str]=None,
+        lang:Optional[str]=None, overwrite:bool=False, write:bool=True,
+    ) -> dict:
+        """Documents the nodes touched by a range of lines, 1-based and
+        inclusive.
+        """
+        if not (isinstance(first, int) and isinstance(last, int)) or first > last:
+            raise RpcError(INVALID_PARAMS, "first and last must be line numbers with first <= last")
+        return self._document(path, [(first, last)], source, lang, overwrite, write)
+
+    def document_node(
+        self, path:str, line:int, source:Optional[str]=None, lang:Optional[str]=None,
+        overwrite:bool=False, write:bool=True,
+    ) -> dict:
+        """Documents the innermost node containing a line."""
+        if not isinstance(line, int):
+            raise RpcError(INVALID_PARAMS, "line must be a line number")
+        return self._document(path, [(line, line)], source, lang, overwrite, write)
+
+    def shutdown(self) -> None:
+        """Stops the server once the running requests are done."""
+        self.stopped.set()
+
+    def _document(
+        self,
+        path:str,
+        lines:Optional[list[tuple[int, int]]],
+        source:Optional[str]=None,
+        lang:Optional[str]=None,
+        overwrite:bool=False,
+        write:bool=True,
+    ) -> dict:
+        """Documents a file or a buffer.
+
+        Args:
+        ----
+            path (str): The file path. It selects the language unless
+            `lang` is given.
+            lines (list, optional): The changed line ranges selecting the
+            nodes, or None for all the nodes.
+            source (str, optional): The code to be documented instead of
+            the file. The file is not written then.
+            lang (str, optional): The language, 'python' or 'fortran'.
+            overwrite (bool, optional): Flag to document again the nodes
+            that have documentation. Defaults to False.
+            write (bool, optional): Flag to write the documented file.
+            Defaults to True.
+
+        Returns:
+        -------
+            dict: `path`, `modified`, `written`, `n_requests`, `n_hits`,
+            and `text`, the documented code, if `source` is given or
+            `write` is False.
+        """
+        path = os.path.abspath(path)
+        with self._path_lock(path):
+            c, stamp = self._code(path, source, lang)
+            engine = JournalEngine(self.engine, self.journal, path)
+            c.insert_docs(engine, self.doc_model, overwrite=overwrite, lines=lines)
+            result = {
+                "path": path,
+                "modified": c.modified,
+                "written": False,
+                "n_requests": engine.n_requests,
+                "n_hits": engine.n_hits,
+            }
+            if source is None and write:
+                result["written"] = c.write()
+            if source is not None or not write:
+                result["text"] = c.to_str()
+            self._trees.pop(path, None)
+            if stamp is not None and not c.modified:
+                self._trees[path] = (stamp, c)
+            elif result["written"]:
+                self._keep_written(path, c)
+            return result
+
+    def _keep_written(self, path:str, c:object) -> None:
+        """Keeps the tree of a file just written under its new stamp. The
+        written text is parsed again, since the lines of the nodes of the
+        modified tree, and its source, are those of the previous text. The
+        tree is not kept if the file was changed by someone else meanwhile,
+        as far as its size tells.
+        """
+        text = c.to_str()
+        try:
+            stamp = _stamp(path)
+        except OSError:
+            return
+        if stamp[1] != len(text.encode("utf-8")):
+            return
+        lang = "fortran" if is_fortran(path) else "python"
+        self._trees[path] = (stamp, code_from_string(
+            text, lang, path, trim_threshold=self.trim_threshold, module_context=self.module_context,
+        ))
+
+    def _code(self, path:str, source:Optional[str], lang:Optional[str]) -> tuple:
+        """Returns the parsed code of a buffer or a file, and the stamp the
+        file was read at, or None for a buffer. The tree of an unchanged file
+        is reused.
+        """
+        module_context = self.module_context
+        if source is not None:
+            if lang is None:
+                lang = "fortran" if is_fortran(path) else "python"
+            try:
+                return code_from_string(
+                    source, lang, path, trim_threshold=self.trim_threshold,
+                    module_context=module_context,
+                ), None
+            except SyntaxError as e:
+                raise RpcError(INVALID_PARAMS, f"Cannot parse the source: {e}") from e
+        try:
+            stamp = _stamp(path)
+        except OSError as e:
+            raise RpcError(INVALID_PARAMS, f"Cannot read {path}: {e}") from e
+        cached = self._trees.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1], stamp
+        try:
+            return code(
+                path, trim_threshold=self.trim_threshold, module_context=module_context
+            ), stamp
+        except SyntaxError as e:
+            raise RpcError(INVALID_PARAMS, f"Cannot parse {path}: {e}") from e
+
+    def _path_lock(self, path:str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(path, threading.Lock())
+
+    def handle(self, message:object) -> Optional[dict]:
+        """Handles a JSON-RPC request.
+
+        Args:
+        ----
+            message (object): The decoded request.
+
+        Returns:
+        -------
+            dict, optional: The response, or None for a notification.
+        """
+        if not isinstance(message, dict) or not isinstance(message.get("method"), str):
+            return _error(None, INVALID_REQUEST, "Invalid request")
+        request_id = message.get("id")
+        try:
+            method = self._methods.get(message["method"])
+            if method is None:
+                raise RpcError(METHOD_NOT_FOUND, f"Method not found: {message['method']}")
+            params = message.get("params", {})
+            if isinstance(params, list):
+                args, kwargs = params, {}
+            elif isinstance(params, dict):
+                args, kwargs = (), params
+            else:
+                raise RpcError(INVALID_PARAMS, "params must be an array or an object")
+            # The parameters are bound before the call, so a TypeError
+            # raised by the method itself is a server error.
+            try:
+                inspect.signature(method).bind(*args, **kwargs)
+            except TypeError as e:
+                raise RpcError(INVALID_PARAMS, str(e)) from e
+            result = method(*args, **kwargs)
+        except RpcError as e:
+            response = _error(request_id, e.code, e.message)
+        except Exception as e:
+            response = _error(request_id, SERVER_ERROR, f"{type(e).__name__}: {e}")
+        else:
+            response = {"jsonrpc": "2.0", "id": request_id, "result": result}
+        if "id" not in message:
+            return None
+        return response
+
+    def handle_line(self, line:str, respond:Callable[[str], None]) -> Optional[Future]:
+        """Handles a request line in the pool of the server and passes the
+        response line, if any, to `respond`. A line that is not JSON is
+        answered at once.
+
+        Returns:
+        -------
+            Future, optional: The future of the handling, or None if the
+            line was answered at once, e.g. a shutdown.
+        """
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError as e:
+            respond(json.dumps(_error(None, PARSE_ERROR, f"Parse error: {e}")))
+            return None
+
+        def task():
+            response = self.handle(message)
+            if response is not None:
+                respond(json.dumps(response))
+
+        if isinstance(message, dict) and message.get("method") == "shutdown":
+            # A shutdown is handled at once, so the caller sees the server
+            # stopped before it reads the next line.
+            task()
+            return None
+        return self.executor.submit(task)
+
+    def close(self) -> None:
+        """Waits for the running requests and stops the pool."""
+        self.executor.shutdown(wait=True)
+
+
+def _error(request_id, code:int, message:str) -> dict:
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+
+def _stamp(path:str) -> tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def serve_stdio(server:DocServer, stdin:TextIO=sys.stdin, stdout:TextIO=sys.stdout) -> None:
+    """Serves the requests read from `stdin`, one per line, until the end
+    of the input or a `shutdown` request, and writes the responses to
+    `stdout`, one per line, in the order they complete.
+    """
+    lock = threading.Lock()
+
+    def respond(line:str) -> None:
+        with lock:
+            stdout.write(line + "\n")
+            stdout.flush()
+
+    for line in stdin:
+        if line.strip():
+            server.handle_line(line, respond)
+        if server.stopped.is_set():
+            break
+    server.close()
+
+
+def serve_unix(server:DocServer, socket_path:str) -> None:
+    """Serves concurrent clients on a Unix socket until a `shutdown`
+    request or an interruption. Each client sends requests and receives
+    responses one per line on its connection.
+    """
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self) -> None:
+            lock = threading.Lock()
+
+            def respond(line:str) -> None:
+                with lock:
+                    try:
+                        self.wfile.write((line + "\n").encode("utf-8"))
+                        self.wfile.flush()
+                    except OSError:
+                        pass
+
+            pending = []
+            for raw in self.rfile:
+                line = raw.decode("utf-8", errors="replace")
+                if line.strip():
+                    pending.append(server.handle_line(line, respond))
+                if server.stopped.is_set():
+                    break
+            # The responses are sent before the connection is closed.
+            wait([future for future in pending if future is not None])
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as unix_server:
+        unix_server.daemon_threads = True
+        thread = threading.Thread(target=unix_server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            server.stopped.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            unix_server.shutdown()
+            server.close()
+            os.unlink(socket_path)
@@ -0,0 +1,358 @@
+"""Discovery of the files to be documented.
+
+`iter_files` walks a directory tree once with `os.scandir` and yields the
+files with the given extensions as soon as they are found, so the files
+can be processed while the tree is still being walked. The directories
+and files matching gitignore-style patterns are skipped: the patterns
+given by the caller, the patterns of the `.gitignore` files in the tree
+and `DEFAULT_EXCLUDES`, which covers version control directories, build
+directories and virtual environments. An excluded directory is not
+descended into. A directory containing a `pyvenv.cfg` file is a virtual
+environment and is skipped as well. `filter_files` applies the same
+selection to a given list of files.
+
+A walk repeated over the same tree, e.g. by the polls of the watch mode,
+can be given a `listings` dict that keeps the selection of every
+directory: a directory whose modification time and `.gitignore` file did
+not change since the previous walk is not listed again, so such a walk
+costs a `stat` of every directory rather than a `scandir` of it and the
+matching of all its entries.
+
+`IgnoreRules` implements the subset of the gitignore syntax used by the
+walk: `*`, `?`, `[...]` and `**` wildcards, patterns anchored by a
+slash, directory-only patterns ending with a slash and negated patterns
+starting with `!`.
+"""
+import os
+import re
+import time
+from typing import Iterable, Iterator, Optional
+
+
+DEFAULT_EXCLUDES = (
+    ".git/",
+    ".hg/",
+    ".svn/",
+    "__pycache__/",
+    ".tox/",
+    ".nox/",
+    ".venv/",
+    "venv/",
+    "build/",
+    "dist/",
+    "node_modules/",
+    "*.egg-info/",
+)
+
+# The age in nanoseconds of the modification time of a directory below
+# which its listing is not reused, since an entry added in the same tick
+# as the listing would not change the modification time again.
+_RACY_NS = 2_000_000_000
+
+
+class IgnoreRules:
+    """The gitignore-style rules of a directory.
+
+    Attributes:
+    ----------
+        base (str): The path of the directory relative to the root of the
+        walk, with `/` as separator. The patterns are relative to it.
+        rules (list): The compiled rules as tuples of the regular
+        expression, the negation flag and the directory-only flag.
+    """
+
+    def __init__(self, patterns:Iterable[str], base:str="") -> None:
+        """Compiles the patterns.
+
+        Args:
+        ----
+            patterns (Iterable[str]): The patterns, e.g. the lines of a
+            `.gitignore` file. Blank lines and comments are ignored.
+            base (str, optional): The directory the patterns are relative
+            to. Defaults to the root of the walk.
+        """
+        self.base = base
+        self.rules = []
+        for pattern in patterns:
+            rule = _compile_pattern(pattern)
+            if rule is not None:
+                self.rules.append(rule)
+
+    @classmethod
+    def from_file(cls, filepath:str, base:str="") -> "IgnoreRules":
+        """Reads the patterns of a `.gitignore` file."""
+        with open(filepath, encoding="utf-8", errors="replace") as f:
+            return cls(f.read().splitlines(), base)
+
+    def match(self, relpath:str, is_dir:bool) -> Optional[bool]:
+        """Matches a path against the rules. The last matching rule wins.
+
+        Args:
+        ----
+            relpath (str): The path relative to the root of the walk, with
+            `/` as separator.
+            is_dir (bool): True if the path is a directory.
+
+        Returns:
+        -------
+            bool, optional: True if the path is excluded, False if it is
+            re-included by a negated rule, or None if no rule matches it.
+        """
+        if self.base:
+            if not relpath.startswith(self.base + "/"):
+                return None
+            relpath = relpath[len(self.base) + 1:]
+        result = None
+        for regex, negate, dir_only in self.rules:
+            if (is_dir or not dir_only) and regex.match(relpath):
+                result = not negate
+        return result
+
+
+def is_excluded(rules:Iterable[IgnoreRules], relpath:str, is_dir:bool) -> bool:
+    """Returns True if the path is excluded by the rules. The rules of the
+    deeper directories, which come later, take precedence.
+    """
+    excluded = False
+    for rule in rules:
+        result = rule.match(relpath, is_dir)
+        if result is not None:
+            excluded = result
+    return excluded
+
+
+def iter_files(
+    root:str,
+    extensions:Iterable[str],
+    excludes:Iterable[str]=(),
+    use_ignore_files:bool=True,
+    default_excludes:Iterable[str]=DEFAULT_EXCLUDES,
+    listings:Optional[dict]=None,
+) -> Iterator[str]:
+    """Yields the files under the root with the given extensions, walking
+    the tree once. The files of a directory are yielded in the order of
+    their names before its subdirectories are walked. Symbolic links to
+    directories are not followed.
+
+    Args:
+    ----
+        root (str): The root directory.
+        extensions (Iterable[str]): The extensions without the dot, e.g.
+        'py' or 'f90'. They are case-sensitive.
+        excludes (Iterable[str], optional): Gitignore-style patterns
+        relative to the root. Defaults to none.
+        use_ignore_files (bool, optional): If True, the `.gitignore` files
+        in the tree are respected. Defaults to True.
+        default_excludes (Iterable[str], optional): Patterns applied in
+        addition to `excludes`. Defaults to `DEFAULT_EXCLUDES`.
+        listings (dict, optional): The selections of the directories kept
+        between the walks of the same tree with the same arguments. It is
+        filled by the walk, and a directory that was not modified since
+        it was listed is not listed again. Defaults to None, which lists
+        every directory.
+
+    Yields:
+    ------
+        str: The path of a file, joined to `root`.
+    """
+    suffixes = tuple("." + extension for extension in extensions)
+    patterns = (*default_excludes, *excludes)
+    if listings is not None and listings.get(None, (None,))[0] == patterns:
+        # The rules are reused, so the listings made with them are too.
+        base_rules = listings[None][1]
+    else:
+        base_rules = (IgnoreRules(patterns),)
+        if listings is not None:
+            listings.clear()
+            listings[None] = (patterns, base_rules)
+    stack = [(root, "", base_rules)]
+    while stack:
+        dirpath, relpath, rules = stack.pop()
+        if listings is None:
+            listing = _list_dir(dirpath, relpath, rules, suffixes, use_ignore_files)
+        else:
+            listing = _cached_list_dir(dirpath, relpath, rules, suffixes, use_ignore_files, listings)
+        if listing is None:
+            continue
+        yield from listing[0]
+        stack.extend(reversed(listing[1]))
+
+
+def _list_dir(
+    dirpath:str, relpath:str, rules:tuple, suffixes:tuple, use_ignore_files:bool,
+    ignore_rules:Optional[IgnoreRules]=None,
+) -> Optional[tuple[list, list, Optional[IgnoreRules]]]:
+    """Lists a directory of `iter_files`. Returns the selected files, the
+    subdirectories to be walked with their rules and the rules of the
+    `.gitignore` file of the directory, or None if the directory cannot
+    be listed or is a virtual environment. The rules of the `.gitignore`
+    file are read unless they are given.
+    """
+    try:
+        with os.scandir(dirpath) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+    except OSError:
+        return None
+    names = {entry.name for entry in entries}
+    if "pyvenv.cfg" in names:
+        return None
+    if use_ignore_files and ".gitignore" in names:
+        if ignore_rules is None:
+            ignore_rules = IgnoreRules.from_file(os.path.join(dirpath, ".gitignore"), relpath)
+        rules = (*rules, ignore_rules)
+    else:
+        ignore_rules = None
+    files = []
+    subdirs = []
+    for entry in entries:
+        entry_relpath = f"{relpath}/{entry.name}" if relpath else entry.name
+        try:
+            is_dir = entry.is_dir(follow_symlinks=False)
+        except OSError:
+            continue
+        if is_excluded(rules, entry_relpath, is_dir):
+            continue
+        if is_dir:
+            subdirs.append((entry.path, entry_relpath, rules))
+        elif entry.name.endswith(suffixes):
+            files.append(entry.path)
+    return files, subdirs, ignore_rules
+
+
+def _cached_list_dir(
+    dirpath:str, relpath:str, rules:tuple, suffixes:tuple, use_ignore_files:bool, listings:dict,
+) -> Optional[tuple[list, list, Optional[IgnoreRules]]]:
+    """Lists a directory of `iter_files`, or returns its listing of the
+    previous walk if neither the directory, its `.gitignore` file nor the
+    rules of its parents changed. The listing of a directory changed too
+    recently is not kept, as a later change could keep its time.
+    """
+    try:
+        stat = os.stat(dirpath)
+    except OSError:
+        listings.pop(dirpath, None)
+        return None
+    stamp = [stat.st_mtime_ns, None]
+    if use_ignore_files:
+        try:
+            stamp[1] = os.stat(os.path.join(dirpath, ".gitignore")).st_mtime_ns
+        except OSError:
+            pass
+    cached = listings.get(dirpath)
+    if cached is not None and cached[0] == stamp and cached[1] is rules:
+        return cached[2]
+    # The rules of an unchanged `.gitignore` file are reused, so that the
+    # subdirectories get the same rules and their listings stay valid.
+    ignore_rules = cached[2][2] if cached is not None and cached[0][1] == stamp[1] else None
+    listing = _list_dir(dirpath, relpath, rules, suffixes, use_ignore_files, ignore_rules)
+    if cached is not None and listing is not None:
+        # The rules tuples equal to the previous ones are kept, since the
+        # listings of the subdirectories are checked against them.
+        previous = {subdir[0]: subdir for subdir in cached[2][1]}
+        for i, subdir in enumerate(listing[1]):
+            kept = previous.get(subdir[0])
+            if kept is not None and kept[2] == subdir[2]:
+                listing[1][i] = kept
+    if listing is None or time.time_ns() - stat.st_mtime_ns < _RACY_NS:
+        listings.pop(dirpath, None)
+    else:
+        listings[dirpath] = (stamp, rules, listing)
+    return listing
+
+
+def filter_files(
+    filepaths:Iterable[str],
+    root:str,
+    extensions:Iterable[str],
+    excludes:Iterable[str]=(),
+    default_excludes:Iterable[str]=DEFAULT_EXCLUDES,
+) -> Iterator[str]:
+    """Yields the files of a given list that `iter_files` would yield
+    without reading the `.gitignore` files, i.e. the files under the root
+    with the given extensions that are not excluded, themselves or through
+    one of their directories. It selects files without walking the tree,
+    e.g. among the files changed in a commit.
+
+    Args:
+    ----
+        filepaths (Iterable[str]): The file paths.
+        root (str): The root directory.
+        extensions (Iterable[str]): The extensions without the dot.
+        excludes (Iterable[str], optional): Gitignore-style patterns
+        relative to the root. Defaults to none.
+        default_excludes (Iterable[str], optional): Patterns applied in
+        addition to `excludes`. Defaults to `DEFAULT_EXCLUDES`.
+
+    Yields:
+    ------
+        str: The path of a selected file.
+    """
+    suffixes = tuple("." + extension for extension in extensions)
+    rules = (IgnoreRules([*default_excludes, *excludes]),)
+    root = os.path.abspath(root)
+    for filepath in filepaths:
+        relpath = os.path.relpath(os.path.abspath(filepath), root)
+        if relpath.startswith(os.pardir) or not filepath.endswith(suffixes):
+            continue
+        parts = relpath.split(os.sep)
+        if any(
+            is_excluded(rules, "/".join(parts[:i]), True) for i in range(1, len(parts))
+        ) or is_excluded(rules, "/".join(parts), False):
+            continue
+        yield filepath
+
+
+def _compile_pattern(pattern:str) -> Optional[tuple]:
+    """Compiles a gitignore-style pattern to a tuple of a regular expression
+    matching a relative path, the negation flag and the directory-only flag,
+    or returns None for a blank line or a comment.
+    """
+    pattern = pattern.rstrip()
+    if not pattern or pattern.startswith("#"):
+        return None
+    negate = pattern.startswith("!")
+    if negate:
+        pattern = pattern[1:]
+    elif pattern.startswith("\\"):
+        pattern = pattern[1:]
+    dir_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    if not pattern:
+        return None
+    anchored = "/" in pattern
+    regex = _translate(pattern.lstrip("/"))
+    if not anchored:
+        regex = "(?:.*/)?" + regex
+    return re.compile(regex + r"\Z"), negate, dir_only
+
+
+def _translate(pattern:str) -> str:
+    """Translates the wildcards of a gitignore-style pattern to a regular
+    expression.
+    """
+    regex = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            regex.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            regex.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            regex.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            body = pattern[i + 1:end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            regex.append("[" + body.replace("\\", "\\\\") + "]")
+            i = end + 1
+        else:
+            regex.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(regex)
@@ -0,0 +1,75 @@
+"""File writing helpers.
+
+`write_if_changed` writes a text to a file only if the file content
+differs from it, and replaces the file atomically with a temporary file
+and `os.replace`, so readers never see a partially written file and the
+modification time of an unchanged file is kept. `mirror_path` and
+`link_or_copy` are used to mirror a source tree into an output
+directory, hardlinking the files that were not modified.
+"""
+import os
+import shutil
+import uuid
+
+
+def write_if_changed(filepath:str, text:str, encoding:str="utf-8") -> bool:
+    """Writes the text to the file if the file content differs from it.
+
+    Args:
+    ----
+        filepath (str): The file path to write to. Missing parent
+        directories are created.
+        text (str): The text to be written.
+        encoding (str, optional): The text encoding. Defaults to 'utf-8'.
+
+    Returns:
+    -------
+        bool: True if the file was written, False if it was unchanged.
+    """
+    data = text.encode(encoding)
+    try:
+        with open(filepath, "rb") as f:
+            if f.read() == data:
+                return False
+        exists = True
+    except FileNotFoundError:
+        exists = False
+    dirname = os.path.dirname(os.path.abspath(filepath))
+    os.makedirs(dirname, exist_ok=True)
+    tmp_path = os.path.join(
+        dirname, f".{os.path.basename(filepath)}.{uuid.uuid4().hex}.tmp"
+    )
+    # The mode 0o666 is masked by the umask as a plain `open` would be.
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        if exists:
+            shutil.copymode(filepath, tmp_path)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
+
+
+def mirror_path(filepath:str, root:str, out_dir:str) -> str:
+    """Returns the path of the file mirrored from `root` into `out_dir`."""
+    return os.path.join(out_dir, os.path.relpath(filepath, root))
+
+
+def link_or_copy(src:str, dst:str) -> None:
+    """Hardlinks `src` to `dst`, or copies it if a hardlink is impossible
+    (e.g. `dst` is on another file system).
+    An existing `dst` is replaced unless it is already the same file.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+    if os.path.exists(dst):
+        if os.path.samefile(src, dst):
+            return
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
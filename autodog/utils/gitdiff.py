@@ -0,0 +1,176 @@
+"""Changed lines of a git working tree.
+
+`changed_lines` runs `git diff -U0` against a ref and returns the lines
+of every file that were added or modified since the ref, including the
+uncommitted changes and the untracked files. `touched_spans` maps these
+lines to the nested spans of the nodes of a file: a line belongs to the
+innermost span containing it, so a change inside a function touches the
+function but not the class or the module around it. `drop_blank_lines`
+removes the blank lines from the changed lines beforehand, and `overlaps`
+tells whether a span, e.g. the documentation of a node, was changed.
+"""
+import os
+import re
+import subprocess
+from typing import Iterable, Optional
+
+
+class GitDiffError(Exception):
+    """Raised when git fails, e.g. outside a repository or for an unknown
+    ref.
+    """
+    pass
+
+
+_HUNK_PATTERN = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+
+def changed_lines(ref:str, cwd:Optional[str]=None) -> dict[str, list[tuple[int, int]]]:
+    """Returns the lines changed since a ref in the working tree.
+
+    Args:
+    ----
+        ref (str): The git ref to compare with, e.g. 'origin/main'.
+        cwd (str, optional): A directory in the repository. Defaults to the
+        current directory.
+
+    Returns:
+    -------
+        dict: The sorted ranges `(first, last)` of the changed lines,
+        1-based and inclusive, keyed by the absolute path of the file. A
+        deletion touches the line before it. An untracked file is changed
+        as a whole.
+
+    Raises:
+    ------
+        GitDiffError: If git fails.
+    """
+    toplevel = _git(["rev-parse", "--show-toplevel"], cwd).strip()
+    changes:dict[str, list[tuple[int, int]]] = {}
+    filepath = None
+    diff = _git(
+        ["-c", "core.quotepath=off", "diff", "--no-color", "--no-ext-diff",
+         "--no-renames", "-U0", ref, "--"],
+        cwd,
+    )
+    for line in diff.splitlines():
+        if line.startswith("+++ "):
+            path = line[4:]
+            filepath = (
+                os.path.join(toplevel, path[2:]) if path.startswith("b/") else None
+            )
+            continue
+        match = _HUNK_PATTERN.match(line)
+        if match is None or filepath is None:
+            continue
+        start = int(match.group(1))
+        count = int(match.group(2)) if match.group(2) is not None else 1
+        if count == 0:
+            changes.setdefault(filepath, []).append((max(start, 1), max(start, 1)))
+        else:
+            changes.setdefault(filepath, []).append((start, start + count - 1))
+    untracked = _git(["ls-files", "--others", "--exclude-standard", "--full-name"], toplevel)
+    for path in untracked.splitlines():
+        changes[os.path.join(toplevel, path)] = [(1, _n_lines(os.path.join(toplevel, path)))]
+    return {filepath: sorted(ranges) for filepath, ranges in changes.items()}
+
+
+def touched_spans(
+    spans:list[tuple[int, int]], ranges:Iterable[tuple[int, int]]
+) -> set[int]:
+    """Finds the spans that own a changed line. A line is owned by the
+    innermost span containing it.
+
+    Args:
+    ----
+        spans (list): The `(first, last)` line spans, 1-based and
+        inclusive, of nodes that are properly nested.
+        ranges (Iterable): The changed line ranges as returned by
+        `changed_lines`.
+
+    Returns:
+    -------
+        set[int]: The indices of the touched spans in `spans`.
+    """
+    order = sorted(range(len(spans)), key=lambda i: (spans[i][0], -spans[i][1]))
+    touched = set()
+    stack = []
+    pos = 0
+    for first, last in sorted(ranges):
+        line = first
+        while line <= last:
+            while pos < len(order) and spans[order[pos]][0] <= line:
+                while stack and spans[stack[-1]][1] < spans[order[pos]][0]:
+                    stack.pop()
+                stack.append(order[pos])
+                pos += 1
+            while stack and spans[stack[-1]][1] < line:
+                stack.pop()
+            if stack:
+                touched.add(stack[-1])
+            # The owner does not change before the next span starts or the
+            # current one ends.
+            next_line = last + 1
+            if pos < len(order):
+                next_line = min(next_line, spans[order[pos]][0])
+            if stack:
+                next_line = min(next_line, spans[stack[-1]][1] + 1)
+            line = max(line + 1, next_line)
+    return touched
+
+
+def overlaps(span:tuple[int, int], ranges:Iterable[tuple[int, int]]) -> bool:
+    """Returns True if a `(first, last)` line span, 1-based and inclusive,
+    contains a line of the changed line ranges.
+    """
+    first, last = span
+    return any(start <= last and first <= end for start, end in ranges)
+
+
+def drop_blank_lines(
+    ranges:Iterable[tuple[int, int]], lines:list[str]
+) -> list[tuple[int, int]]:
+    """Removes the blank lines from changed line ranges, so that adding or
+    removing blank lines between nodes does not touch the enclosing node.
+
+    Args:
+    ----
+        ranges (Iterable): The changed line ranges, 1-based and inclusive.
+        lines (list[str]): The lines of the file.
+
+    Returns:
+    -------
+        list: The ranges without the blank lines.
+    """
+    result = []
+    for first, last in ranges:
+        start = None
+        for line in range(first, min(last, len(lines)) + 1):
+            if lines[line - 1].strip():
+                if start is None:
+                    start = line
+            elif start is not None:
+                result.append((start, line - 1))
+                start = None
+        if start is not None:
+            result.append((start, min(last, len(lines))))
+    return result
+
+
+def _git(args:list[str], cwd:Optional[str]) -> str:
+    try:
+        result = subprocess.run(
+            ["git", *args], cwd=cwd, capture_output=True, text=True, check=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        message = getattr(e, "stderr", None) or str(e)
+        raise GitDiffError(f"git {' '.join(args)} failed: {message.strip()}") from e
+    return result.stdout
+
+
+def _n_lines(filepath:str) -> int:
+    try:
+        with open(filepath, "rb") as f:
+            return max(1, sum(1 for _ in f))
+    except OSError:
+        return 1
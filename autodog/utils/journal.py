@@ -0,0 +1,246 @@
+"""A crash-safe journal of generated documentation.
+
+The `Journal` class appends every generated document to a JSON Lines
+file as soon as it is received, so a run that is interrupted (a killed
+process, an exhausted quota, a preempted machine) can be resumed without
+requesting the same documents again. Each entry is keyed by a hash of
+the request that produced it, which makes an entry valid only as long as
+the code it documents is unchanged. The journal also records the files
+that were completely documented and written, with a hash of their
+content, so a resumed run can skip them as long as they are unchanged.
+An existing journal file is appended to, and truncated only on request,
+so a run started without resuming keeps the entries of the previous one.
+
+The module also provides `request_key`, which computes the key of a
+documentation request, and `merge_journals`, which combines the journals
+of the shards of a run.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Iterator, Optional
+
+
+def request_key(
+    code:str, lang:str, statement_kind:str, doc_format:str, context:Optional[str]=None
+) -> str:
+    """Computes a stable key of a documentation request.
+
+    Args:
+    ----
+        code (str): The code to be documented.
+        lang (str): The language of the code.
+        statement_kind (str): The kind of the statement.
+        doc_format (str): The desired documentation format.
+        context (str, optional): The context of the statement.
+
+    Returns:
+    -------
+        str: A SHA-256 hex digest identifying the request.
+    """
+    h = hashlib.sha256()
+    for field in (code, lang, statement_kind, doc_format, context or ""):
+        h.update(field.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class Journal:
+    """An append-only JSON Lines journal of generated documents.
+
+    Every entry is flushed and synced to the disk before `record` returns,
+    so the entries survive a crash of the process right after it. The
+    documents of a journal file are not kept in memory: only the offsets
+    of their entries are, and a document is read back from the file when
+    it is looked up, so the memory of a run does not grow with the size of
+    the generated documentation. A journal kept in memory serves a single
+    run, e.g. its retries and the identical requests of several files, or
+    the requests of a server.
+
+    Attributes:
+    ----------
+        path (str, optional): The journal file path, or None for a
+        journal kept in memory only.
+        docs (dict): The recorded documents keyed by the request key, for
+        a journal kept in memory only.
+        done_files (dict): The content hashes of the completed files keyed
+        by their absolute paths.
+    """
+
+    def __init__(self, path:Optional[str], resume:bool=False, truncate:bool=False) -> None:
+        """Opens the journal.
+
+        Args:
+        ----
+            path (str, optional): The journal file path. If it is None, the
+            entries are kept in memory only, e.g. as the cache of a server.
+            resume (bool, optional): If True, the existing entries are
+            loaded. Otherwise, they are kept in the file but not used by
+            this run. Defaults to False.
+            truncate (bool, optional): If True, the existing entries are
+            discarded. Defaults to False.
+        """
+        self.path = path
+        self.docs:dict[str, str] = {}
+        self.done_files:dict[str, Optional[str]] = {}
+        # The offsets of the entries of the documents in the file, keyed by
+        # the first 64 bits of the request keys to keep the index small.
+        self._offsets:dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self._reader = None
+        if path is None:
+            return
+        if truncate or not os.path.exists(path):
+            self._file = open(path, "wb")
+        else:
+            if resume:
+                self._load()
+            self._file = open(path, "ab")
+            # A line truncated by a crash is terminated, so that the next
+            # entry is not lost with it.
+            if self._file.tell() > 0:
+                with open(path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        self._file.write(b"\n")
+        self._reader = open(path, "rb")
+
+    def _load(self) -> None:
+        """Loads the entries from the journal file (see `_read_entries`)."""
+        for offset, entry in _read_entries(self.path):
+            if "key" in entry:
+                self._offsets[_index_key(entry["key"])] = offset
+            elif entry.get("done"):
+                self.done_files[entry["file"]] = entry.get("hash")
+
+    def _append(self, entry:dict) -> int:
+        """Appends an entry to the file and returns its offset."""
+        with self._lock:
+            offset = self._file.tell()
+            self._file.write((json.dumps(entry) + "\n").encode("utf-8"))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        return offset
+
+    def get(self, key:str) -> Optional[str]:
+        """Returns the recorded document of the key, or None."""
+        if self._file is None:
+            return self.docs.get(key)
+        offset = self._offsets.get(_index_key(key))
+        if offset is None:
+            return None
+        with self._lock:
+            self._reader.seek(offset)
+            line = self._reader.readline()
+        entry = json.loads(line)
+        # The index key may collide with the key of another request.
+        return entry["doc"] if entry["key"] == key else None
+
+    def __len__(self) -> int:
+        """Returns the number of the recorded documents."""
+        return len(self.docs) if self._file is None else len(self._offsets)
+
+    def record(self, key:str, doc:str, filepath:Optional[str]=None) -> None:
+        """Records a generated document.
+
+        Args:
+        ----
+            key (str): The request key returned by `request_key`.
+            doc (str): The generated document.
+            filepath (str, optional): The file the document belongs to.
+            It is stored for information only.
+        """
+        if self._file is None:
+            self.docs[key] = doc
+            return
+        self._offsets[_index_key(key)] = self._append({"key": key, "file": filepath, "doc": doc})
+
+    def mark_done(self, filepath:str) -> None:
+        """Records that all documents of the file were written, with the
+        hash of its content. A journal kept in memory is not read by a later
+        run, so it does not record it.
+        """
+        if self._file is None:
+            return
+        filepath = os.path.abspath(filepath)
+        content_hash = _file_hash(filepath)
+        self.done_files[filepath] = content_hash
+        self._append({"file": filepath, "done": True, "hash": content_hash})
+
+    def is_done(self, filepath:str) -> bool:
+        """Returns True if the file was completed in a previous run and was
+        not modified since.
+        """
+        filepath = os.path.abspath(filepath)
+        content_hash = self.done_files.get(filepath)
+        return content_hash is not None and content_hash == _file_hash(filepath)
+
+    def close(self) -> None:
+        """Closes the journal file."""
+        if self._file is not None:
+            self._file.close()
+            self._reader.close()
+
+
+def merge_journals(paths:list[str], out_path:str) -> int:
+    """Combines journals, e.g. those of the shards of a run, into one. A
+    document journaled several times is kept once. The completed files are
+    not kept, since they were completed in the checkouts of the shards and
+    not in the one resuming from the combined journal, where the documents
+    of all the shards are then applied.
+
+    Args:
+    ----
+        paths (list[str]): The journal file paths.
+        out_path (str): The path of the combined journal.
+
+    Returns:
+    -------
+        int: The number of documents of the combined journal.
+    """
+    keys = set()
+    with open(out_path, "w", encoding="utf-8") as out:
+        for path in paths:
+            for _, entry in _read_entries(path):
+                if "key" not in entry or entry["key"] in keys:
+                    continue
+                keys.add(entry["key"])
+                out.write(json.dumps(entry) + "\n")
+    return len(keys)
+
+
+def _file_hash(filepath:str) -> Optional[str]:
+    """Returns the SHA-256 hex digest of the file content, or None if the
+    file cannot be read.
+    """
+    h = hashlib.sha256()
+    try:
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                h.update(chunk)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
+def _index_key(key:str) -> int:
+    return int(key[:16], 16)
+
+
+def _read_entries(path:str) -> Iterator[tuple[int, dict]]:
+    """Yields the offsets and the entries of a journal file. A truncated or
+    broken line, which a crash during a write can leave at the end of the
+    file, is ignored.
+    """
+    offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                entry = None
+            if isinstance(entry, dict):
+                yield offset, entry
+            offset += len(line)
@@ -0,0 +1,179 @@
+"""Profiling of the phases of a run.
+
+The code classes, the engines and the scheduler time their phases with
+`phase`, e.g.
+
+    with phase("parse"):
+        tree = ast.parse(source)
+
+The timers are disabled by default, and then cost a flag check. Once
+`PROFILE.enable()` is called, the wall time and the count of every phase
+are added up over all the threads, so the totals of the phases run
+concurrently can exceed the time of the run. The phases of the
+documentation of a file, in the order of `PHASES`, are:
+
+- read: reading the file.
+- parse: `ast.parse` or `FortranAST`.
+- select: selecting the nodes to be documented.
+- request: extracting the code of the requests from the tree.
+- prompt: building the prompts of the engine.
+- limiter: waiting for the rate limits.
+- network: the API calls.
+- postprocess: formatting the responses (`_get_doc`).
+- apply: inserting the documents into the tree.
+- to_str: `ast.unparse` or `FortranAST.to_str`.
+- write: writing the file.
+
+`ThreadProfiler` runs `cProfile` in every thread started while it is
+enabled, since a `cProfile.Profile` only sees the thread enabling it, and
+combines their statistics. `cProfile` and `pstats` are imported by it
+only, as they are slow to import.
+"""
+import sys
+import threading
+import time
+from typing import Optional
+
+PHASES = (
+    "read", "parse", "select", "request", "prompt", "limiter", "network",
+    "postprocess", "apply", "to_str", "write",
+)
+
+
+class PhaseProfile:
+    """The totals of the phases of a run.
+
+    Attributes:
+    ----------
+        enabled (bool): True if the phases are timed.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._totals:dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        """Starts timing the phases."""
+        self.enabled = True
+
+    def disable(self) -> None:
+        """Stops timing the phases. The totals are kept."""
+        self.enabled = False
+
+    def reset(self) -> None:
+        """Clears the totals."""
+        with self._lock:
+            self._totals.clear()
+
+    def phase(self, name:str) -> "_Timer":
+        """Returns a context manager timing a phase, which does nothing if
+        the profile is disabled.
+        """
+        return _Timer(self, name) if self.enabled else _NO_TIMER
+
+    def add(self, name:str, seconds:float) -> None:
+        """Adds a run of a phase to its totals."""
+        with self._lock:
+            total = self._totals.setdefault(name, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+
+    def totals(self) -> dict[str, dict]:
+        """Returns the total seconds and the count of every timed phase, in
+        the order of `PHASES`, then of the other phases by name.
+        """
+        with self._lock:
+            names = sorted(self._totals, key=lambda name: (
+                PHASES.index(name) if name in PHASES else len(PHASES), name
+            ))
+            return {
+                name: {"seconds": self._totals[name][0], "count": self._totals[name][1]}
+                for name in names
+            }
+
+    def report(self) -> str:
+        """Returns the totals as a table."""
+        totals = self.totals()
+        lines = [f"{'phase':<12} {'seconds':>10} {'count':>8} {'ms/call':>9}"]
+        for name, total in totals.items():
+            per_call = 1000 * total["seconds"] / total["count"] if total["count"] else 0.0
+            lines.append(
+                f"{name:<12} {total['seconds']:>10.3f} {total['count']:>8} {per_call:>9.3f}"
+            )
+        return "\n".join(lines)
+
+
+class _Timer:
+    __slots__ = ("profile", "name", "start")
+
+    def __init__(self, profile:Optional[PhaseProfile], name:str) -> None:
+        self.profile = profile
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> "_Timer":
+        if self.profile is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.profile is not None:
+            self.profile.add(self.name, time.perf_counter() - self.start)
+
+
+# The timer of a disabled profile.
+_NO_TIMER = _Timer(None, "")
+
+# The profile of the run.
+PROFILE = PhaseProfile()
+
+
+def phase(name:str) -> _Timer:
+    """Returns a context manager timing a phase in `PROFILE`."""
+    return PROFILE.phase(name)
+
+
+class ThreadProfiler:
+    """Runs `cProfile` in the calling thread and in the threads started
+    while it is enabled.
+    """
+
+    def __init__(self) -> None:
+        import cProfile
+
+        self._main = cProfile.Profile()
+        self._profiles:list = []
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        """Starts profiling."""
+        threading.setprofile(self._start_thread)
+        self._main.enable()
+
+    def disable(self) -> None:
+        """Stops profiling the calling thread and the threads started from
+        now on. It is called once the profiled threads are done.
+        """
+        self._main.disable()
+        threading.setprofile(None)
+
+    def stats(self) -> "pstats.Stats":
+        """Returns the statistics of all the profiled threads."""
+        import pstats
+
+        stats = pstats.Stats(self._main)
+        with self._lock:
+            for profile in self._profiles:
+                profile.create_stats()
+                stats.add(profile)
+        return stats
+
+    def _start_thread(self, frame, event, arg) -> None:
+        # Called at the first event of a new thread, it replaces itself by
+        # a profiler of the thread.
+        sys.setprofile(None)
+        profile = type(self._main)()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
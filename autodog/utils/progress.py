@@ -1,20 +1,31 @@
-"""A function that returns the given iteration object without any progress
-bar.
+"""Progress bars of the documentation of files.
 
-Parameters
-----------
-- iteration_object: The object to be iterated over.
+`progress_bar_nothing` returns the iteration object without any progress
+bar, and `progress_bar` prints a single bar.
+
+`ProgressReporter` reports the progress of several files documented
+concurrently on one stream. Each file has a bar, with its count, its
+rate and its ETA, and a summary line shows the requests and the
+estimated tokens sent per second and the time spent waiting in the rate
+limiters. The iteration objects are consumed as they go, so a total that
+is unknown is not computed by reading the whole object: its bar shows the
+count and the rate only. On a terminal, the bars are redrawn in place and
+the finished bars are left as lines above them. Otherwise, e.g. in the
+log of a CI job, a line is written when a bar finishes and the summary
+every few seconds.
 
-Returns
--------
-- The given iteration object.
 Example:
->>> progress_bar_nothing(range(10))
-range(0, 10).
+>>> with ProgressReporter(limiters=[limiter]) as reporter:
+...     for request in reporter(requests, total=n, desc="a.py", source=engine):
+...         ...
 
 """
 
 import shutil
+import sys
+import threading
+import time
+from typing import Iterable, Iterator, Optional, TextIO
 
 
 def progress_bar_nothing(iterable_object: any, **kwargs) -> any:
@@ -32,15 +43,287 @@ def progress_bar_nothing(iterable_object: any, **kwargs) -> any:
     return iterable_object
 
 
-def progress_bar(iterable_object: any, bar_char="█", **kwargs) -> any:
-    terminal_size = shutil.get_terminal_size()
-    bar_length = int(0.5 * terminal_size.columns)
-    itr = list(iterable_object)
-    n_objs = len(itr)
-    for i, obj in enumerate(itr):
-        n_char = int(((i + 1) / n_objs) * bar_length)
-        n_blank = bar_length - n_char
-        progress_bar = "|" + bar_char * n_char + " " * n_blank + "|"
-        print("\r", progress_bar, end="", flush=True)
-        yield obj
-    print("\r", progress_bar, "Finished.")
+def progress_bar(iterable_object: any, bar_char="█", total: Optional[int] = None, **kwargs) -> any:
+    """A function that yields the objects of the given iteration object while
+    printing a progress bar, with its rate and its ETA.
+
+    Parameters
+    ----------
+    - iterable_object: The object to be iterated over.
+    - bar_char: The character of the bar.
+    - total: The number of the objects. If it is None, the length of the
+    object is used if it has one. Otherwise, the bar shows the count only.
+    - kwargs: The options of `ProgressReporter.__call__`, e.g. `desc`.
+
+    Yields
+    ------
+    - The objects of the given iteration object.
+    """
+    reporter = ProgressReporter(bar_char=bar_char, summary=False)
+    try:
+        yield from reporter(iterable_object, total=total, **kwargs)
+    finally:
+        reporter.close()
+
+
+class _Bar:
+    """The state of a bar of `ProgressReporter`."""
+
+    __slots__ = ("desc", "total", "count", "start", "source", "requests", "tokens")
+
+    def __init__(self, desc: str, total: Optional[int], source: any) -> None:
+        self.desc = desc
+        self.total = total
+        self.count = 0
+        self.start = time.monotonic()
+        self.source = source
+        # The counters of the source when the bar was opened.
+        self.requests = getattr(source, "n_requests", 0)
+        self.tokens = getattr(source, "n_tokens", 0)
+
+
+class ProgressReporter:
+    """Reports the progress of concurrent bars on a stream.
+
+    Attributes
+    ----------
+    - stream: The stream the bars are written to.
+    - limiters: The rate limiters whose waiting time is reported, e.g.
+    `RateLimiter` and `TokenBucket` objects.
+    - dynamic: True if the bars are redrawn in place, i.e. the stream is a
+    terminal.
+    - interval: The minimum interval between two updates in seconds.
+    """
+
+    def __init__(
+        self,
+        stream: Optional[TextIO] = None,
+        limiters: Iterable = (),
+        interval: Optional[float] = None,
+        bar_char: str = "█",
+        summary: bool = True,
+    ) -> None:
+        """Initializes the reporter.
+
+        Parameters
+        ----------
+        - stream: The stream. Defaults to the standard output.
+        - limiters: The rate limiters whose waiting time is reported. Each
+        has a `waited` attribute, the total time waited in seconds.
+        - interval: The minimum interval between two updates in seconds.
+        Defaults to 0.1 s on a terminal and 10 s otherwise.
+        - bar_char: The character of the bars.
+        - summary: Flag to report the summary line.
+        """
+        self.stream = stream if stream is not None else sys.stdout
+        self.limiters = list(limiters)
+        self.dynamic = _isatty(self.stream)
+        self.interval = interval if interval is not None else (0.1 if self.dynamic else 10.0)
+        self.bar_char = bar_char
+        self.summary = summary
+        self.start = time.monotonic()
+        self._bars: list[_Bar] = []
+        self._count = 0
+        # The requests and the tokens of the sources of the closed bars.
+        self._requests = 0
+        self._tokens = 0
+        self._drawn = 0
+        self._last = self.start
+        self._stdout = None
+        self._lock = threading.RLock()
+
+    def __call__(
+        self,
+        iterable_object: Iterable,
+        total: Optional[int] = None,
+        desc: str = "",
+        source: any = None,
+        **kwargs,
+    ) -> Iterator:
+        """Yields the objects of the iteration object while updating its bar.
+
+        Parameters
+        ----------
+        - iterable_object: The object to be iterated over.
+        - total: The number of the objects. If it is None, the length of the
+        object is used if it has one.
+        - desc: The label of the bar, e.g. the path of the file.
+        - source: An object counting the requests sent and their estimated
+        tokens in `n_requests` and `n_tokens`, e.g. a `JournalEngine`. Its
+        counts while the bar is open are added to the summary.
+
+        Yields
+        ------
+        - The objects of the given iteration object.
+        """
+        if total is None and hasattr(iterable_object, "__len__"):
+            total = len(iterable_object)
+        bar = _Bar(desc, total, source)
+        with self._lock:
+            self._bars.append(bar)
+            self._render(force=True)
+        try:
+            for obj in iterable_object:
+                yield obj
+                with self._lock:
+                    bar.count += 1
+                    self._count += 1
+                    self._render()
+        finally:
+            self._finish(bar)
+
+    def write(self, text: str) -> None:
+        """Writes text to the stream above the bars."""
+        with self._lock:
+            self.stream.write(self._clear() + text)
+            self._drawn = 0
+            self._render(force=True)
+
+    def close(self) -> None:
+        """Writes the summary, if it is reported, below the bars."""
+        with self._lock:
+            text = self._clear()
+            self._drawn = 0
+            if self.summary:
+                text += self._summary_line(time.monotonic()) + "\n"
+            self.stream.write(text)
+            self.stream.flush()
+
+    def __enter__(self) -> "ProgressReporter":
+        """Sends the lines printed to the standard output through `write`
+        while the reporter is in use, so they do not break the bars.
+        """
+        if self.stream is sys.stdout:
+            self._stdout = sys.stdout
+            sys.stdout = _Redirect(self)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._stdout is not None:
+            sys.stdout.flush()
+            sys.stdout = self._stdout
+            self._stdout = None
+        self.close()
+
+    def _finish(self, bar: _Bar) -> None:
+        with self._lock:
+            self._bars.remove(bar)
+            if bar.source is not None:
+                self._requests += getattr(bar.source, "n_requests", 0) - bar.requests
+                self._tokens += getattr(bar.source, "n_tokens", 0) - bar.tokens
+            text = self._clear() + self._bar_line(bar, time.monotonic(), finished=True) + "\n"
+            self.stream.write(text)
+            self._drawn = 0
+            self._render(force=True)
+
+    def _render(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last < self.interval:
+            return
+        if not self.dynamic:
+            # A log shows the summary at the interval only.
+            if self.summary and self._bars and now - self._last >= self.interval:
+                self.stream.write(self._summary_line(now) + "\n")
+                self.stream.flush()
+                self._last = now
+            return
+        self._last = now
+        columns, rows = shutil.get_terminal_size()
+        shown = self._bars[:max(1, rows - 3)]
+        lines = [self._bar_line(bar, now) for bar in shown]
+        if len(shown) < len(self._bars):
+            lines.append(f"... and {len(self._bars) - len(shown)} more")
+        if self.summary:
+            lines.append(self._summary_line(now))
+        # A line wider than the terminal would wrap and break the redraw.
+        text = "".join(line[:columns - 1] + "\n" for line in lines)
+        self.stream.write(self._clear() + text)
+        self.stream.flush()
+        self._drawn = len(lines)
+
+    def _clear(self) -> str:
+        """Returns the escape sequence moving back to the first drawn line
+        and clearing the lines below.
+        """
+        if not self._drawn:
+            return ""
+        return f"\x1b[{self._drawn}F\x1b[J"
+
+    def _bar_line(self, bar: _Bar, now: float, finished: bool = False) -> str:
+        elapsed = now - bar.start
+        rate = bar.count / elapsed if elapsed > 0 else 0.0
+        label = f"{bar.desc} " if bar.desc else ""
+        if bar.total is None:
+            progress = f"{bar.count}"
+        else:
+            length = max(10, int(0.25 * shutil.get_terminal_size().columns))
+            ratio = min(bar.count / bar.total, 1.0) if bar.total else 1.0
+            n_char = int(ratio * length)
+            progress = (
+                "|" + self.bar_char * n_char + " " * (length - n_char) + "|"
+                + f" {bar.count}/{bar.total} {ratio:4.0%}"
+            )
+        if finished:
+            return f"{label}{progress} in {_format_time(elapsed)} ({rate:.2f}/s)"
+        eta = ""
+        if bar.total is not None and rate > 0:
+            eta = f" ETA {_format_time((bar.total - bar.count) / rate)}"
+        return f"{label}{progress} {rate:.2f}/s{eta}"
+
+    def _summary_line(self, now: float) -> str:
+        elapsed = max(now - self.start, 1e-9)
+        requests = self._requests
+        tokens = self._tokens
+        for bar in self._bars:
+            if bar.source is not None:
+                requests += getattr(bar.source, "n_requests", 0) - bar.requests
+                tokens += getattr(bar.source, "n_tokens", 0) - bar.tokens
+        waited = sum(limiter.waited for limiter in self.limiters)
+        return (
+            f"[{len(self._bars)} active] {self._count} nodes, {requests} requests"
+            f" ({requests / elapsed:.2f} req/s, ~{tokens / elapsed:.0f} tokens/s),"
+            f" limiter wait {waited:.1f} s, elapsed {_format_time(elapsed)}"
+        )
+
+
+class _Redirect:
+    """Stands for the standard output and writes its complete lines through
+    a reporter.
+    """
+
+    def __init__(self, reporter: ProgressReporter) -> None:
+        self._reporter = reporter
+        self._buffer = ""
+
+    def write(self, text: str) -> int:
+        with self._reporter._lock:
+            self._buffer += text
+            if "\n" in self._buffer:
+                lines, _, self._buffer = self._buffer.rpartition("\n")
+                self._reporter.write(lines + "\n")
+        return len(text)
+
+    def flush(self) -> None:
+        with self._reporter._lock:
+            if self._buffer:
+                self._reporter.write(self._buffer + "\n")
+                self._buffer = ""
+
+    def __getattr__(self, name: str) -> any:
+        return getattr(self._reporter.stream, name)
+
+
+def _isatty(stream: TextIO) -> bool:
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+
+def _format_time(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
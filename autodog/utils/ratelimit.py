@@ -0,0 +1,114 @@
+"""Thread-safe rate limiters.
+
+`RateLimiter` spaces events, e.g. the requests sent to an API, by a
+minimum interval. It is shared by all the threads sending requests, so
+the rate of a run stays within the quota however many files are
+processed concurrently. Each caller reserves the next free slot under a
+lock and sleeps outside of it, so waiting callers do not block each
+other.
+
+`TokenBucket` enforces a budget per minute, e.g. the requests per minute
+(RPM) or the tokens per minute (TPM) of an API quota. It allows bursts up
+to the budget and refills continuously, and its callers reserve their
+amount the same way.
+
+Both limiters add up the time their callers waited in `waited`, e.g. to
+report how much of a run was spent within the quota.
+"""
+import threading
+import time
+
+
+class RateLimiter:
+    """Spaces events by a minimum interval.
+
+    Attributes:
+    ----------
+        interval (float): The minimum interval between two events in
+        seconds.
+        waited (float): The total time the callers waited in seconds.
+    """
+
+    def __init__(self, interval:float) -> None:
+        """Initializes the limiter.
+
+        Args:
+        ----
+            interval (float): The minimum interval between two events in
+            seconds. An interval of 0 or less disables the limit.
+        """
+        self.interval = interval
+        self.waited:float = 0.0
+        self._next_time:float = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> float:
+        """Blocks until the next event is allowed.
+
+        Returns:
+        -------
+            float: The time waited in seconds.
+        """
+        if self.interval <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_time)
+            self._next_time = slot + self.interval
+            delay = slot - now
+            self.waited += delay
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class TokenBucket:
+    """Limits the amount consumed per minute.
+
+    Attributes:
+    ----------
+        per_minute (float): The budget per minute, which is also the
+        largest burst.
+        waited (float): The total time the callers waited in seconds.
+    """
+
+    def __init__(self, per_minute:float) -> None:
+        """Initializes the bucket full.
+
+        Args:
+        ----
+            per_minute (float): The budget per minute. A budget of 0 or less
+            disables the limit.
+        """
+        self.per_minute = per_minute
+        self.waited:float = 0.0
+        self._tokens:float = per_minute
+        self._time:float = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount:float=1.0) -> float:
+        """Blocks until the amount is available and consumes it. An amount
+        larger than the budget waits for a full bucket.
+
+        Args:
+        ----
+            amount (float, optional): The amount consumed. Defaults to 1.
+
+        Returns:
+        -------
+            float: The time waited in seconds.
+        """
+        if self.per_minute <= 0:
+            return 0.0
+        rate = self.per_minute / 60.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.per_minute, self._tokens + (now - self._time) * rate)
+            self._time = now
+            # A negative balance reserves the amount refilled next.
+            self._tokens -= min(amount, self.per_minute)
+            delay = max(0.0, -self._tokens / rate)
+            self.waited += delay
+        if delay > 0:
+            time.sleep(delay)
+        return delay
@@ -0,0 +1,239 @@
+"""A machine-readable report of a run.
+
+`FileReport` collects the measurements of one file: the parse time, the
+number of documentable nodes, the requests sent and answered from the
+journal, the estimated tokens, the retries, the write time, the status
+and the slowest requests. `Report` gathers the file reports of a run and
+writes them as a JSON document when the run ends, or, for a path ending
+with `.ndjson` or `.jsonl`, streams them as JSON Lines as soon as each
+file is done, followed by a summary line. The reports of nightly runs can
+then be compared to spot regressions and pathological files.
+`merge_reports` combines the reports of the shards of a run.
+"""
+import heapq
+import json
+import threading
+import time
+from typing import Optional
+
+
+# The number of the slowest requests kept per file and per run.
+SLOWEST_NODES = 5
+
+
+class FileReport:
+    """The measurements of a file.
+
+    Attributes:
+    ----------
+        file (str): The file path.
+        status (str): 'documented', 'skipped' if it was completed by a
+        previous run, 'failed' if the retries were exhausted or 'error'
+        if an exception was raised.
+        parse_time (float): The time spent reading and parsing the file
+        in seconds.
+        n_nodes (int): The number of documentable nodes of the file.
+        n_requests (int): The number of requests sent to the engine.
+        n_hits (int): The number of requests answered from the journal.
+        estimated_tokens (int): The estimated tokens of the sent requests.
+        request_time (float): The total time of the sent requests in
+        seconds.
+        retries (int): The number of retries after server errors.
+        write_time (float): The time spent writing the file in seconds.
+        slowest (list): The slowest requests as dictionaries of the
+        statement kind, the first line of the code and the time.
+        error (str, optional): The message of the exception of an 'error'.
+    """
+
+    __slots__ = (
+        "file", "status", "parse_time", "n_nodes", "n_requests", "n_hits",
+        "estimated_tokens", "request_time", "retries", "write_time", "slowest", "error",
+    )
+
+    def __init__(self, file:str) -> None:
+        """Initializes an empty report of a file."""
+        self.file = file
+        self.status = "documented"
+        self.parse_time = 0.0
+        self.n_nodes = 0
+        self.n_requests = 0
+        self.n_hits = 0
+        self.estimated_tokens = 0
+        self.request_time = 0.0
+        self.retries = 0
+        self.write_time = 0.0
+        self.slowest:list[dict] = []
+        self.error:Optional[str] = None
+
+    def add_timings(self, timings:list[tuple[float, str, str]]) -> None:
+        """Records the requests sent for the file.
+
+        Args:
+        ----
+            timings (list): The time in seconds, the statement kind and the
+            first line of the code of every sent request.
+        """
+        self.request_time = sum((seconds for seconds, _, _ in timings), 0.0)
+        self.slowest = [
+            {"kind": kind, "node": node, "seconds": round(seconds, 6)}
+            for seconds, kind, node in heapq.nlargest(SLOWEST_NODES, timings)
+        ]
+
+    def to_dict(self) -> dict:
+        """Returns the report as a dictionary serializable to JSON."""
+        entry = {name: getattr(self, name) for name in self.__slots__}
+        for name in ("parse_time", "request_time", "write_time"):
+            entry[name] = round(entry[name], 6)
+        if entry["error"] is None:
+            del entry["error"]
+        return entry
+
+
+class Report:
+    """The report of a run. `add` is thread-safe.
+
+    Attributes:
+    ----------
+        path (str): The report file path.
+        stream (bool): True if the file reports are streamed as JSON
+        Lines.
+        files (list): The file reports added so far, as dictionaries. It
+        is not kept when streaming.
+    """
+
+    def __init__(self, path:str) -> None:
+        """Opens the report.
+
+        Args:
+        ----
+            path (str): The report file path. A path ending with `.ndjson`
+            or `.jsonl` is streamed.
+        """
+        self.path = path
+        self.stream = path.endswith((".ndjson", ".jsonl"))
+        self.files:list[dict] = []
+        self._started = time.time()
+        self._clock = time.perf_counter()
+        # The elapsed time of a merged report, which is not measured.
+        self._elapsed:Optional[float] = None
+        self._totals = {
+            "n_files": 0, "n_nodes": 0, "n_requests": 0, "n_hits": 0,
+            "estimated_tokens": 0, "retries": 0,
+        }
+        self._statuses:dict[str, int] = {}
+        self._slowest:list[tuple[float, str, str, str]] = []
+        self._lock = threading.Lock()
+        self._file = open(path, "w", encoding="utf-8") if self.stream else None
+
+    def add(self, file_report:FileReport) -> None:
+        """Adds the report of a file. When streaming, it is written and
+        flushed immediately.
+        """
+        self.add_entry(file_report.to_dict())
+
+    def add_entry(self, entry:dict) -> None:
+        """Adds the report of a file given as a dictionary, e.g. read from
+        another report.
+        """
+        with self._lock:
+            self._totals["n_files"] += 1
+            for name in ("n_nodes", "n_requests", "n_hits", "estimated_tokens", "retries"):
+                self._totals[name] += entry[name]
+            self._statuses[entry["status"]] = self._statuses.get(entry["status"], 0) + 1
+            for node in entry["slowest"]:
+                item = (node["seconds"], entry["file"], node["kind"], node["node"])
+                if len(self._slowest) < SLOWEST_NODES:
+                    heapq.heappush(self._slowest, item)
+                else:
+                    heapq.heappushpop(self._slowest, item)
+            if self._file is not None:
+                self._file.write(json.dumps(entry) + "\n")
+                self._file.flush()
+            else:
+                self.files.append(entry)
+
+    def summary(self) -> dict:
+        """Returns the totals of the run so far."""
+        with self._lock:
+            return {
+                "started": self._started,
+                "elapsed": round(
+                    time.perf_counter() - self._clock if self._elapsed is None else self._elapsed,
+                    6,
+                ),
+                **self._totals,
+                "statuses": dict(self._statuses),
+                "slowest": [
+                    {"file": file, "kind": kind, "node": node, "seconds": seconds}
+                    for seconds, file, kind, node in sorted(self._slowest, reverse=True)
+                ],
+            }
+
+    def close(self) -> None:
+        """Writes the summary, and the file reports unless they were
+        streamed, and closes the report.
+        """
+        summary = self.summary()
+        if self._file is not None:
+            self._file.write(json.dumps({"summary": summary}) + "\n")
+            self._file.close()
+            return
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "files": self.files}, f, indent=2)
+            f.write("\n")
+
+
+def read_report(path:str) -> tuple[Optional[dict], list[dict]]:
+    """Reads a report written by `Report`.
+
+    Args:
+    ----
+        path (str): The report file path. A path ending with `.ndjson` or
+        `.jsonl` is read as JSON Lines.
+
+    Returns:
+    -------
+        tuple: The summary, or None if the run was interrupted before it
+        was written, and the file reports as dictionaries.
+    """
+    with open(path, encoding="utf-8") as f:
+        if not path.endswith((".ndjson", ".jsonl")):
+            data = json.load(f)
+            return data.get("summary"), data.get("files", [])
+        summary = None
+        files = []
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "summary" in entry:
+                summary = entry["summary"]
+            else:
+                files.append(entry)
+        return summary, files
+
+
+def merge_reports(paths:list[str], out_path:str) -> None:
+    """Combines reports, e.g. those of the shards of a run, into one. The
+    totals are recomputed from the file reports. The run is taken to start
+    with the earliest report and to last as long as the longest one, as
+    the shards run in parallel.
+
+    Args:
+    ----
+        paths (list[str]): The report file paths.
+        out_path (str): The path of the combined report. A path ending
+        with `.ndjson` or `.jsonl` is written as JSON Lines.
+    """
+    report = Report(out_path)
+    summaries = []
+    for path in paths:
+        summary, files = read_report(path)
+        if summary is not None:
+            summaries.append(summary)
+        for entry in files:
+            report.add_entry(entry)
+    if summaries:
+        report._started = min(summary["started"] for summary in summaries)
+        report._elapsed = max(summary["elapsed"] for summary in summaries)
+    report.close()
@@ -0,0 +1,51 @@
+"""Deterministic sharding of a run across machines.
+
+A run is split into N shards, e.g. one per CI runner, by a stable hash of
+a key of the work: the path of a file relative to the root of the run,
+or the id of a node (see `autodog.batch.batch_id`). Every machine
+computes the same partition, whatever the order the files are found in
+and the absolute path of its checkout, so the shards never overlap and
+together cover the whole run.
+"""
+import argparse
+import hashlib
+import os
+from typing import Optional
+
+
+def parse_shard(value:str) -> tuple[int, int]:
+    """Parses a shard given as 'i/N', where the index `i` goes from 1 to
+    the number of shards `N`. It is meant as the `type` of an argparse
+    option.
+
+    Raises:
+    ------
+        argparse.ArgumentTypeError: If the value is not a valid shard.
+    """
+    index, _, count = value.partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not of the form i/N.") from None
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"{value}: i must be between 1 and N.")
+    return index, count
+
+
+def file_key(filepath:str, root:Optional[str]) -> str:
+    """Returns the path of the file relative to the root, with '/'
+    separators, which does not depend on the checkout.
+    """
+    return os.path.relpath(filepath, root or os.curdir).replace(os.sep, "/")
+
+
+def shard_of(key:str, count:int) -> int:
+    """Returns the shard of a key, from 1 to `count`."""
+    digest = hashlib.sha256(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def in_shard(key:str, shard:tuple[int, int]) -> bool:
+    """Returns True if the key belongs to the shard `(i, N)`."""
+    index, count = shard
+    return shard_of(key, count) == index
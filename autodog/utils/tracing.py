@@ -0,0 +1,260 @@
+"""Trace spans of a run, exported to a local file.
+
+A span times a unit of work, e.g. a file, the documentation of a node, a
+request sent to the engine, a retry or a write, and links to its parent,
+so a trace viewer shows the stragglers of a concurrent run and how the
+requests overlap. The spans are kept in memory and written at the end of
+the run, without any collector service, as:
+
+- a Chrome trace ('chrome'), opened by https://ui.perfetto.dev or
+  chrome://tracing. The spans ended in the thread they started in are
+  slices of their thread, and the others, e.g. the nodes, whose requests
+  are in flight together, are async slices grouped by their parent.
+- OTLP-JSON ('otlp'), the JSON encoding of an OpenTelemetry
+  `ExportTraceServiceRequest`, read by the OpenTelemetry tools and e.g.
+  imported by Jaeger.
+
+`TRACER` is disabled by default, and its spans then do nothing. A span
+used with `with` is the parent of the spans started in its context; the
+threads that do not inherit the context, e.g. the workers of the
+scheduler, give the parent explicitly.
+"""
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+TRACE_FORMATS = ("chrome", "otlp")
+
+_current:contextvars.ContextVar = contextvars.ContextVar("autodog_span", default=None)
+
+
+class Span:
+    """A timed unit of work.
+
+    Attributes:
+    ----------
+        name (str): The name of the span, e.g. 'file'.
+        span_id (int): The id of the span in its trace.
+        parent_id (int, optional): The id of the parent span.
+        attributes (dict): The attributes of the span.
+    """
+
+    __slots__ = (
+        "tracer", "name", "span_id", "parent_id", "start", "end_time", "thread",
+        "attributes", "error", "scoped", "_token",
+    )
+
+    def __init__(
+        self, tracer:Optional["Tracer"], name:str, span_id:int, parent_id:Optional[int],
+        attributes:dict,
+    ) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.perf_counter_ns()
+        self.end_time:Optional[int] = None
+        self.thread = threading.get_ident()
+        self.error:Optional[str] = None
+        self.scoped = False
+        self._token = None
+
+    def set(self, **attributes) -> None:
+        """Sets attributes of the span."""
+        if self.tracer is not None:
+            self.attributes.update(attributes)
+
+    def end(self, **attributes) -> None:
+        """Ends the span, with the given attributes, and records it. A span
+        is recorded once.
+        """
+        if self.tracer is None or self.end_time is not None:
+            return
+        self.attributes.update(attributes)
+        self.end_time = time.perf_counter_ns()
+        self.scoped = self.scoped and self.thread == threading.get_ident()
+        self.tracer._record(self)
+
+    def __enter__(self) -> "Span":
+        if self.tracer is not None:
+            self.scoped = True
+            self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if self.tracer is None:
+            return
+        _current.reset(self._token)
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.end()
+
+
+# The span of a disabled tracer.
+_NO_SPAN = Span(None, "", 0, None, {})
+
+
+class Tracer:
+    """Records the spans of a run in a single trace.
+
+    Attributes:
+    ----------
+        enabled (bool): True if the spans are recorded.
+        trace_id (str): The id of the trace, 32 hexadecimal digits.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.trace_id = os.urandom(16).hex()
+        self._spans:list[Span] = []
+        self._threads:dict[int, str] = {}
+        self._ids = itertools.count(1)
+        # The offset from the performance counter to the Unix time.
+        self._epoch = time.time_ns() - time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        """Starts recording the spans."""
+        self.enabled = True
+
+    def disable(self) -> None:
+        """Stops recording the spans. The recorded spans are kept."""
+        self.enabled = False
+
+    def span(self, name:str, parent:Optional[Span]=None, **attributes) -> Span:
+        """Starts a span. Used with `with`, it ends with the block and is the
+        parent of the spans started in the block.
+
+        Args:
+        ----
+            name (str): The name of the span.
+            parent (Span, optional): The parent span. Defaults to the span
+            of the current context.
+            **attributes: The attributes of the span.
+
+        Returns:
+        -------
+            Span: The span, which does nothing if the tracer is disabled.
+        """
+        if not self.enabled:
+            return _NO_SPAN
+        if parent is None:
+            parent = _current.get()
+        parent_id = None if parent is None or parent.tracer is None else parent.span_id
+        return Span(self, name, next(self._ids), parent_id, attributes)
+
+    def _record(self, span:Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+            if span.thread not in self._threads:
+                self._threads[span.thread] = threading.current_thread().name
+
+    def export(self, path:str, trace_format:str="chrome") -> int:
+        """Writes the recorded spans to a file.
+
+        Args:
+        ----
+            path (str): The file.
+            trace_format (str, optional): One of `TRACE_FORMATS`. Defaults
+            to 'chrome'.
+
+        Returns:
+        -------
+            int: The number of the spans written.
+
+        Raises:
+        ------
+            ValueError: If the format is unknown.
+        """
+        if trace_format not in TRACE_FORMATS:
+            raise ValueError(f"Unknown trace format: {trace_format}")
+        with self._lock:
+            spans = sorted(self._spans, key=lambda span: span.start)
+            threads = dict(self._threads)
+        if trace_format == "chrome":
+            data = self._chrome(spans, threads)
+        else:
+            data = self._otlp(spans)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        return len(spans)
+
+    def _chrome(self, spans:list[Span], threads:dict[int, str]) -> dict:
+        pid = os.getpid()
+        tids = {thread: n for n, thread in enumerate(threads, 1)}
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": threads[thread]}}
+            for thread, tid in tids.items()
+        ]
+        for span in spans:
+            args = dict(span.attributes, span_id=span.span_id, parent_id=span.parent_id)
+            if span.error is not None:
+                args["error"] = span.error
+            start = (self._epoch + span.start) / 1000
+            end = (self._epoch + span.end_time) / 1000
+            if span.scoped:
+                events.append({
+                    "name": span.name, "cat": span.name, "ph": "X", "ts": start,
+                    "dur": end - start, "pid": pid, "tid": tids[span.thread], "args": args,
+                })
+                continue
+            # An async slice is grouped with the slices of its siblings.
+            group = f"{span.parent_id or span.span_id:x}"
+            for phase, ts in (("b", start), ("e", end)):
+                events.append({
+                    "name": span.name, "cat": span.name, "ph": phase, "ts": ts, "pid": pid,
+                    "tid": tids[span.thread], "id2": {"local": group}, "args": args,
+                })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def _otlp(self, spans:list[Span]) -> dict:
+        otlp_spans = []
+        for span in spans:
+            otlp_span = {
+                "traceId": self.trace_id,
+                "spanId": f"{span.span_id:016x}",
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(self._epoch + span.start),
+                "endTimeUnixNano": str(self._epoch + span.end_time),
+                "attributes": [
+                    {"key": key, "value": _otlp_value(value)}
+                    for key, value in span.attributes.items() if value is not None
+                ],
+                "status": {"code": 1},
+            }
+            if span.parent_id is not None:
+                otlp_span["parentSpanId"] = f"{span.parent_id:016x}"
+            if span.error is not None:
+                otlp_span["status"] = {"code": 2, "message": span.error}
+            otlp_spans.append(otlp_span)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": "autodog"}},
+            ]},
+            "scopeSpans": [{"scope": {"name": "autodog"}, "spans": otlp_spans}],
+        }]}
+
+
+def _otlp_value(value:any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+# The tracer of the run.
+TRACER = Tracer()
+
+
+def span(name:str, parent:Optional[Span]=None, **attributes) -> Span:
+    """Starts a span of `TRACER` (see `Tracer.span`)."""
+    return TRACER.span(name, parent, **attributes)
@@ -0,0 +1,122 @@
+"""The `use` dependency graph of Fortran files.
+
+A Fortran module has to be documented before the code that uses it, so
+that the documentation of the module can be given to the prompts of that
+code as context. `scan_modules` finds the modules a file defines and
+uses with a cheap scan of its text, without parsing it,
+`use_dependencies` finds the files every file depends on, and
+`order_by_use` sorts files so that every file comes after the files
+defining the modules it uses. Modules that are not defined by any of the
+files, e.g. intrinsic modules or libraries, are ignored.
+"""
+import heapq
+import re
+from typing import Iterable, Optional
+
+
+_MODULE_PATTERN = re.compile(
+    r"^[ \t]*module[ \t]+(?!procedure\b|function\b|subroutine\b)([a-z_]\w*)",
+    re.IGNORECASE | re.MULTILINE,
+)
+_USE_PATTERN = re.compile(
+    r"^[ \t]*use\b(?:[ \t]*,[ \t]*(?:non_)?intrinsic)?(?:[ \t]*::)?[ \t]*([a-z_]\w*)",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def scan_modules(code:str) -> tuple[set[str], set[str]]:
+    """Finds the modules defined and used in Fortran code.
+
+    Args:
+    ----
+        code (str): The Fortran code.
+
+    Returns:
+    -------
+        tuple: The set of the lower-cased names of the defined modules and
+        the set of the lower-cased names of the used modules.
+    """
+    defined = {name.lower() for name in _MODULE_PATTERN.findall(code)}
+    used = {name.lower() for name in _USE_PATTERN.findall(code)}
+    return defined, used
+
+
+def use_dependencies(filepaths:Iterable[str]) -> dict[str, list[str]]:
+    """Finds the files each Fortran file depends on through `use`
+    statements.
+
+    Args:
+    ----
+        filepaths (Iterable[str]): The Fortran file paths.
+
+    Returns:
+    -------
+        dict: The paths of the files defining the modules a file uses,
+        keyed by the path of the file, in the order of the given files.
+    """
+    filepaths = list(filepaths)
+    providers:dict[str, str] = {}
+    uses = {}
+    for filepath in filepaths:
+        with open(filepath, encoding="utf-8", errors="replace") as f:
+            defined, used = scan_modules(f.read())
+        for name in defined:
+            providers.setdefault(name, filepath)
+        uses[filepath] = used
+    index = {filepath: i for i, filepath in enumerate(filepaths)}
+    return {
+        filepath: sorted(
+            {providers[name] for name in used if name in providers} - {filepath},
+            key=index.__getitem__,
+        )
+        for filepath, used in uses.items()
+    }
+
+
+def order_by_use(
+    filepaths:Iterable[str], dependencies:Optional[dict[str, list[str]]]=None
+) -> list[str]:
+    """Sorts Fortran files in a topological order of their `use` graph, so
+    that a file defining a module comes before the files using it.
+    The order of the given files is kept as far as the dependencies allow,
+    and the files in a dependency cycle are kept in the given order.
+
+    Args:
+    ----
+        filepaths (Iterable[str]): The Fortran file paths.
+        dependencies (dict, optional): The dependencies returned by
+        `use_dependencies`. They are computed if not given.
+
+    Returns:
+    -------
+        list[str]: The sorted file paths.
+    """
+    filepaths = list(filepaths)
+    if dependencies is None:
+        dependencies = use_dependencies(filepaths)
+    index = {filepath: i for i, filepath in enumerate(filepaths)}
+    users:list[list[int]] = [[] for _ in filepaths]
+    n_deps = [0] * len(filepaths)
+    for i, filepath in enumerate(filepaths):
+        for provider in dependencies.get(filepath, ()):
+            users[index[provider]].append(i)
+            n_deps[i] += 1
+
+    ready = [i for i, n in enumerate(n_deps) if n == 0]
+    heapq.heapify(ready)
+    order = []
+    done = [False] * len(filepaths)
+    while len(order) < len(filepaths):
+        if not ready:
+            # A cycle: the first remaining file is taken as it is.
+            heapq.heappush(ready, done.index(False))
+        i = heapq.heappop(ready)
+        if done[i]:
+            continue
+        done[i] = True
+        order.append(i)
+        for user in users[i]:
+            n_deps[user] -= 1
+            if n_deps[user] == 0 and not done[user]:
+                heapq.heappush(ready, user)
+    return [filepaths[i] for i in order]
@@ -0,0 +1,117 @@
+"""Polling of a file tree for the watch mode.
+
+`PollingWatcher` polls the modification time and the size of a set of
+files and reports a modified, created or deleted file only once it has
+been stable for a debounce delay, so a burst of saves, e.g. an editor
+writing a file in several steps, is reported once. The files written by
+the watcher's owner are acknowledged with `acknowledge`, so they are not
+reported as modified.
+
+`changed_ranges` computes the lines of a text that differ from its
+previous version, in the format of `autodog.utils.gitdiff.changed_lines`.
+"""
+import difflib
+import os
+import time
+from typing import Callable, Iterable, Optional
+
+
+class PollingWatcher:
+    """Reports the files that changed since they were last seen.
+
+    Attributes:
+    ----------
+        list_files (Callable): A function returning the watched files. It
+        is called at every poll, so new files are found.
+        debounce (float): The time in seconds a change has to be stable
+        before it is reported.
+        seen (dict): The last reported `(mtime_ns, size)` of the files.
+    """
+
+    def __init__(self, list_files:Callable[[], Iterable[str]], debounce:float=1.0) -> None:
+        """Initializes the watcher with the current state of the files, which
+        is not reported.
+
+        Args:
+        ----
+            list_files (Callable): A function returning the watched files.
+            debounce (float, optional): The time in seconds a change has to
+            be stable before it is reported. Defaults to 1.0.
+        """
+        self.list_files = list_files
+        self.debounce = debounce
+        self.seen = self._scan()
+        # The pending changes: the state of a file and the time it was
+        # first observed.
+        self._pending:dict[str, tuple[Optional[tuple[int, int]], float]] = {}
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        state = {}
+        for filepath in self.list_files():
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                continue
+            state[filepath] = (stat.st_mtime_ns, stat.st_size)
+        return state
+
+    def poll(self) -> list[str]:
+        """Returns the files whose change has been stable for the debounce
+        delay. A deleted file is reported too.
+        """
+        now = time.monotonic()
+        state = self._scan()
+        ready = []
+        for filepath in state.keys() | self.seen.keys() | self._pending.keys():
+            current = state.get(filepath)
+            if current == self.seen.get(filepath):
+                self._pending.pop(filepath, None)
+                continue
+            pending = self._pending.get(filepath)
+            if pending is None or pending[0] != current:
+                self._pending[filepath] = (current, now)
+            elif now - pending[1] >= self.debounce:
+                del self._pending[filepath]
+                ready.append(filepath)
+                if current is None:
+                    self.seen.pop(filepath, None)
+                else:
+                    self.seen[filepath] = current
+        return sorted(ready)
+
+    def acknowledge(self, filepath:str) -> None:
+        """Records the current state of a file, e.g. after writing it, so
+        the change is not reported.
+        """
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            self.seen.pop(filepath, None)
+        else:
+            self.seen[filepath] = (stat.st_mtime_ns, stat.st_size)
+        self._pending.pop(filepath, None)
+
+
+def changed_ranges(old:str, new:str) -> list[tuple[int, int]]:
+    """Returns the lines of `new` that differ from `old`.
+
+    Args:
+    ----
+        old (str): The previous text.
+        new (str): The current text.
+
+    Returns:
+    -------
+        list: The ranges `(first, last)` of the changed lines of `new`,
+        1-based and inclusive. A deletion touches the line before it.
+    """
+    matcher = difflib.SequenceMatcher(None, old.splitlines(), new.splitlines())
+    ranges = []
+    for tag, _, _, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        if j2 > j1:
+            ranges.append((j1 + 1, j2))
+        else:
+            ranges.append((max(j1, 1), max(j1, 1)))
+    return ranges
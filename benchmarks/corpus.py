@@ -0,0 +1,280 @@
+"""A generator of synthetic Python and Fortran code for the benchmarks.
+
+The code is deterministic for a seed, so the benchmarks of two commits
+run on the same corpus. The shape of a file is set by:
+
+- `units`: the number of top-level classes or functions in Python, and
+  of procedures per module in Fortran.
+- `nesting`: the depth of the documentable nodes. In Python, a unit at
+  depth 2 or more is a class whose methods nest functions down to the
+  depth. In Fortran, the procedures of a module are at depth 2, and their
+  internal procedures at depth 3.
+- `body_lines`: the number of statements in a body.
+- `continuation`: the fraction of the Fortran statements split over
+  continuation lines.
+- `documented`: the fraction of the nodes having documentation.
+
+Usage:
+    python benchmarks/corpus.py OUT_DIR [--files 10] [--lang python fortran] [--units 20] ...
+"""
+import argparse
+import os
+import random
+
+
+def python_source(
+    units:int=20,
+    nesting:int=2,
+    body_lines:int=5,
+    documented:float=0.0,
+    seed:int=0,
+) -> str:
+    """Returns the code of a synthetic Python module.
+
+    Args:
+    ----
+        units (int, optional): The number of top-level classes or
+        functions. Defaults to 20.
+        nesting (int, optional): The depth of the documentable nodes below
+        the module. Defaults to 2.
+        body_lines (int, optional): The number of statements in a body.
+        Defaults to 5.
+        documented (float, optional): The fraction of the nodes having a
+        docstring. Defaults to 0.
+        seed (int, optional): The seed of the generator. Defaults to 0.
+
+    Returns:
+    -------
+        str: The code.
+    """
+    rng = random.Random(seed)
+    lines = []
+    if rng.random() < documented:
+        lines.append('"""A synthetic module."""')
+    lines.append("import math")
+    lines.append("")
+    for unit in range(units):
+        lines.append("")
+        if nesting >= 2:
+            _python_class(lines, rng, f"Unit{unit}", 0, nesting, body_lines, documented)
+        else:
+            _python_function(lines, rng, f"unit_{unit}", 0, 1, body_lines, documented)
+    return "\n".join(lines) + "\n"
+
+
+def _python_class(lines, rng, name, indent, depth, body_lines, documented) -> None:
+    pad = " " * indent
+    lines.append(f"{pad}class {name}:")
+    if rng.random() < documented:
+        lines.append(f'{pad}    """The class {name}."""')
+    lines.append(f"{pad}    scale = {rng.randint(1, 9)}")
+    for n in range(2):
+        lines.append("")
+        _python_function(lines, rng, f"method_{n}", indent + 4, depth - 1, body_lines, documented, "self, ")
+
+
+def _python_function(lines, rng, name, indent, depth, body_lines, documented, first="") -> None:
+    pad = " " * indent
+    lines.append(f"{pad}def {name}({first}x, y=1):")
+    if rng.random() < documented:
+        lines.append(f'{pad}    """Computes {name} of x and y.')
+        lines.append("")
+        lines.append(f"{pad}    Returns the result.")
+        lines.append(f'{pad}    """')
+    if depth > 1:
+        _python_function(lines, rng, f"{name}_inner", indent + 4, depth - 1, body_lines, documented)
+    lines.append(f"{pad}    total = 0")
+    for n in range(body_lines):
+        kind = rng.randrange(3)
+        if kind == 0:
+            lines.append(f"{pad}    total += math.sqrt(abs(x * {n} + y))")
+        elif kind == 1:
+            lines.append(f"{pad}    for i in range({n + 2}):")
+            lines.append(f"{pad}        total += i * y")
+        else:
+            lines.append(f"{pad}    if x > {n}:")
+            lines.append(f"{pad}        total -= x / (y + {n + 1})")
+    lines.append(f"{pad}    return total")
+
+
+def fortran_source(
+    units:int=20,
+    nesting:int=2,
+    body_lines:int=5,
+    continuation:float=0.2,
+    documented:float=0.0,
+    seed:int=0,
+) -> str:
+    """Returns the code of a synthetic Fortran module.
+
+    Args:
+    ----
+        units (int, optional): The number of procedures of the module.
+        Defaults to 20.
+        nesting (int, optional): The depth of the documentable nodes, 1 for
+        the module alone, 2 for its procedures and 3 for their internal
+        procedures. Defaults to 2.
+        body_lines (int, optional): The number of statements in a body.
+        Defaults to 5.
+        continuation (float, optional): The fraction of the statements
+        split over continuation lines. Defaults to 0.2.
+        documented (float, optional): The fraction of the nodes having
+        documentation comments. Defaults to 0.
+        seed (int, optional): The seed of the generator. Defaults to 0.
+
+    Returns:
+    -------
+        str: The code.
+    """
+    rng = random.Random(seed)
+    name = f"synthetic_{seed}"
+    lines = [f"module {name}"]
+    _fortran_doc(lines, rng, "    ", f"The module {name}.", documented)
+    lines += [
+        "    implicit none",
+        "    private",
+        "",
+        "    type, public :: point_t",
+    ]
+    _fortran_doc(lines, rng, "        ", "A point.", documented)
+    lines += [
+        "        real :: x, y",
+        "    end type point_t",
+        "",
+    ]
+    if nesting >= 2:
+        lines.append("    public :: " + ", ".join(f"proc_{unit}" for unit in range(units)))
+        lines += ["", "contains"]
+        for unit in range(units):
+            lines.append("")
+            _fortran_procedure(
+                lines, rng, f"proc_{unit}", 4, nesting - 1, body_lines, continuation, documented,
+            )
+    lines.append(f"end module {name}")
+    return "\n".join(lines) + "\n"
+
+
+def _fortran_doc(lines, rng, pad, text, documented) -> None:
+    if rng.random() < documented:
+        lines += [f"{pad}! {text}", f"{pad}!", f"{pad}! Generated for the benchmarks."]
+
+
+def _fortran_statement(lines, rng, pad, head, tail, continuation) -> None:
+    if rng.random() < continuation:
+        lines.append(f"{pad}{head} &")
+        lines.append(f"{pad}    {tail}")
+    else:
+        lines.append(f"{pad}{head} {tail}")
+
+
+def _fortran_procedure(lines, rng, name, indent, depth, body_lines, continuation, documented) -> None:
+    pad = " " * indent
+    function = rng.random() < 0.5
+    if function:
+        _fortran_statement(lines, rng, pad, f"function {name}(a, b,", "c) result(r)", continuation)
+    else:
+        _fortran_statement(lines, rng, pad, f"subroutine {name}(a, b,", "c, r)", continuation)
+    _fortran_doc(lines, rng, pad + "    ", f"The procedure {name}.", documented)
+    lines += [
+        f"{pad}    real, intent(in) :: a, b",
+        f"{pad}    integer, intent(in) :: c",
+        f"{pad}    real{'' if function else ', intent(out)'} :: r",
+        f"{pad}    integer :: i",
+        f"{pad}    r = 0.0",
+    ]
+    for n in range(body_lines):
+        kind = rng.randrange(3)
+        if kind == 0:
+            _fortran_statement(lines, rng, pad + "    ", f"r = r + a * {n + 1}.0 +", "b / 2.0", continuation)
+        elif kind == 1:
+            lines.append(f"{pad}    do i = 1, c")
+            _fortran_statement(lines, rng, pad + "        ", "r = r +", f"real(i) * {n}.5", continuation)
+            lines.append(f"{pad}    end do")
+        else:
+            lines.append(f"{pad}    if (r > {n}.0) then")
+            lines.append(f"{pad}        r = r - b")
+            lines.append(f"{pad}    end if")
+    if depth > 1:
+        lines += [f"{pad}contains", ""]
+        _fortran_procedure(
+            lines, rng, f"{name}_inner", indent + 4, depth - 1, body_lines, continuation, documented,
+        )
+    lines.append(f"{pad}end {'function' if function else 'subroutine'} {name}")
+
+
+def write_corpus(
+    out_dir:str, files:int=10, langs:tuple=("python", "fortran"), seed:int=0, **shape,
+) -> list[str]:
+    """Writes a synthetic corpus.
+
+    Args:
+    ----
+        out_dir (str): The directory of the corpus.
+        files (int, optional): The number of files per language. Defaults
+        to 10.
+        langs (tuple, optional): The languages. Defaults to both.
+        seed (int, optional): The seed of the first file. Defaults to 0.
+        **shape: The options of `python_source` and `fortran_source`.
+        `continuation` applies to Fortran only.
+
+    Returns:
+    -------
+        list[str]: The paths of the files.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for n in range(files):
+        if "python" in langs:
+            python_shape = {key: value for key, value in shape.items() if key != "continuation"}
+            paths.append(os.path.join(out_dir, f"synthetic_{n}.py"))
+            with open(paths[-1], "w", encoding="utf-8") as f:
+                f.write(python_source(seed=seed + n, **python_shape))
+        if "fortran" in langs:
+            paths.append(os.path.join(out_dir, f"synthetic_{n}.f90"))
+            with open(paths[-1], "w", encoding="utf-8") as f:
+                f.write(fortran_source(seed=seed + n, **shape))
+    return paths
+
+
+def add_shape_arguments(parser:argparse.ArgumentParser) -> None:
+    """Adds the options of the shape of the files to a parser."""
+    parser.add_argument("--units", help="Top-level units per file.", default=20, type=int)
+    parser.add_argument("--nesting", help="Depth of the documentable nodes.", default=2, type=int)
+    parser.add_argument("--body-lines", help="Statements per body.", default=5, type=int)
+    parser.add_argument(
+        "--continuation", help="Fraction of Fortran statements with continuation lines.",
+        default=0.2, type=float,
+    )
+    parser.add_argument(
+        "--documented", help="Fraction of the nodes having documentation.", default=0.0, type=float,
+    )
+
+
+def shape_of(args:argparse.Namespace) -> dict:
+    """Returns the shape options parsed by `add_shape_arguments`."""
+    return {
+        "units": args.units,
+        "nesting": args.nesting,
+        "body_lines": args.body_lines,
+        "continuation": args.continuation,
+        "documented": args.documented,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic corpus.")
+    parser.add_argument("out_dir", help="Directory of the corpus.")
+    parser.add_argument("--files", help="Files per language.", default=10, type=int)
+    parser.add_argument(
+        "--lang", help="Languages.", nargs="+", default=["python", "fortran"],
+        choices=["python", "fortran"],
+    )
+    parser.add_argument("--seed", help="Seed of the first file.", default=0, type=int)
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+    paths = write_corpus(args.out_dir, args.files, tuple(args.lang), args.seed, **shape_of(args))
+    print(f"Wrote {len(paths)} files to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
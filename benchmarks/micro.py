@@ -0,0 +1,179 @@
+"""Micro-benchmarks of the parsers, the serializers and the insertion of
+the documentation.
+
+The cases run on a synthetic file generated by `corpus.py`, in-process,
+several times, and the median and the minimum of the times are reported.
+The objects a case works on, e.g. a parsed tree for `to_str`, are made
+before each run and are not timed:
+
+- fortran.parse: `FortranAST` of the source.
+- fortran.walk: `FortranAST.walk` over the whole tree.
+- fortran.to_str: `FortranAST.to_str` of a tree whose nodes were all
+  documented, so nothing is cached.
+- fortran.insert_docs: `FortranCode.insert_docs` with `DummyEngine`.
+- python.parse: `PyCode.from_string` of the source.
+- python.insert_docs: `PyCode.insert_docs` with `DummyEngine`.
+- python.write: `PyCode.write` of the documented code to a new file,
+  with `ast.unparse`.
+
+The results, with the commit, the Python version and the shape of the
+corpus, can be written as JSON with `--json`, and compared with the
+results of another commit with `--compare`.
+
+Usage:
+    python benchmarks/micro.py [--repeat 20] [--units 200] [--json out.json] [--compare base.json]
+
+The exit status is 1 if a case is slower than `--max-slowdown` times its
+compared median.
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from autodog.ast.fortran import FortranAST  # noqa: E402
+from autodog.code.fortran import FortranCode  # noqa: E402
+from autodog.code.python import PyCode  # noqa: E402
+from autodog.docmodel.google import GoogleStyleDocstring  # noqa: E402
+from autodog.engine.dummy import DummyEngine  # noqa: E402
+from corpus import add_shape_arguments, fortran_source, python_source, shape_of  # noqa: E402
+
+
+def measure(run:Callable[[any], any], setup:Callable[[], any], repeat:int) -> dict:
+    """Times a function on fresh objects.
+
+    Args:
+    ----
+        run (Callable): The timed function, called with the result of
+        `setup`.
+        setup (Callable): Makes the object of a run, without being timed.
+        repeat (int): The number of runs.
+
+    Returns:
+    -------
+        dict: The median and the minimum times in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        obj = setup()
+        start = time.perf_counter()
+        run(obj)
+        times.append(time.perf_counter() - start)
+    return {"median": statistics.median(times), "min": min(times)}
+
+
+def cases(shape:dict, out_dir:str) -> dict[str, tuple[Callable, Callable]]:
+    """Returns the cases, by name, as the timed function and its setup."""
+    fortran_shape = dict(shape)
+    python_shape = {key: value for key, value in shape.items() if key != "continuation"}
+    fortran = fortran_source(**fortran_shape)
+    python = python_source(**python_shape)
+    engine = DummyEngine()
+    doc_model = GoogleStyleDocstring()
+    # Every run writes a new file, which is not compared with its content.
+    out_paths = (os.path.join(out_dir, f"out_{n}.py") for n in itertools.count())
+
+    def fortran_documented():
+        tree = FortranAST(fortran)
+        for node in tree.walk_documentable(overwrite=True):
+            node.write_doc("A benchmark document.")
+        return tree
+
+    def python_documented():
+        code = PyCode.from_string(python, next(out_paths))
+        code.insert_docs(engine, doc_model, overwrite=True)
+        return code
+
+    return {
+        "fortran.parse": (FortranAST, lambda: fortran),
+        "fortran.walk": (lambda tree: sum(1 for _ in tree.walk()), lambda: FortranAST(fortran)),
+        "fortran.to_str": (lambda tree: tree.to_str(), fortran_documented),
+        "fortran.insert_docs": (
+            lambda code: code.insert_docs(engine, doc_model, overwrite=True),
+            lambda: FortranCode.from_string(fortran),
+        ),
+        "python.parse": (lambda source: PyCode.from_string(source), lambda: python),
+        "python.insert_docs": (
+            lambda code: code.insert_docs(engine, doc_model, overwrite=True),
+            lambda: PyCode.from_string(python),
+        ),
+        "python.write": (lambda code: code.write(), python_documented),
+    }
+
+
+def _commit() -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True,
+        )
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the parsers, the serializers and the insertion of AutoDog."
+    )
+    parser.add_argument("--repeat", help="Number of runs of each case.", default=20, type=int)
+    parser.add_argument("--case", help="Run only the cases whose name contains this.", default="")
+    parser.add_argument("--json", help="Write the results to this file.", default=None)
+    parser.add_argument("--compare", help="Compare with the results in this JSON file.", default=None)
+    parser.add_argument(
+        "--max-slowdown",
+        help="Fail a case whose median is this many times the compared median.",
+        default=None,
+        type=float,
+    )
+    add_shape_arguments(parser)
+    parser.set_defaults(units=200)
+    args = parser.parse_args()
+
+    shape = shape_of(args)
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("shape") != shape:
+            print(f"Warning: {args.compare} was run on a corpus of another shape.")
+    results = {
+        "commit": _commit(),
+        "python": sys.version.split()[0],
+        "shape": shape,
+        "repeat": args.repeat,
+        "cases": {},
+    }
+    failed = False
+    with tempfile.TemporaryDirectory() as out_dir:
+        for name, (run, setup) in cases(shape, out_dir).items():
+            if args.case not in name:
+                continue
+            result = measure(run, setup, args.repeat)
+            results["cases"][name] = result
+            line = f"{name:<22} median {1000 * result['median']:9.3f} ms  min {1000 * result['min']:9.3f} ms"
+            base = None if baseline is None else baseline["cases"].get(name)
+            if base is not None:
+                ratio = result["median"] / base["median"]
+                line += f"  x{ratio:.2f} vs {baseline.get('commit') or args.compare}"
+                if args.max_slowdown is not None and ratio > args.max_slowdown:
+                    line += "  FAILED"
+                    failed = True
+            print(line)
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""A benchmark of the startup time of AutoDog.
+
+Every case runs in a fresh interpreter, several times, and the median
+and the minimum of the wall times are reported, together with the heavy
+modules each case imported. Importing the package or running
+`autodog -h` must not load `openai` or the language backends, so a case
+fails if it imports one of its forbidden modules, or if its median time
+exceeds `--max-seconds`.
+
+Usage:
+    python benchmarks/startup.py [--repeat 10] [--max-seconds 0.3] [--json out.json]
+
+The exit status is 1 if a case failed.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# The modules a case must not import, because they are loaded on demand.
+_HEAVY_MODULES = ("openai", "autodog.engine.chatgpt", "autodog.code.python", "autodog.code.fortran")
+
+# The name, the code run by the interpreter and the modules it must not
+# import.
+CASES = (
+    ("import autodog", "import autodog", _HEAVY_MODULES),
+    ("import autodog.app", "import autodog.app", _HEAVY_MODULES),
+    (
+        "autodog -h",
+        "import sys; sys.argv = ['autodog', '-h']\n"
+        "from autodog.app import app\n"
+        "try:\n    app()\nexcept SystemExit:\n    pass",
+        _HEAVY_MODULES,
+    ),
+    (
+        "dummy engine",
+        "import autodog; autodog.engine('dummy')",
+        ("openai", "autodog.engine.chatgpt"),
+    ),
+)
+
+_REPORT_MODULES = (
+    "import sys, json; "
+    "print(json.dumps(sorted(m for m in {modules!r} if m in sys.modules)), file=sys.stderr)"
+)
+
+
+def run_case(code:str, heavy:tuple, repeat:int) -> dict:
+    """Runs the code in fresh interpreters.
+
+    Args:
+    ----
+        code (str): The code.
+        heavy (tuple): The modules the code must not import.
+        repeat (int): The number of runs.
+
+    Returns:
+    -------
+        dict: The median and the minimum wall times in seconds, and the
+        heavy modules imported.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    script = code + "\n" + _REPORT_MODULES.format(modules=heavy)
+    times = []
+    imported = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True,
+        )
+        times.append(time.perf_counter() - start)
+        imported = json.loads(result.stderr.strip().splitlines()[-1])
+    return {
+        "median": round(statistics.median(times), 6),
+        "min": round(min(times), 6),
+        "imported": imported,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the startup time of AutoDog.")
+    parser.add_argument("--repeat", help="Number of runs of each case.", default=10, type=int)
+    parser.add_argument(
+        "--max-seconds",
+        help="Fail a case whose median time exceeds this number of seconds.",
+        default=None,
+        type=float,
+    )
+    parser.add_argument("--json", help="Write the results to this file.", default=None)
+    args = parser.parse_args()
+
+    baseline = run_case("pass", (), args.repeat)
+    results = {"python": sys.version.split()[0], "interpreter": baseline, "cases": {}}
+    failed = False
+    for name, code, heavy in CASES:
+        result = run_case(code, heavy, args.repeat)
+        result["failed"] = bool(result["imported"]) or (
+            args.max_seconds is not None and result["median"] > args.max_seconds
+        )
+        failed = failed or result["failed"]
+        results["cases"][name] = result
+        print(
+            f"{name:<20} median {result['median']:.3f} s  min {result['min']:.3f} s"
+            + (f"  imported {', '.join(result['imported'])}" if result["imported"] else "")
+            + ("  FAILED" if result["failed"] else "")
+        )
+    print(f"{'(interpreter)':<20} median {baseline['median']:.3f} s  min {baseline['min']:.3f} s")
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+module fortran_programmer_module
+    ! Node 0.
+    ! Second line.
+    implicit none
+
+    private
+
+    type, public, extends(programmer) :: fortran_programmer_class
+        ! Node 1.
+        ! Second line.
+        private
+
+        character(:),allocatable :: language
+
+        contains
+
+        procedure, public, pass(self) :: initialize
+        procedure, public, pass(self) :: who_is
+    end type fortran_programmer_class
+
+    contains
+
+    subroutine initialize(self, language)
+        ! Node 2.
+        ! Second line.
+        class(fortran_programmer_class), intent(inout) :: self
+        character(:), allocatable, intent(in), optional :: language
+
+        if (present(language)) then
+            allocate(self%language, source = language)
+            return
+        end if
+        allocate(self%language, source = 'Fortran')
+    end subroutine initialize
+
+    subroutine who_is(self)
+        ! Node 3.
+        ! Second line.
+        class(fortran_programmer_class), intent(inout) :: self
+
+        print *, 'I am '//self%language//' programmer'
+    end subroutine who_is
+end module fortran_programmer_module
+
+program we_love_fortran
+    ! Node 4.
+    ! Second line.
+    use fortran_programmer_module
+    implicit none
+
+    type(fortran_programmer_class) :: programmer
+
+    call programmer%initialize()
+    call programmer%who_is()
+end program
\ No newline at end of file
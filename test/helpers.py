@@ -0,0 +1,80 @@
+"""Shared helpers of the tests.
+
+The tests run with `python -m pytest test` from the root of the
+repository. The CLI is run in a subprocess by `run_autodog`, so a run has
+its own working directory, standard streams and exit status.
+"""
+import os
+import shutil
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A Python module with a function, a class and two methods.
+SOURCE = '''def add_{n}(a, b):
+    return a + b
+
+
+class Counter{n}:
+
+    def __init__(self):
+        self.count = 0
+
+    def increment(self, step=1):
+        self.count += step
+        return self.count
+'''
+
+
+def run_autodog(
+    cwd, *args, setup:str="", check:bool=True, stdin:str=None, timeout:float=60, text:bool=True,
+):
+    """Runs the CLI in a subprocess.
+
+    Args:
+    ----
+        cwd: The working directory.
+        *args: The arguments of the CLI.
+        setup (str, optional): Python code run before the CLI, e.g. to
+        patch the dummy engine.
+        check (bool, optional): Flag to assert that the exit status is 0.
+        stdin (str, optional): The standard input.
+        timeout (float, optional): The timeout in seconds.
+        text (bool, optional): Flag to pass the standard streams as text
+        rather than bytes, e.g. to compare outputs byte for byte. The
+        standard input is encoded in UTF-8 if it is False. Defaults to
+        True.
+
+    Returns:
+    -------
+        subprocess.CompletedProcess: The result, with the outputs as text
+        or bytes.
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    result = subprocess.run(
+        [sys.executable, "-c", f"{setup}\nfrom autodog.app import app\napp()", *args],
+        cwd=cwd, env=env, input=stdin if text or stdin is None else stdin.encode("utf-8"),
+        capture_output=True, text=text, timeout=timeout,
+    )
+    if check:
+        assert result.returncode == 0, result.stderr
+    return result
+
+
+def checkout(tmp_path, n_files:int=6):
+    """Writes a fresh tree of `n_files` modules of `SOURCE` to `src` in
+    `tmp_path`, replacing the previous one, and returns its path.
+    """
+    src = tmp_path / "src"
+    if src.exists():
+        shutil.rmtree(src)
+    src.mkdir()
+    for n in range(n_files):
+        (src / f"m{n}.py").write_text(SOURCE.format(n=n), encoding="utf-8")
+    return src
+
+
+def read_tree(src) -> dict:
+    """Returns the contents of the files of a directory by name."""
+    return {path.name: path.read_text(encoding="utf-8") for path in sorted(src.iterdir())}
@@ -0,0 +1,134 @@
+"""Tests of an offline batch job: the requests of a tree are exported,
+answered as a provider would with the dummy engine, and the responses
+are ingested, which must give the output of a live run.
+
+Usage:
+    python -m pytest test/test_batch.py
+"""
+import json
+import os
+
+from helpers import checkout, read_tree, run_autodog
+
+from autodog.engine.dummy import DummyEngine
+
+FORTRAN = {
+    "a.f90": """\
+module ma
+contains
+    subroutine s(x)
+        real :: x
+    end subroutine s
+end module ma
+""",
+    "b.f90": """\
+module mb
+    use ma
+contains
+    function f(x)
+        real :: x, f
+        f = x
+    end function f
+end module mb
+""",
+}
+
+OPTIONS = ("src", "-r", "--engine", "dummy", "-e", "py,f90", "-j", "1")
+
+
+def source_tree(tmp_path):
+    src = checkout(tmp_path, n_files=3)
+    for name, code in FORTRAN.items():
+        (src / name).write_text(code)
+    return src
+
+
+def answer(batch) -> list:
+    """Returns the responses of the dummy engine to the entries of a batch
+    file.
+    """
+    engine = DummyEngine()
+    responses = []
+    for line in batch.read_text().splitlines():
+        entry = json.loads(line)
+        doc = engine.generate_doc(
+            entry["code"], entry["lang"], entry["statement_kind"], entry["doc_format"],
+            entry["context"],
+        )
+        responses.append({"custom_id": entry["custom_id"], "doc": doc})
+    return responses
+
+
+def write_responses(path, responses) -> None:
+    path.write_text("".join(json.dumps(response) + "\n" for response in responses))
+
+
+def done_files(journal) -> set:
+    """Returns the files marked done in a journal, relative to its
+    directory.
+    """
+    entries = [json.loads(line) for line in journal.read_text().splitlines()]
+    return {
+        os.path.relpath(entry["file"], journal.parent).replace(os.sep, "/")
+        for entry in entries if entry.get("done")
+    }
+
+
+def test_export_and_ingest_match_a_live_run(tmp_path):
+    src = source_tree(tmp_path)
+    run_autodog(tmp_path, *OPTIONS)
+    expected = read_tree(src)
+
+    src = source_tree(tmp_path)
+    source = read_tree(src)
+    batch, journal = tmp_path / "batch.jsonl", tmp_path / "journal.jsonl"
+    run_autodog(tmp_path, *OPTIONS, "--export-batch", str(batch), "--journal", str(journal))
+    responses = answer(batch)
+    # 3 Python files of 5 nodes and 2 Fortran modules of 2 nodes.
+    assert len(responses) == 19
+    assert read_tree(src) == source
+
+    # A response of another tree matches no node.
+    stray = {"custom_id": "gone.py::g", "doc": "Stray."}
+    write_responses(tmp_path / "responses.jsonl", [*responses, stray])
+    result = run_autodog(
+        tmp_path, *OPTIONS, "--ingest-batch", str(tmp_path / "responses.jsonl"),
+        "--journal", str(journal),
+    )
+    assert read_tree(src) == expected
+    assert "Warning: 1 responses match no node, e.g. gone.py::g" in result.stdout
+    assert done_files(journal) == {f"src/{name}" for name in expected}
+
+
+def test_missing_responses_are_not_marked_done(tmp_path):
+    src = source_tree(tmp_path)
+    run_autodog(tmp_path, *OPTIONS)
+    expected = read_tree(src)
+
+    src = source_tree(tmp_path)
+    batch, journal = tmp_path / "batch.jsonl", tmp_path / "journal.jsonl"
+    run_autodog(tmp_path, *OPTIONS, "--export-batch", str(batch), "--journal", str(journal))
+    responses = answer(batch)
+    # The responses of a function of m1.py and of the function of b.f90
+    # are lost, e.g. their requests failed.
+    lost = {"m1.py::add_1", "b.f90::mb.f"}
+    write_responses(
+        tmp_path / "responses.jsonl",
+        [response for response in responses if response["custom_id"] not in lost],
+    )
+    result = run_autodog(
+        tmp_path, *OPTIONS, "--ingest-batch", str(tmp_path / "responses.jsonl"),
+        "--journal", str(journal),
+    )
+    assert "Insert 4 documents to src/m1.py, 1 are missing" in result.stdout
+    assert "Insert 1 documents to src/b.f90, 1 are missing" in result.stdout
+    assert "Warning" not in result.stdout
+    assert done_files(journal) == {"src/a.f90", "src/m0.py", "src/m2.py"}
+    documented = read_tree(src)
+    assert documented["m0.py"] == expected["m0.py"]
+    assert documented["m1.py"] != expected["m1.py"]
+
+    # The export of the next round asks only for the missing documents,
+    # the others are taken from the journal.
+    run_autodog(tmp_path, *OPTIONS, "--export-batch", str(batch), "--journal", str(journal))
+    assert sorted(entry["custom_id"] for entry in answer(batch)) == sorted(lost)
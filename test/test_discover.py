@@ -0,0 +1,171 @@
+"""Tests of the selection of the files to be documented: the
+`--extension` option of the command line and the gitignore-style rules of
+`autodog.utils.discover`.
+
+Usage:
+    python -m pytest test/test_discover.py
+"""
+import os
+
+from helpers import run_autodog
+
+from autodog.utils.discover import IgnoreRules, iter_files
+
+FORTRAN = """\
+subroutine s(x)
+    real :: x
+end subroutine s
+"""
+
+PYTHON = """\
+def f(x):
+    return x
+"""
+
+
+def documented(tmp_path, *args) -> set:
+    """Documents a tree of a Fortran file and a Python file with the dummy
+    engine, and returns the names of the documented files.
+    """
+    src = tmp_path / "src"
+    src.mkdir(exist_ok=True)
+    (src / "a.f90").write_text(FORTRAN)
+    (src / "b.py").write_text(PYTHON)
+    run_autodog(tmp_path, *args, "--engine", "dummy")
+    return {
+        path.name for path, code in ((src / "a.f90", FORTRAN), (src / "b.py", PYTHON))
+        if path.read_text() != code
+    }
+
+
+def test_extension_does_not_take_the_path(tmp_path):
+    assert documented(tmp_path, "-r", "-e", "f90", "src") == {"a.f90"}
+    assert documented(tmp_path, "-r", "src") == {"b.py"}
+
+
+def test_several_extensions(tmp_path):
+    assert documented(tmp_path, "-r", "-e", "py,f90", "src") == {"a.f90", "b.py"}
+    assert documented(tmp_path, "src", "-r", "-e", "py", "-e", "f90") == {"a.f90", "b.py"}
+
+
+def test_unknown_extension(tmp_path):
+    result = run_autodog(tmp_path, "-r", "-e", "src", "src", check=False)
+    assert result.returncode == 2
+    assert "invalid choice: 'src'" in result.stderr
+
+
+def test_ignore_rules_negation():
+    rules = IgnoreRules(["*.py", "!keep.py", "# a comment", ""])
+    assert rules.match("a.py", False) is True
+    assert rules.match("pkg/a.py", False) is True
+    assert rules.match("keep.py", False) is False
+    assert rules.match("pkg/keep.py", False) is False
+    assert rules.match("a.f90", False) is None
+    # The last matching rule wins.
+    assert IgnoreRules(["!keep.py", "*.py"]).match("keep.py", False) is True
+
+
+def test_ignore_rules_anchored():
+    rules = IgnoreRules(["/top.py", "doc/gen.py"])
+    assert rules.match("top.py", False) is True
+    assert rules.match("pkg/top.py", False) is None
+    assert rules.match("doc/gen.py", False) is True
+    assert rules.match("pkg/doc/gen.py", False) is None
+    # Unanchored patterns match at any depth.
+    assert IgnoreRules(["gen.py"]).match("pkg/doc/gen.py", False) is True
+
+
+def test_ignore_rules_directory_only():
+    rules = IgnoreRules(["out/"])
+    assert rules.match("out", True) is True
+    assert rules.match("pkg/out", True) is True
+    assert rules.match("out", False) is None
+
+
+def test_ignore_rules_double_star():
+    rules = IgnoreRules(["**/gen/*.py", "data/**", "a/**/b.py"])
+    assert rules.match("gen/x.py", False) is True
+    assert rules.match("pkg/sub/gen/x.py", False) is True
+    assert rules.match("pkg/gen/sub/x.py", False) is None
+    assert rules.match("data/x/y.py", False) is True
+    assert rules.match("pkg/data/x.py", False) is None
+    assert rules.match("a/b.py", False) is True
+    assert rules.match("a/x/y/b.py", False) is True
+    # A single star does not cross directories.
+    assert IgnoreRules(["/a/*.py"]).match("a/x/b.py", False) is None
+
+
+def test_ignore_rules_base():
+    rules = IgnoreRules(["/x.py"], base="pkg")
+    assert rules.match("pkg/x.py", False) is True
+    assert rules.match("x.py", False) is None
+    assert rules.match("pkg/sub/x.py", False) is None
+
+
+def test_nested_gitignore_files(tmp_path):
+    for path in (
+        "a.py", "gen.py", "keep/gen.py", "pkg/b.py", "pkg/gen.py", "pkg/local.py",
+        "pkg/sub/local.py", "pkg/out/c.py", "out.py", "build/d.py", "env/e.py",
+    ):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text("")
+    (tmp_path / "env" / "pyvenv.cfg").write_text("")
+    (tmp_path / ".gitignore").write_text("gen.py\nout/\n")
+    (tmp_path / "keep" / ".gitignore").write_text("!gen.py\n")
+    (tmp_path / "pkg" / ".gitignore").write_text("/local.py\n")
+    found = {
+        os.path.relpath(path, tmp_path).replace(os.sep, "/") for path in iter_files(str(tmp_path), ["py"])
+    }
+    assert found == {"a.py", "keep/gen.py", "out.py", "pkg/b.py", "pkg/sub/local.py"}
+    assert set(iter_files(str(tmp_path), ["py"], use_ignore_files=False)) >= {
+        str(tmp_path / "gen.py"), str(tmp_path / "pkg" / "local.py"),
+    }
+
+
+def test_listings_of_unmodified_directories_are_reused(tmp_path, monkeypatch):
+    for path in ("a.py", "pkg/b.py", "pkg/sub/c.py", "pkg/sub/gen.py", "other/d.py"):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text("")
+    (tmp_path / "pkg" / ".gitignore").write_text("gen.py\n")
+    past = 1_000_000_000
+
+    def age(*paths):
+        # The listings of the directories modified recently are not kept.
+        for path in paths:
+            os.utime(tmp_path / path, ns=(past, past))
+
+    age(".", "pkg", "pkg/sub", "other", "pkg/.gitignore")
+    listed = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path: listed.append(path) or scandir(path))
+
+    def walk():
+        listed.clear()
+        files = iter_files(str(tmp_path), ["py"], listings=listings)
+        return sorted(os.path.relpath(file, tmp_path).replace(os.sep, "/") for file in files)
+
+    listings = {}
+    expected = ["a.py", "other/d.py", "pkg/b.py", "pkg/sub/c.py"]
+    assert walk() == expected
+    assert len(listed) == 4
+    assert walk() == expected
+    assert listed == []
+
+    # A new file is found in its directory, which alone is listed again.
+    (tmp_path / "pkg" / "sub" / "e.py").write_text("")
+    assert walk() == [*expected, "pkg/sub/e.py"]
+    assert listed == [str(tmp_path / "pkg" / "sub")]
+    age("pkg/sub")
+
+    # A modified .gitignore file applies to the subdirectories.
+    (tmp_path / "pkg" / ".gitignore").write_text("e.py\n")
+    past += 1
+    age("pkg/.gitignore")
+    assert walk() == ["a.py", "other/d.py", "pkg/b.py", "pkg/sub/c.py", "pkg/sub/gen.py"]
+    assert sorted(listed) == [str(tmp_path / "pkg"), str(tmp_path / "pkg" / "sub")]
+    assert walk() == ["a.py", "other/d.py", "pkg/b.py", "pkg/sub/c.py", "pkg/sub/gen.py"]
+    assert listed == []
+
+    # Other arguments start afresh.
+    assert len(list(iter_files(str(tmp_path), ["py"], ["other/"], listings=listings))) == 4
+    assert len(listed) == 3
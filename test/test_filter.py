@@ -0,0 +1,75 @@
+"""Tests of the filter mode, which documents the code of the standard
+input and writes it to the standard output, e.g. for an editor.
+
+Usage:
+    python -m pytest test/test_filter.py
+"""
+import pytest
+
+from helpers import SOURCE, run_autodog
+
+FORTRAN = """\
+module m
+contains
+    subroutine s(x)
+        real :: x
+        x = 0.0
+    end subroutine s
+end module m
+"""
+
+# Prints to the standard output while the documents are generated, as a
+# chatty engine or library would.
+NOISY_SETUP = '''
+from autodog.engine.dummy import DummyEngine
+
+_generate_doc = DummyEngine.generate_doc
+
+def generate_doc(self, *args, **kwargs):
+    print("noise")
+    return _generate_doc(self, *args, **kwargs)
+
+DummyEngine.generate_doc = generate_doc
+'''
+
+
+@pytest.mark.parametrize("lang, name, source", [
+    ("python", "m.py", SOURCE.format(n=0)),
+    ("python", "m.py", SOURCE.format(n=0).replace("\n", "\r\n")),
+    ("python", "m.py", "x = 1"),
+    ("fortran", "m.f90", FORTRAN),
+])
+def test_filter_matches_a_file_run(tmp_path, lang, name, source):
+    path = tmp_path / name
+    path.write_bytes(source.encode("utf-8"))
+    run_autodog(tmp_path, name, "--engine", "dummy", setup=NOISY_SETUP)
+    expected = path.read_bytes()
+    assert expected != source.encode("utf-8")
+
+    result = run_autodog(
+        tmp_path, "-", "--lang", lang, "--engine", "dummy", setup=NOISY_SETUP,
+        stdin=source, text=False,
+    )
+    # Nothing but the code is written to the standard output.
+    assert result.stdout == expected
+    assert b"noise" in result.stderr
+    assert not (tmp_path / ".autodog-journal.jsonl").exists()
+
+
+def test_filter_writes_nothing_when_it_fails(tmp_path):
+    setup = '''
+from autodog.engine.dummy import DummyEngine
+
+def generate_doc(self, *args, **kwargs):
+    print("noise")
+    raise RuntimeError("engine failure")
+
+DummyEngine.generate_doc = generate_doc
+'''
+    result = run_autodog(
+        tmp_path, "-", "--lang", "python", "--engine", "dummy",
+        setup=setup, stdin=SOURCE.format(n=0), check=False,
+    )
+    assert result.returncode != 0
+    assert "engine failure" in result.stderr
+    assert result.stdout == ""
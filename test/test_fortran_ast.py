@@ -0,0 +1,196 @@
+"""Tests of the Fortran parser and serializer.
+
+The tree and the documented output of `test/fortran/in.f90` are compared
+with `in.tree.json` and `in.documented.f90`, which were written by the
+parser of the first release, before it was rewritten as a single pass.
+
+Usage:
+    python -m pytest test/test_fortran_ast.py
+"""
+import json
+import os
+
+from autodog.ast.fortran import FortranAST, StatementNode
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fortran")
+
+
+def read(name:str) -> str:
+    with open(os.path.join(DATA, name), encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def statements(node, depth:int=0) -> list:
+    """Returns the statement nodes under a node as rows of their depth,
+    class, statement, documentation and end statement.
+    """
+    rows = []
+    for child in node.children:
+        if isinstance(child, StatementNode):
+            rows.append([depth, type(child).__name__, child.statement, child.doc, child.end_statement])
+            rows += statements(child, depth + 1)
+        else:
+            rows += statements(child, depth)
+    return rows
+
+
+def document_all(tree:FortranAST) -> None:
+    for n, node in enumerate(tree.walk_documentable()):
+        node.write_doc(f"Node {n}.\nSecond line.")
+
+
+def test_tree_matches_baseline():
+    tree = FortranAST(read("in.f90"))
+    assert statements(tree.tree) == json.loads(read("in.tree.json"))
+
+
+def test_documented_output_matches_baseline():
+    tree = FortranAST(read("in.f90"))
+    document_all(tree)
+    assert tree.to_str() == read("in.documented.f90")
+
+
+def test_undocumented_output_is_the_input():
+    code = read("in.f90")
+    assert FortranAST(code).to_str() == code
+    assert FortranAST(code + "\n").to_str() == code + "\n"
+
+
+def test_crlf():
+    code = read("in.f90").replace("\n", "\r\n")
+    tree = FortranAST(code)
+    assert tree.to_str() == code
+    assert statements(tree.tree) == json.loads(read("in.tree.json"))
+    document_all(tree)
+    assert tree.to_str() == read("in.documented.f90").replace("\n", "\r\n")
+
+
+NESTED = """\
+module outer
+contains
+    subroutine a(x)
+        real :: x
+    contains
+        subroutine b(y)
+            real :: y
+        contains
+            subroutine c()
+            end subroutine c
+        end subroutine b
+    end subroutine a
+    function f(x) result(r)
+        real :: x, r
+        r = g(x)
+    contains
+        function g(y)
+            real :: y, g
+            g = y
+        end function g
+    end function f
+end module outer
+"""
+
+
+def test_nested_blocks_of_the_same_kind():
+    rows = statements(FortranAST(NESTED).tree)
+    assert [(depth, kind, end.strip()) for depth, kind, _, _, end in rows] == [
+        (0, "ModuleNode", "end module outer"),
+        (1, "SubroutineNode", "end subroutine a"),
+        (2, "SubroutineNode", "end subroutine b"),
+        (3, "SubroutineNode", "end subroutine c"),
+        (1, "FunctionNode", "end function f"),
+        (2, "FunctionNode", "end function g"),
+    ]
+    assert FortranAST(NESTED).to_str() == NESTED
+
+
+BARE_END = """\
+program main
+    call s(1.0)
+contains
+    subroutine s(x)
+        real :: x
+        if (x > 0.0) then
+            x = 0.0
+        end if
+        do while (x < 1.0)
+            x = x + 1.0
+        enddo
+    end
+    real function f(x)
+        real :: x
+        f = x
+    end
+end
+"""
+
+
+def test_bare_end_closes_the_innermost_block():
+    tree = FortranAST(BARE_END)
+    rows = statements(tree.tree)
+    assert [(depth, kind, statement.strip()) for depth, kind, statement, _, _ in rows] == [
+        (0, "ProgramNode", "program main"),
+        (1, "SubroutineNode", "subroutine s(x)"),
+        (1, "FunctionNode", "real function f(x)"),
+    ]
+    assert [end for _, _, _, _, end in rows] == ["end", "    end", "    end"]
+    document_all(tree)
+    documented = tree.to_str()
+    assert documented.count("! Node") == 3
+    assert "    subroutine s(x)\n        ! Node 1.\n" in documented
+
+
+CONTAINS = """\
+module shapes
+    implicit none
+    type :: circle
+        real :: radius
+    contains
+        procedure :: area
+    end type circle
+contains
+    ! Not the documentation of a node.
+    function area(self)
+        ! The area of a circle.
+        class(circle), intent(in) :: self
+        real :: area
+        area = 3.14 * self%radius**2
+    end function area
+end module shapes
+"""
+
+
+def test_contains_sections():
+    tree = FortranAST(CONTAINS)
+    rows = statements(tree.tree)
+    assert [(depth, kind, doc) for depth, kind, _, doc, _ in rows] == [
+        (0, "ModuleNode", ""),
+        (1, "TypeNode", ""),
+        (1, "FunctionNode", "        ! The area of a circle."),
+    ]
+    assert tree.count_documentable(overwrite=False) == 2
+    for node in tree.walk_documentable(overwrite=False):
+        node.write_doc("Documented.")
+    documented = tree.to_str()
+    assert documented.count("! Documented.") == 2
+    assert "    contains\n        procedure :: area\n" in documented
+    assert "contains\n    ! Not the documentation of a node.\n    function area" in documented
+
+
+def test_write_doc_invalidates_the_ancestors():
+    tree = FortranAST(NESTED)
+    nodes = {node.name: node for node in tree.walk_documentable()}
+    ancestors = [nodes["a"], nodes["outer"]]
+    before = [node.to_str() for node in ancestors]
+    assert tree.to_str() == NESTED
+
+    nodes["b"].write_doc("The inner subroutine.")
+    head = "subroutine b(y)\n"
+    doc = "            ! The inner subroutine.\n"
+    assert nodes["b"].to_str().lstrip().startswith(head + doc)
+    for node, text in zip(ancestors, before):
+        assert node.to_str() == text.replace(head, head + doc)
+    assert tree.to_str() == NESTED.replace(head, head + doc)
+    # The sibling subtrees are not edited.
+    assert not nodes["c"]._dirty and not nodes["f"]._dirty
+    assert nodes["f"].to_str() in NESTED
@@ -0,0 +1,123 @@
+"""Tests of the documentation of the changes since a git ref: the changed
+lines read from a real `git diff -U0`, the nodes they touch and the
+documents regenerated by `--since`.
+
+Usage:
+    python -m pytest test/test_gitdiff.py
+"""
+import subprocess
+
+from helpers import run_autodog
+
+from autodog.code.python import PyCode
+from autodog.utils.gitdiff import changed_lines, drop_blank_lines, touched_spans
+
+BEFORE = '''\
+class A:
+    """The class A."""
+
+    def f(self, x):
+        """Returns x."""
+        return x
+
+    def g(self, x):
+        """Returns x."""
+        return x
+
+
+def h(x):
+    """Returns x."""
+    return x
+
+
+def k(x):
+    return x
+'''
+
+# `f` gets a new line of code, `g` a new docstring with its code, a blank
+# line is added between `g` and `h`, `h` is untouched and `k` gets a new
+# line of code.
+AFTER = '''\
+class A:
+    """The class A."""
+
+    def f(self, x):
+        """Returns x."""
+        x = x + 1
+        return x
+
+    def g(self, x):
+        """Returns x + 1."""
+        return x + 1
+
+
+
+def h(x):
+    """Returns x."""
+    return x
+
+
+def k(x):
+    x = x + 1
+    return x
+'''
+
+
+def git(cwd, *args) -> None:
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd, check=True, capture_output=True,
+    )
+
+
+def repository(tmp_path) -> None:
+    git(tmp_path, "init", "-q")
+    (tmp_path / "m.py").write_text(BEFORE)
+    git(tmp_path, "add", "m.py")
+    git(tmp_path, "commit", "-q", "-m", "before")
+    (tmp_path / "m.py").write_text(AFTER)
+
+
+def test_changed_lines(tmp_path):
+    repository(tmp_path)
+    (tmp_path / "new.py").write_text("a = 1\nb = 2\n")
+    changes = changed_lines("HEAD", cwd=str(tmp_path))
+    changes = {path.rsplit("/", 1)[-1]: ranges for path, ranges in changes.items()}
+    assert changes == {"m.py": [(6, 6), (10, 12), (21, 21)], "new.py": [(1, 2)]}
+
+
+def test_touched_spans_of_a_diff(tmp_path):
+    repository(tmp_path)
+    ranges = changed_lines("HEAD", cwd=str(tmp_path))[str(tmp_path / "m.py")]
+    lines = AFTER.splitlines()
+    assert drop_blank_lines(ranges, lines) == [(6, 6), (10, 11), (21, 21)]
+    assert drop_blank_lines([(11, 15), (1, 3)], lines) == [(11, 11), (15, 15), (1, 2)]
+
+    # The spans of the module, A, f, g, h and k.
+    spans = [(1, 22), (1, 11), (4, 7), (9, 11), (15, 17), (20, 22)]
+    assert touched_spans(spans, drop_blank_lines(ranges, lines)) == {2, 3, 5}
+    # The blank line touches the module.
+    assert touched_spans(spans, ranges) == {0, 2, 3, 5}
+    assert touched_spans(spans, [(2, 3), (8, 8), (16, 16)]) == {1, 4}
+    assert touched_spans(spans, [(1, 22)]) == set(range(6))
+    assert touched_spans(spans, []) == set()
+
+    code = PyCode("m.py", AFTER)
+    names = {getattr(node, "name", "<module>") for node in code.touched_nodes(ranges)}
+    assert names == {"f", "g", "k"}
+
+
+def test_since_documents_the_changed_nodes_again(tmp_path):
+    repository(tmp_path)
+    run_autodog(tmp_path, "m.py", "--engine", "dummy", "--since", "HEAD")
+    documented = (tmp_path / "m.py").read_text()
+    # The docstring of `f` is stale, the one of `g` was written with the
+    # change and `h` is not changed.
+    assert documented.count("This is a dummy document.") == 2
+    assert '"""Returns x + 1."""' in documented
+    assert documented.count('"""Returns x."""') == 1
+    tree = PyCode("m.py", documented)
+    docs = {node.name: node.body[0].value.value for node in tree.tree.body if hasattr(node, "name")}
+    assert "dummy" in docs["k"] and docs["h"] == "Returns x."
+    f = tree.tree.body[0].body[1]
+    assert f.name == "f" and "dummy" in f.body[0].value.value
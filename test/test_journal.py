@@ -0,0 +1,95 @@
+"""Interrupts a run with the dummy engine after a number of requests and
+resumes it from its journal, which must not request the journaled
+documents again and must give the output of an uninterrupted run.
+
+Usage:
+    python -m pytest test/test_journal.py
+"""
+from helpers import checkout, read_tree, run_autodog
+
+from autodog.utils.journal import Journal
+
+# Logs the key of every request sent to the dummy engine, and fails the
+# requests after the first `limit` ones, as an exhausted quota would.
+ENGINE_SETUP = '''
+import threading
+from autodog.engine.dummy import DummyEngine
+from autodog.utils.journal import request_key
+
+_generate_doc = DummyEngine.generate_doc
+_lock = threading.Lock()
+_sent = []
+
+def generate_doc(self, code, lang, statement_kind, doc_format="", context=None):
+    with _lock:
+        if len(_sent) == {limit}:
+            raise RuntimeError("quota exhausted")
+        _sent.append(code)
+        with open({log!r}, "a") as f:
+            f.write(request_key(code, lang, statement_kind, doc_format, context) + "\\n")
+    return _generate_doc(self, code, lang, statement_kind, doc_format, context)
+
+DummyEngine.generate_doc = generate_doc
+'''
+
+
+def sent_keys(log) -> list:
+    if not log.exists():
+        return []
+    return log.read_text().split()
+
+
+def test_resume_after_interruption(tmp_path):
+    checkout(tmp_path)
+    full_log = tmp_path / "full.log"
+    run_autodog(
+        tmp_path, "src", "-r", "--engine", "dummy", "-j", "1",
+        setup=ENGINE_SETUP.format(limit=-1, log=str(full_log)),
+    )
+    expected = read_tree(tmp_path / "src")
+    n_requests = len(sent_keys(full_log))
+    # No journal file is written without --journal or --resume.
+    assert not (tmp_path / ".autodog-journal.jsonl").exists()
+
+    checkout(tmp_path)
+    first_log = tmp_path / "first.log"
+    interrupted = run_autodog(
+        tmp_path, "src", "-r", "--engine", "dummy", "-j", "1", "--resume",
+        setup=ENGINE_SETUP.format(limit=5, log=str(first_log)), check=False,
+    )
+    assert interrupted.returncode != 0
+    assert "quota exhausted" in interrupted.stderr
+    first = sent_keys(first_log)
+    assert len(first) == 5
+
+    second_log = tmp_path / "second.log"
+    run_autodog(
+        tmp_path, "src", "-r", "--engine", "dummy", "-j", "1", "--resume",
+        setup=ENGINE_SETUP.format(limit=-1, log=str(second_log)),
+    )
+    second = sent_keys(second_log)
+    assert not set(first) & set(second)
+    assert len(first) + len(second) == n_requests
+    assert read_tree(tmp_path / "src") == expected
+
+
+def test_journal_file_is_appended(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = Journal(path)
+    journal.record("a" * 64, "first")
+    journal.close()
+
+    journal = Journal(path)
+    assert len(journal) == 0
+    journal.record("b" * 64, "second")
+    journal.close()
+
+    journal = Journal(path, resume=True)
+    assert journal.get("a" * 64) == "first"
+    assert journal.get("b" * 64) == "second"
+    journal.close()
+
+    journal = Journal(path, resume=True, truncate=True)
+    assert len(journal) == 0
+    journal.close()
+
@@ -0,0 +1,85 @@
+"""Tests of `pipeline`, which overlaps the phases of the requests of a
+file in two threads: the error of a phase must reach the caller, and no
+thread may be left running however the iteration stops.
+
+Usage:
+    python -m pytest test/test_request.py
+"""
+import threading
+
+import pytest
+
+from autodog.engine.dummy import DummyEngine
+from autodog.engine.request import DocRequest, pipeline
+
+
+class FailingEngine(DummyEngine):
+    """Fails the request `fail_at` and after, and counts the requests it
+    was sent.
+    """
+
+    def __init__(self, fail_at:int=-1) -> None:
+        super().__init__()
+        self.fail_at = fail_at
+        self.n_sent = 0
+
+    def send(self, prompt:any) -> any:
+        self.n_sent += 1
+        if self.n_sent - 1 == self.fail_at:
+            raise RuntimeError("send failed")
+        return super().send(prompt)
+
+
+def requests(n:int, fail_at:int=-1):
+    for i in range(n):
+        if i == fail_at:
+            raise ValueError("prepare failed")
+        yield DocRequest(None, f"def f{i}(): pass", "python", "function", "")
+
+
+def pipeline_threads() -> list:
+    return [
+        thread for thread in threading.enumerate()
+        if thread is not threading.current_thread() and thread.is_alive() and thread.daemon
+    ]
+
+
+@pytest.fixture
+def no_thread_left():
+    before = set(pipeline_threads())
+    yield
+    assert set(pipeline_threads()) <= before
+
+
+def test_all_requests(no_thread_left):
+    engine = FailingEngine()
+    results = list(pipeline(requests(10), engine, depth=2))
+    assert [request.code for request, _ in results] == [f"def f{i}(): pass" for i in range(10)]
+    assert all(doc for _, doc in results)
+    assert engine.n_sent == 10
+
+
+def test_send_error_reaches_the_caller(no_thread_left):
+    engine = FailingEngine(fail_at=3)
+    received = []
+    with pytest.raises(RuntimeError, match="send failed"):
+        for request, _ in pipeline(requests(100), engine, depth=2):
+            received.append(request)
+    assert len(received) == 3
+    assert engine.n_sent == 4
+
+
+def test_prepare_error_reaches_the_caller(no_thread_left):
+    engine = FailingEngine()
+    with pytest.raises(ValueError, match="prepare failed"):
+        list(pipeline(requests(10, fail_at=5), engine, depth=2))
+    assert engine.n_sent == 5
+
+
+def test_caller_stops_early(no_thread_left):
+    engine = FailingEngine()
+    results = pipeline(requests(100), engine, depth=2)
+    next(results)
+    results.close()
+    # The requests sent ahead are bounded by the depth of the queues.
+    assert engine.n_sent <= 6
@@ -0,0 +1,184 @@
+"""Tests of the order, the fairness and the rate limits of the requests
+sent by `Scheduler`, with a fake engine and a fake clock.
+
+Usage:
+    python -m pytest test/test_scheduler.py
+"""
+import threading
+
+import pytest
+
+from autodog.engine.request import DocRequest
+from autodog.engine.scheduler import Scheduler
+from autodog.utils import ratelimit
+from autodog.utils.ratelimit import RateLimiter, TokenBucket
+
+
+class FakeClock:
+    """Stands for the `time` module of the rate limiters: sleeping advances
+    the time at once.
+    """
+
+    def __init__(self) -> None:
+        self.now = 100.0
+        self._lock = threading.Lock()
+
+    def monotonic(self) -> float:
+        with self._lock:
+            return self.now
+
+    def sleep(self, delay:float) -> None:
+        with self._lock:
+            self.now += delay
+
+
+class FakeEngine:
+    """Records the prompts sent to it, and the times they were sent, and
+    holds the requests until `release` is set.
+    """
+
+    def __init__(self, clock:FakeClock=None) -> None:
+        self.clock = clock
+        self.sent = []
+        self.release = threading.Event()
+        self.release.set()
+        self._lock = threading.Lock()
+
+    def send(self, prompt:str) -> str:
+        with self._lock:
+            self.sent.append((prompt, self.clock.monotonic() if self.clock else None))
+        assert self.release.wait(10)
+        return prompt.upper()
+
+
+def request(name:str, size:int=0, public:bool=True) -> DocRequest:
+    request = DocRequest(None, "x" * size, "python", "function", "", public=public)
+    request.prompt = name
+    return request
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    return clock
+
+
+def run(scheduler:Scheduler, engine:FakeEngine, requests:list) -> list:
+    """Submits the requests, each a file path and a request, while the
+    workers are held, so they are ranked together, and returns the prompts
+    in the order they were sent.
+    """
+    # The lock of the condition is reentrant, so the requests are submitted
+    # while the workers wait for it.
+    with scheduler._condition:
+        futures = [scheduler.submit(r, engine, filepath) for filepath, r in requests]
+    scheduler.close()
+    assert [future.result() for future in futures] == [r.prompt.upper() for _, r in requests]
+    return [prompt for prompt, _ in engine.sent]
+
+
+def test_fifo():
+    requests = [("a.py", request("a0")), ("b.py", request("b0")), ("a.py", request("a1"))]
+    assert run(Scheduler("fifo"), FakeEngine(), requests) == ["a0", "b0", "a1"]
+
+
+def test_largest_first():
+    requests = [
+        ("a.py", request("small", 10)), ("b.py", request("large", 1000)),
+        ("a.py", request("medium", 100)), ("b.py", request("medium2", 100)),
+    ]
+    assert run(Scheduler("largest"), FakeEngine(), requests) == ["large", "medium", "medium2", "small"]
+
+
+def test_public_first():
+    requests = [
+        ("a.py", request("private", public=False)), ("a.py", request("public")),
+        ("b.py", request("private2", public=False)), ("b.py", request("public2")),
+    ]
+    assert run(Scheduler("public"), FakeEngine(), requests) == [
+        "public", "public2", "private", "private2",
+    ]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        Scheduler("random")
+
+
+def test_a_file_does_not_take_all_the_workers():
+    engine = FakeEngine()
+    engine.release.clear()
+    scheduler = Scheduler("largest", workers=4)
+    with scheduler._condition:
+        futures = [scheduler.submit(request(f"a{n}", 1000 - n), engine, "a.py") for n in range(10)]
+        futures += [scheduler.submit(request(f"b{n}", n), engine, "b.py") for n in range(2)]
+    # The larger requests of a.py do not hold more than half of the workers
+    # while b.py is waiting.
+    for _ in range(100):
+        if len(engine.sent) == 4:
+            break
+        threading.Event().wait(0.01)
+    assert sorted(prompt for prompt, _ in engine.sent) == ["a0", "a1", "b0", "b1"]
+    engine.release.set()
+    scheduler.close()
+    assert all(future.done() for future in futures)
+    # With no other file waiting, a file takes all the workers.
+    assert len(engine.sent) == 12
+
+
+def test_cancelled_requests_are_not_sent():
+    engine = FakeEngine()
+    scheduler = Scheduler()
+    with scheduler._condition:
+        kept = scheduler.submit(request("kept"), engine, "a.py")
+        assert scheduler.submit(request("cancelled"), engine, "a.py").cancel()
+    scheduler.close()
+    assert kept.result() == "KEPT"
+    assert engine.sent == [("kept", None)]
+    with pytest.raises(RuntimeError):
+        scheduler.submit(request("late"), engine, "a.py")
+
+
+def test_requests_per_minute(clock):
+    engine = FakeEngine(clock)
+    requests = [("a.py", request(f"r{n}")) for n in range(62)]
+    run(Scheduler(rpm=60), engine, requests)
+    times = [t - 100.0 for _, t in engine.sent]
+    # A full bucket allows a burst of a minute of requests, and then a
+    # request a second.
+    assert times[:60] == [0.0] * 60
+    assert times[60:] == pytest.approx([1.0, 2.0])
+
+
+def test_tokens_per_minute(clock):
+    engine = FakeEngine(clock)
+    # The requests consume the tokens of their prompt, 100 characters
+    # or 25 tokens, and of their completion.
+    requests = [("a.py", request(f"r{n}", 100)) for n in range(6)]
+    run(Scheduler(tpm=1000, completion_tokens=225), engine, requests)
+    times = [t - 100.0 for _, t in engine.sent]
+    assert times == pytest.approx([0.0, 0.0, 0.0, 0.0, 15.0, 30.0])
+
+
+def test_token_bucket(clock):
+    bucket = TokenBucket(120)
+    assert [bucket.acquire() for _ in range(120)] == [0.0] * 120
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert bucket.acquire(2) == pytest.approx(1.0)
+    # The bucket refills while idle, up to the budget.
+    clock.sleep(3600)
+    assert bucket.acquire(120) == 0.0
+    # An amount larger than the budget waits for a full bucket.
+    assert bucket.acquire(500) == pytest.approx(60.0)
+    assert bucket.waited == pytest.approx(61.5)
+    assert TokenBucket(0).acquire(10 ** 6) == 0.0
+
+
+def test_rate_limiter(clock):
+    limiter = RateLimiter(0.5)
+    assert [limiter.wait() for _ in range(3)] == pytest.approx([0.0, 0.5, 0.5])
+    clock.sleep(10)
+    assert limiter.wait() == 0.0
+    assert limiter.waited == pytest.approx(1.0)
+    assert RateLimiter(0).wait() == 0.0
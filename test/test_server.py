@@ -0,0 +1,165 @@
+"""Tests of the documentation server: a client speaks JSON-RPC with
+`autodog serve` on its standard input and output, and the parsed trees
+kept by `DocServer` between requests are checked in process.
+
+Usage:
+    python -m pytest test/test_server.py
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from helpers import ROOT, SOURCE
+
+from autodog import server as server_module
+from autodog.core import doc_model, engine
+from autodog.server import (
+    INVALID_PARAMS, METHOD_NOT_FOUND, PARSE_ERROR, SERVER_ERROR, DocServer,
+)
+
+DUMMY = "This is a dummy document."
+
+
+class Client:
+    """Sends requests to `autodog serve` one at a time."""
+
+    def __init__(self, cwd) -> None:
+        self.process = subprocess.Popen(
+            [sys.executable, "-c", "from autodog.app import app\napp()", "serve", "--engine", "dummy"],
+            cwd=cwd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, env=dict(os.environ, PYTHONPATH=ROOT),
+        )
+        self.n = 0
+
+    def send(self, line:str) -> dict:
+        self.process.stdin.write(line + "\n")
+        self.process.stdin.flush()
+        return json.loads(self.process.stdout.readline())
+
+    def call(self, method:str, params) -> dict:
+        self.n += 1
+        response = self.send(json.dumps(
+            {"jsonrpc": "2.0", "id": self.n, "method": method, "params": params}
+        ))
+        assert response["jsonrpc"] == "2.0" and response["id"] == self.n
+        return response
+
+
+@pytest.fixture
+def client(tmp_path):
+    client = Client(tmp_path)
+    yield client
+    if client.process.poll() is None:
+        client.process.kill()
+    client.process.wait(timeout=20)
+
+
+def test_stdio_round_trip(tmp_path, client):
+    (tmp_path / "a.py").write_text(SOURCE.format(n=0))
+    (tmp_path / "b.py").write_text(SOURCE.format(n=1))
+
+    result = client.call("document_file", {"path": "a.py"})["result"]
+    assert result["path"] == str(tmp_path / "a.py")
+    assert result["modified"] and result["written"]
+    assert result["n_requests"] == 5
+    assert (tmp_path / "a.py").read_text().count(DUMMY) == 5
+
+    # The lines 10 and 11 are in `increment`, which is the same as in a.py,
+    # so its document is taken from the journal.
+    result = client.call("document_range", [str(tmp_path / "b.py"), 10, 11])["result"]
+    assert result["n_requests"] == 0 and result["n_hits"] == 1
+    documented = (tmp_path / "b.py").read_text()
+    assert documented.count(DUMMY) == 1
+    assert f'def increment(self, step=1):\n        """{DUMMY}' in documented
+
+    # A buffer is documented without writing the file, and the requests
+    # already answered are taken from the journal.
+    result = client.call("document_file", {"path": "c.py", "source": SOURCE.format(n=0)})["result"]
+    assert not result["written"] and result["text"].count(DUMMY) == 5
+    assert result["n_requests"] == 0 and result["n_hits"] == 5
+    assert not (tmp_path / "c.py").exists()
+
+    assert client.call("shutdown", [])["result"] is None
+    assert client.process.wait(timeout=20) == 0
+
+
+def test_stdio_errors(tmp_path, client):
+    (tmp_path / "a.py").write_text(SOURCE.format(n=0))
+
+    error = client.call("document_file", {"path": "a.py", "source": "def g(:\n"})["error"]
+    assert error["code"] == INVALID_PARAMS and "Cannot parse" in error["message"]
+    error = client.call("document_file", {"path": "missing.py"})["error"]
+    assert error["code"] == INVALID_PARAMS and "Cannot read" in error["message"]
+    error = client.call("document_range", {"path": "a.py", "first": 3, "last": 1})["error"]
+    assert error["code"] == INVALID_PARAMS
+    error = client.call("document_file", {"path": "a.py", "recursive": True})["error"]
+    assert error["code"] == INVALID_PARAMS and "recursive" in error["message"]
+    error = client.call("document_node", ["a.py"])["error"]
+    assert error["code"] == INVALID_PARAMS and "line" in error["message"]
+    error = client.call("document_file", "a.py")["error"]
+    assert error["code"] == INVALID_PARAMS
+    error = client.call("document_everything", {"path": "a.py"})["error"]
+    assert error["code"] == METHOD_NOT_FOUND
+    response = client.send("{not json")
+    assert response["id"] is None and response["error"]["code"] == PARSE_ERROR
+    # The file was not touched by the failed requests.
+    assert (tmp_path / "a.py").read_text() == SOURCE.format(n=0)
+
+    # A notification has no response, so the next response is the shutdown.
+    client.process.stdin.write(json.dumps(
+        {"jsonrpc": "2.0", "method": "document_file", "params": {"path": "a.py"}}
+    ) + "\n")
+    assert client.call("shutdown", {})["result"] is None
+    assert client.process.wait(timeout=20) == 0
+    assert client.process.stdout.read() == ""
+
+
+@pytest.fixture
+def server():
+    server = DocServer(engine(name="dummy"), doc_model())
+    yield server
+    server.close()
+
+
+def test_error_of_a_method_is_not_an_invalid_params(tmp_path, server, monkeypatch):
+    def insert_docs(*args, **kwargs):
+        raise TypeError("a bug")
+
+    (tmp_path / "a.py").write_text(SOURCE.format(n=0))
+    from autodog.code.python import PyCode
+    monkeypatch.setattr(PyCode, "insert_docs", insert_docs)
+    response = server.handle({"id": 1, "method": "document_file", "params": [str(tmp_path / "a.py")]})
+    assert response["error"]["code"] == SERVER_ERROR
+    assert response["error"]["message"] == "TypeError: a bug"
+
+
+def test_written_tree_is_kept(tmp_path, server, monkeypatch):
+    path = str(tmp_path / "a.py")
+    (tmp_path / "a.py").write_text(SOURCE.format(n=0))
+    assert server.document_file(path)["written"]
+    stamp, kept = server._trees[path]
+    assert stamp == server_module._stamp(path)
+    assert kept.to_str() == (tmp_path / "a.py").read_text()
+
+    # The next request on the file does not read it again, and the lines
+    # of the kept tree are those of the written file.
+    def code(*args, **kwargs):
+        raise AssertionError("the file is parsed again")
+
+    monkeypatch.setattr(server_module, "code", code)
+    lines = (tmp_path / "a.py").read_text().splitlines()
+    line = next(n for n, text in enumerate(lines, 1) if "def increment" in text) + 3
+    assert [node.name for node in kept.touched_nodes([(line, line)])] == ["increment"]
+    result = server.document_node(path, line, overwrite=True, write=False)
+    assert result["n_requests"] == 1
+    assert result["text"].count(DUMMY) == 5
+
+    # A file modified by someone else is read again.
+    monkeypatch.undo()
+    (tmp_path / "a.py").write_text((tmp_path / "a.py").read_text() + "\n\ndef h():\n    pass\n")
+    result = server.document_file(path)
+    assert result["n_requests"] == 1
+    assert server._trees[path][0] == server_module._stamp(path)
@@ -0,0 +1,51 @@
+"""Runs the shards of a backfill with the dummy engine, merges their
+journals and resumes from the combined journal on a fresh checkout, which
+must insert the documentation of all the shards without any request.
+
+Usage:
+    python -m pytest test/test_shard.py
+"""
+import json
+
+import pytest
+
+from helpers import checkout, read_tree, run_autodog
+
+
+def autodog(cwd, *args):
+    return run_autodog(cwd, *args).stdout
+
+
+@pytest.mark.parametrize("shard_by", ["file", "node"])
+def test_resume_from_merged_shards(tmp_path, shard_by):
+    checkout(tmp_path)
+    autodog(tmp_path, "src", "-r", "--engine", "dummy", "--journal", "full.jsonl")
+    expected = read_tree(tmp_path / "src")
+
+    journals = []
+    for i in (1, 2):
+        checkout(tmp_path)
+        journals.append(f"j{i}.jsonl")
+        autodog(
+            tmp_path, "src", "-r", "--engine", "dummy", "--journal", journals[-1],
+            "--shard", f"{i}/2", "--shard-by", shard_by, "--report", f"r{i}.json",
+        )
+        with open(tmp_path / f"r{i}.json", encoding="utf-8") as f:
+            statuses = json.load(f)["summary"]["statuses"]
+        assert set(statuses) <= {"documented"}, statuses
+    autodog(tmp_path, "merge", "journal", "merged.jsonl", *journals)
+    with open(tmp_path / "merged.jsonl", encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    assert entries and all("key" in entry for entry in entries)
+
+    checkout(tmp_path)
+    out = autodog(
+        tmp_path, "src", "-r", "--engine", "dummy", "--journal", "merged.jsonl", "--resume",
+        "--report", "resumed.json",
+    )
+    assert "Skip documented" not in out
+    with open(tmp_path / "resumed.json", encoding="utf-8") as f:
+        summary = json.load(f)["summary"]
+    assert summary["n_requests"] == 0
+    assert summary["n_hits"] > 0
+    assert read_tree(tmp_path / "src") == expected
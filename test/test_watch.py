@@ -0,0 +1,56 @@
+"""Tests of the watch mode: the daemon is run with the dummy engine and
+the files it watches are saved as an editor would.
+
+Usage:
+    python -m pytest test/test_watch.py
+"""
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from helpers import ROOT
+
+
+def wait_for(condition, timeout:float=20) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_watch_survives_a_bad_save(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    module = src / "m.py"
+    module.write_text("def f(x):\n    return x\n")
+    out, err = tmp_path / "out.log", tmp_path / "err.log"
+    with open(out, "w") as stdout, open(err, "w") as stderr:
+        daemon = subprocess.Popen(
+            [sys.executable, "-c", "from autodog.app import app\napp()",
+             "src", "-r", "--watch", "--engine", "dummy", "--debounce", "0.1"],
+            cwd=tmp_path, stdout=stdout, stderr=stderr,
+            env=dict(os.environ, PYTHONPATH=ROOT, PYTHONUNBUFFERED="1"),
+        )
+    try:
+        assert wait_for(lambda: "Watching 1 files" in out.read_text())
+        module.write_text("def f(x):\n    return x\n\ndef g(:\n")
+        assert wait_for(lambda: "Failed to document" in err.read_text()), err.read_text()
+        assert "SyntaxError" in err.read_text()
+        assert daemon.poll() is None
+
+        module.write_text("def f(x):\n    return x\n\ndef g(y):\n    return y\n")
+        assert wait_for(lambda: "dummy document" in module.read_text()), err.read_text()
+        documented = module.read_text()
+        # The next change is compared with the last documented version, so
+        # `g`, added by the failed save, is documented too.
+        assert documented.count("This is a dummy document.") == 1
+        assert "def g(y):\n    \"\"\"This is a dummy document." in documented
+        assert daemon.poll() is None
+    finally:
+        daemon.send_signal(signal.SIGINT)
+        daemon.wait(timeout=20)
+    assert "Stop watching." in out.read_text()